@@ -141,6 +141,12 @@ def init_canadapter():
                                    help="Set throttling time (max update rate) for incoming frames, in milliseconds. " +
                                    "Is automatically setting the '-bcm' option. " +
                                    "Defaults to not throttle incoming frame rate.")
+    commandlineparser.add_argument('-workers',
+                                   default=0,
+                                   type=int,
+                                   help="Number of worker threads for sending CAN frames on incoming MQTT commands. " +
+                                   "Commands on the same topic are sent in order. " +
+                                   "Defaults to %(default)s (send in the MQTT network thread).")
     commandlineparser.add_argument('-ego',
                                    nargs='+',
                                    default=["1"],
@@ -208,6 +214,9 @@ def init_canadapter():
     resource.keepalive = commandline.keepalive
     resource.qos = commandline.qos
     resource.userdata = (canbus, converter)
+    if commandline.workers > 0:
+        resource.callback_executor = 'thread'
+        resource.callback_workers = commandline.workers
 
             # Register incoming MQTT commands
     for args in converter.get_definitions_incoming_mqtt_command():
@@ -243,9 +252,8 @@ def loop_canadapter(resource):
     except Exception as err:
         logging.error("Failed to convert incoming CAN frame. Error: {}".format(err))
         return
-    for mqtt_signal_name, payload_mqtt_data in messages:
-        logging.debug("Sending MQTT message. Signal name: '{}' Value: '{}'".format(mqtt_signal_name, payload_mqtt_data))
-        resource.send_data(mqtt_signal_name, payload_mqtt_data)
+    logging.debug("Sending MQTT messages: {}".format(messages))
+    resource.send_data_many(messages)
 
 
 ###############
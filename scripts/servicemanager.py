@@ -31,7 +31,6 @@ import collections
 import logging
 import signal
 import sys
-import types
 
 assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
 
@@ -108,11 +107,18 @@ def main():
     logging.info("  ***** Starting servicemanager *****")
 
     manager = sgframework.framework.BaseFramework(CLIENT_NAME, commandline.host, commandline.port, commandline.cert)
-    manager._on_incoming_message = types.MethodType(on_incoming_message, manager)
-    manager._subscribe_to_inputsignals = types.MethodType(subscribe_to_inputsignals, manager)
     manager.keepalive = MQTT_KEEPALIVE_TIME
     manager.qos = commandline.qos
     manager.userdata = storage
+    manager.register_incoming_availability(constants.PREFIX_RESOURCEAVAILABLE,
+                                           constants.SUFFIX_WILDCARD_SINGLELEVEL,
+                                           constants.SUFFIX_PRESENCE,
+                                           on_resource_availability)
+    for prefix in [constants.PREFIX_COMMANDAVAILABLE, constants.PREFIX_DATAAVAILABLE]:
+        manager.register_incoming_availability(prefix,
+                                               constants.SUFFIX_WILDCARD_SINGLELEVEL,
+                                               constants.SUFFIX_WILDCARD_SINGLELEVEL,
+                                               on_signal_availability)
 
     manager.start()
 
@@ -120,103 +126,75 @@ def main():
         manager.loop()
 
 
-def on_incoming_message(self, mqttclient, userdata, message):
-    """MQTT callback at incoming messages.
+###############
+## Callbacks ##
+###############
 
-    Method signature according to Paho documentation.
+def on_resource_availability(manager, messagetype, servicename, signalname, payload):
+    """Callback for incoming resource presence information.
 
-    """
-    storage = userdata
-
-    ## Extract information from the message ##
-    inputpayload = str(message.payload, encoding='latin1').strip()  # Paho MQTT delivers bytes for Python3
-    inputtopic = str(message.topic).strip()
-
-    topic_hierarchy = inputtopic.split(constants.MQTT_TOPIC_SEPARATOR)
-    if len(topic_hierarchy) != constants.MQTT_TOPIC_DEPTH:
-        self.logger.warning("Received wrong MQTT topic structure: {}, payload: '{}'".format(inputtopic, inputpayload))
-        return
+    When a resource goes offline, its commands and data are announced as unavailable.
 
-    self.logger.debug("Received message. Topic: {}, payload: '{}'".format(inputtopic, inputpayload))
+    For callback interface, see sgframework.BaseFramework() documentation.
 
-    messagetype, servicename, signalname = topic_hierarchy
-    messagetype = messagetype.strip()
-    servicename = servicename.strip()
-    signalname = signalname.strip()
+    """
+    storage = manager.userdata
 
     # Available resource
-    if messagetype == constants.PREFIX_RESOURCEAVAILABLE \
-            and signalname == constants.SUFFIX_PRESENCE \
-            and inputpayload == constants.PAYLOAD_TRUE:
-        storage['available_resources'].update([servicename])
-        self.logger.info("Available resource: {}".format(servicename))
-
-    # Available data and commands
-    elif messagetype == constants.PREFIX_COMMANDAVAILABLE and inputpayload == constants.PAYLOAD_TRUE:
-        self.logger.info("Available command: '{}' for resource '{}'".format(signalname, servicename))
-        storage['available_resources'].update([servicename])
-        storage['available_commands'][servicename].update([signalname])
-    elif messagetype == constants.PREFIX_DATAAVAILABLE and inputpayload == constants.PAYLOAD_TRUE:
-        self.logger.info("Available data: '{}' for resource '{}'".format(signalname, servicename))
+    if payload == constants.PAYLOAD_TRUE:
         storage['available_resources'].update([servicename])
-        storage['available_data'][servicename].update([signalname])
+        manager.logger.info("Available resource: {}".format(servicename))
 
     # Resource now offline
-    elif messagetype == constants.PREFIX_RESOURCEAVAILABLE \
-            and signalname == constants.SUFFIX_PRESENCE \
-            and inputpayload == constants.PAYLOAD_FALSE:
+    elif payload == constants.PAYLOAD_FALSE:
         if servicename in storage['available_resources']:
-            self.logger.info("Resource now offline: '{}'".format(servicename))
+            manager.logger.info("Resource now offline: '{}'".format(servicename))
 
-            if servicename in storage['available_commands']:
-                for commandname in storage['available_commands'][servicename]:
-                    topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_COMMANDAVAILABLE,
-                                                                 servicename,
-                                                                 commandname)
-                    self.logger.info("Sending out command unavailable: '{}' for resource '{}'".format(
-                            commandname, servicename))
-                    mqttclient.publish(topic,
-                                       constants.PAYLOAD_FALSE,
-                                       qos=self.qos,
-                                       retain=True)
-
-            if servicename in storage['available_data']:
-                for dataname in storage['available_data'][servicename]:
-                    topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_DATAAVAILABLE,
+            for prefix, storagename in [(constants.PREFIX_COMMANDAVAILABLE, 'available_commands'),
+                                        (constants.PREFIX_DATAAVAILABLE, 'available_data')]:
+                for unavailable_signalname in storage[storagename].get(servicename, []):
+                    topic = constants.MQTT_TOPIC_TEMPLATE.format(prefix,
                                                                  servicename,
-                                                                 dataname)
-                    self.logger.info("Sending out data unavailable: '{}' for resource '{}'".format(
-                            dataname, servicename))
-                    mqttclient.publish(topic,
-                                       constants.PAYLOAD_FALSE,
-                                       qos=self.qos,
-                                       retain=True)
+                                                                 unavailable_signalname)
+                    manager.logger.info("Sending out unavailable: '{}' for resource '{}'".format(
+                            topic, servicename))
+                    manager._publish(topic, constants.PAYLOAD_FALSE, manager.qos, True, force=True)
 
             storage['available_resources'] -= set([servicename])
             storage['available_data'].pop(servicename, None)
             storage['available_commands'].pop(servicename, None)
         else:
-            self.logger.warning("Message about offline resource, but it was not listed before. " +
-                                "Topic: '{}' Payload: '{}'".format(inputtopic, inputpayload))
+            manager.logger.warning("Message about offline resource, but it was not listed before. " +
+                                   "Servicename: '{}' Payload: '{}'".format(servicename, payload))
+    else:
+        manager.logger.warning("Wrong message structure. Servicename: '{}' Payload: '{}'".format(servicename, payload))
+
+
+def on_signal_availability(manager, messagetype, servicename, signalname, payload):
+    """Callback for incoming command and data availability information.
+
+    For callback interface, see sgframework.BaseFramework() documentation.
+
+    """
+    storage = manager.userdata
+
+    # Available data and commands
+    if messagetype == constants.PREFIX_COMMANDAVAILABLE and payload == constants.PAYLOAD_TRUE:
+        manager.logger.info("Available command: '{}' for resource '{}'".format(signalname, servicename))
+        storage['available_resources'].update([servicename])
+        storage['available_commands'][servicename].update([signalname])
+    elif messagetype == constants.PREFIX_DATAAVAILABLE and payload == constants.PAYLOAD_TRUE:
+        manager.logger.info("Available data: '{}' for resource '{}'".format(signalname, servicename))
+        storage['available_resources'].update([servicename])
+        storage['available_data'][servicename].update([signalname])
 
     # Messages not to handle
-    elif messagetype in [constants.PREFIX_DATAAVAILABLE, constants.PREFIX_COMMANDAVAILABLE] \
-            and inputpayload == constants.PAYLOAD_FALSE:
-        self.logger.debug("Unavailability message for data or command. Probably old from broker. " +
-                          "Topic: '{}' Payload: '{}'".format(inputtopic, inputpayload))
+    elif payload == constants.PAYLOAD_FALSE:
+        manager.logger.debug("Unavailability message for data or command. Probably old from broker. " +
+                             "Servicename: '{}' Signalname: '{}'".format(servicename, signalname))
     else:
-        self.logger.warning("Wrong message structure. Topic: '{}' Payload: '{}'".format(inputtopic, inputpayload))
-
-
-def subscribe_to_inputsignals(self):
-    """Override the _subscribe_to_inputsignals method in sgframework.framework.BaseFramework"""
-    for prefix in [constants.PREFIX_RESOURCEAVAILABLE,
-                   constants.PREFIX_COMMANDAVAILABLE,
-                   constants.PREFIX_DATAAVAILABLE]:
-        self.mqttclient.subscribe(prefix +
-                                  constants.MQTT_TOPIC_SEPARATOR +
-                                  constants.SUFFIX_WILDCARD_MULTILEVEL,
-                                  qos=self.qos)
+        manager.logger.warning("Wrong message structure. Messagetype: '{}' Servicename: '{}' Payload: '{}'".format(
+            messagetype, servicename, payload))
 
 if __name__ == '__main__':
     main()
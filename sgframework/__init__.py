@@ -35,4 +35,7 @@ import sys
 assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
 
 from .framework import App, Resource
+from .multiprocessresource import MultiprocessResource
+if sys.version_info >= (3, 5, 0):
+    from .asyncframework import AsyncApp, AsyncResource
 from .version import __version__
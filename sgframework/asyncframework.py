@@ -0,0 +1,411 @@
+#
+# asyncio versions of the "App" and "Resource" frameworks for the Secure Gateway.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import asyncio
+import inspect
+import sys
+import threading
+import time
+
+assert sys.version_info >= (3, 5, 0), "Python version 3.5 or later required for the asyncio frameworks!"
+
+from . import constants
+from .exceptions import PublishQueueFullException
+from .framework import App, Resource
+from .lastvaluecache import LastValueCache
+from .publishqueue import ConflationBuffer
+
+
+class _AsyncioNetworking:
+    """Runs the MQTT networking in an asyncio event loop, instead of in a separate
+    thread or via the ``loop()`` method. For use together with :class:`.App` or :class:`.Resource`.
+
+    The MQTT socket is watched by the event loop, and a background task
+    handles keepalive messages and reconnection. The reconnection attempts (with
+    DNS lookup and TCP connect) run in the default executor of the event loop, so they
+    do not block other coroutines.
+
+    Callbacks can be ordinary functions or coroutine functions (``async def``).
+    For coroutine functions, the echo (if configured) is published when the coroutine is finished.
+
+    Requires Paho 1.5 or later (for the external event loop support).
+
+    """
+
+    def __init__(self, name, host, port=1883, certificate_directory=None):
+        super().__init__(name, host, port, certificate_directory)
+        self._asyncio_loop = None
+        self._asyncio_thread_id = None
+        self._maintenance_task = None
+        self._ready_event = None
+        self._publishqueue_room_event = None
+
+    async def start(self, use_clean_session=True, wait=True, timeout=constants.DEFAULT_START_TIMEOUT):
+        """Connect to the broker.
+
+        Args:
+            use_clean_session (bool): Connect to broker using a clean session.
+            wait (bool): Return when connected to the broker, and the subscriptions and
+                the capability publications have been acknowledged. Otherwise return directly.
+            timeout (numerical): Max waiting time in seconds, when *wait* is True.
+
+        Raises:
+            asyncio.TimeoutError: If not ready within the timeout.
+            ValueError: If using a connection pool (``connection_pool_size`` above 1), which is not supported.
+
+        Must be called from a coroutine running in the event loop that
+        should handle the networking.
+
+        """
+        if self.connection_pool_size != 1:
+            raise ValueError("A connection pool is not supported with asyncio networking.")
+        self._use_threaded_networking = False
+        self._use_clean_session = use_clean_session
+
+        if self.mqttclient is not None:
+            await self.stop()
+
+        self._asyncio_loop = asyncio.get_event_loop()
+        self._asyncio_thread_id = threading.get_ident()
+        self._ready_event = asyncio.Event()
+        self._publishqueue_room_event = asyncio.Event()
+
+        self._lastvaluecache = LastValueCache() if self.use_lastvaluecache else None
+        self._create_mqttclient()
+        self.mqttclient.on_socket_open = self._on_socket_open
+        self.mqttclient.on_socket_close = self._on_socket_close
+        self.mqttclient.on_socket_register_write = self._on_socket_register_write
+        self.mqttclient.on_socket_unregister_write = self._on_socket_unregister_write
+        self._connect_async()
+        self._maintenance_task = self._asyncio_loop.create_task(self._maintain_connection())
+
+        if wait:
+            await asyncio.wait_for(self._ready_event.wait(), timeout)
+
+    async def stop(self, timeout=constants.DEFAULT_STOP_TIMEOUT):
+        """Disconnect from the broker.
+
+        Args:
+            timeout (numerical): Max time in seconds to wait for outgoing messages to be confirmed.
+
+        Waits until all queued messages have been handed over and confirmed (or the timeout),
+        instead of sleeping a fixed time.
+
+        """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before stop().")
+        self.logger.info('Disconnecting from the MQTT broker. Host: {}, Port: {}'.format(self.host, self.port))
+        self._cancel_requests()
+        if self._use_last_will:
+            self._publish(self._servicepresence_topic, constants.PAYLOAD_FALSE, 1, True, force=True)
+        self._flush_publishqueue(ignore_inflight_limit=True)
+
+        deadline = self._asyncio_loop.time() + timeout
+        while self._broker_connected and self._asyncio_loop.time() < deadline:
+            statistics = self._publishqueue.get_statistics()
+            if not statistics['depth'] and not statistics['inflight']:
+                break
+            await asyncio.sleep(constants.ASYNC_POLL_INTERVAL)
+
+        self._maintenance_task.cancel()
+        self.mqttclient.disconnect()
+        while self.mqttclient.socket() is not None and self._asyncio_loop.time() < deadline:
+            await asyncio.sleep(constants.ASYNC_POLL_INTERVAL)
+        self._set_broker_connectionstatus(False)
+
+    def loop(self):
+        """Not used for the asyncio frameworks. The networking is handled by the event loop."""
+        self.logger.warning("You should not use the loop() method when running asyncio networking.")
+
+    async def send_command(self, servicename, signalname, value, send_command_as_retained=False, codec=None):
+        """Send a command. Waits for room in the publish queue (for the 'block' policy).
+
+        For details, see :meth:`.BaseFramework.send_command`.
+
+        """
+        await self._wait_for_publishqueue_room(1)
+        super().send_command(servicename, signalname, value, send_command_as_retained, codec)
+
+    async def send_command_many(self, servicename, commands, send_command_as_retained=False, codec=None):
+        """Send several commands to a service. Waits for room in the publish queue (for the 'block' policy).
+
+        For details, see :meth:`.BaseFramework.send_command_many`.
+
+        """
+        if hasattr(commands, 'items'):
+            commands = commands.items()
+        commands = list(commands)
+        await self._wait_for_publishqueue_room(len(commands))
+        super().send_command_many(servicename, commands, send_command_as_retained, codec)
+
+    async def request(self, servicename, signalname, value, timeout=constants.DEFAULT_REQUEST_TIMEOUT, codec=None):
+        """Send a command, and wait for the echo from the resource.
+
+        Waits for room in the publish queue (for the 'block' policy).
+
+        Returns:
+            The echo payload (the decoded value if using a codec).
+
+        Raises:
+            RequestTimeoutException: If no echo is received within the timeout.
+
+        For details, see :meth:`.BaseFramework.request`.
+
+        """
+        await self._wait_for_publishqueue_room(1)
+        future = super().request(servicename, signalname, value, timeout, codec)
+        self._asyncio_loop.call_later(timeout, self._expire_requests)
+        return await asyncio.wrap_future(future)
+
+    async def _wait_for_publishqueue_room(self, number_of_messages):
+        """Wait until there is room in the publish queue, when using the 'block' policy.
+
+        Args:
+            number_of_messages (int): Number of messages to be queued.
+
+        Raises:
+            PublishQueueFullException: At timeout (``publishqueue_timeout``).
+
+        """
+        if self.publishqueue_policy != constants.PUBLISHQUEUE_POLICY_BLOCK or self._publishqueue_room_event is None:
+            return
+        required_room = min(number_of_messages, self._publishqueue.maxsize)
+        while self._publishqueue.maxsize - len(self._publishqueue) < required_room:
+            self._publishqueue_room_event.clear()
+            try:
+                await asyncio.wait_for(self._publishqueue_room_event.wait(), self.publishqueue_timeout)
+            except asyncio.TimeoutError:
+                raise PublishQueueFullException(
+                    "Timeout when waiting for room in the publish queue ({} messages).".format(
+                        self._publishqueue.maxsize))
+
+    def _publish_many(self, messages, force=False):
+        """Put outgoing MQTT messages in the publish queue. Never blocks the event loop.
+
+        For details, see :meth:`.BaseFramework._publish_many`.
+
+        """
+        if self._store_offline(messages, force):
+            return
+        self._publishqueue.put_many(messages, force=force, wait=None, timeout=0)
+        self._flush_publishqueue()
+
+    def _run_callback(self, inputsignalinformation, inputtopic,
+                      messagetype, servicename, signalname, inputpayload):
+        """Run the registered callback. Coroutines are scheduled as tasks in the event loop.
+
+        For details, see :meth:`.BaseFramework._run_callback`.
+
+        """
+        arguments = self._get_callback_arguments(self, inputsignalinformation, inputtopic,
+                                                 messagetype, servicename, signalname, inputpayload)
+        starttime = time.monotonic()
+        try:
+            returnvalue = inputsignalinformation.callback(*arguments)
+        except Exception as err:
+            self._metrics.add_callback(time.monotonic() - starttime, failed=True)
+            self.logger.warning("Failed to run callback for topic: {}, payload: {}. Error: '{}'".format(
+                                inputtopic, inputpayload, err))
+            return
+
+        if inspect.isawaitable(returnvalue):
+            self._asyncio_loop.create_task(self._finish_callback(returnvalue, inputsignalinformation, inputtopic,
+                                                                 messagetype, servicename, signalname,
+                                                                 inputpayload))
+            return
+        self._metrics.add_callback(time.monotonic() - starttime)
+        self._send_echo(inputsignalinformation, messagetype, servicename, signalname, inputpayload, returnvalue)
+
+    async def _finish_callback(self, awaitable, inputsignalinformation, inputtopic,
+                               messagetype, servicename, signalname, inputpayload):
+        """Await a coroutine callback, and publish the echo (if configured).
+
+        The recorded callback time is from the start of the awaiting until the coroutine is finished.
+
+        """
+        starttime = time.monotonic()
+        try:
+            returnvalue = await awaitable
+        except Exception as err:
+            self._metrics.add_callback(time.monotonic() - starttime, failed=True)
+            self.logger.warning("Failed to run callback for topic: {}, payload: {}. Error: '{}'".format(
+                                inputtopic, inputpayload, err))
+            return
+        self._metrics.add_callback(time.monotonic() - starttime)
+        self._send_echo(inputsignalinformation, messagetype, servicename, signalname, inputpayload, returnvalue)
+
+    async def _maintain_connection(self):
+        """Background task for keepalive messages, reconnection and publishing statistics."""
+        while True:
+            if self.mqttclient.socket() is None:
+                if time.monotonic() >= self._next_reconnect_time:
+                    await self._reconnect_in_executor()
+            else:
+                self.mqttclient.loop_misc()
+                self._publish_statistics_if_due()
+            self._expire_requests()
+            await asyncio.sleep(constants.ASYNC_MISC_INTERVAL)
+
+    async def _reconnect_in_executor(self):
+        """Make one attempt to reconnect to the broker, in the default executor. See :meth:`._reconnect`."""
+        self._record_connection_attempt()
+        try:
+            await self._asyncio_loop.run_in_executor(None, self.mqttclient.reconnect)
+        except Exception as err:
+            self._on_reconnect_failure(err)
+
+    def _call_in_event_loop(self, function, *args):
+        """Call a function directly in the event loop thread, otherwise schedule it in the event loop.
+
+        The socket callbacks from Paho are called in the executor during reconnection.
+
+        """
+        if threading.get_ident() == self._asyncio_thread_id:
+            function(*args)
+        else:
+            self._asyncio_loop.call_soon_threadsafe(function, *args)
+
+    ## Callbacks ##
+
+    def _notify_acknowledgements(self):
+        """Notify :meth:`.start` when connected, and all subscriptions and publications are acknowledged."""
+        if self._is_ready():
+            self._ready_event.set()
+
+    def _on_disconnect(self, mqttclient, userdata, rc, properties=None):
+        """MQTT callback at disconnect."""
+        super()._on_disconnect(mqttclient, userdata, rc, properties)
+        self._ready_event.clear()
+
+    def _on_publish(self, mqttclient, userdata, mid):
+        """MQTT callback at publication confirmation. Also notifies waiting senders."""
+        super()._on_publish(mqttclient, userdata, mid)
+        self._publishqueue_room_event.set()
+
+    def _on_socket_open(self, mqttclient, userdata, sock):
+        """MQTT callback when the socket is opened. Lets the event loop watch the socket."""
+        self._call_in_event_loop(self._asyncio_loop.add_reader, sock, mqttclient.loop_read)
+
+    def _on_socket_close(self, mqttclient, userdata, sock):
+        """MQTT callback when the socket is closed."""
+        self._call_in_event_loop(self._asyncio_loop.remove_reader, sock)
+        self._call_in_event_loop(self._asyncio_loop.remove_writer, sock)
+
+    def _on_socket_register_write(self, mqttclient, userdata, sock):
+        """MQTT callback when there is outgoing data to write."""
+        self._call_in_event_loop(self._asyncio_loop.add_writer, sock, mqttclient.loop_write)
+
+    def _on_socket_unregister_write(self, mqttclient, userdata, sock):
+        """MQTT callback when all outgoing data is written."""
+        self._call_in_event_loop(self._asyncio_loop.remove_writer, sock)
+
+
+class AsyncApp(_AsyncioNetworking, App):
+    __doc__ = """App framework for the Secure Gateway, using an asyncio event loop for the networking.
+
+    The methods :meth:`.start`, :meth:`.stop`, :meth:`.send_command` and
+    :meth:`.send_command_many` are coroutines.
+
+    """ + str(_AsyncioNetworking.__doc__) + str(App.__doc__)
+
+    def __repr__(self):
+        return "SG AsyncApp: '{}', connecting to host '{}', port {}. Has {} input signals registered.".format(
+            self.name, self.host, self.port, len(self._inputsignal_infodict))
+
+
+class AsyncResource(_AsyncioNetworking, Resource):
+    __doc__ = """Resource framework for the Secure Gateway, using an asyncio event loop for the networking.
+
+    The methods :meth:`.start`, :meth:`.stop`, :meth:`.send_data`, :meth:`.send_data_many`,
+    :meth:`.send_command` and :meth:`.send_command_many` are coroutines.
+
+    """ + str(_AsyncioNetworking.__doc__) + str(Resource.__doc__)
+
+    def __init__(self, name, host, port=1883, certificate_directory=None):
+        super().__init__(name, host, port, certificate_directory)
+        self._conflation_task = None
+
+    def __repr__(self):
+        return "SG AsyncResource: '{}', connecting to host '{}', port {}. Has {} incoming and {} outgoing topics registered.".format(
+            self.name, self.host, self.port, len(self._inputsignal_infodict), len(self._outputsignal_infodict))
+
+    async def start(self, use_clean_session=True, wait=True, timeout=constants.DEFAULT_START_TIMEOUT):
+        """Connect to the broker. Also starts the flushing of the conflation buffer, if using ``use_conflation``.
+
+        For details, see :meth:`._AsyncioNetworking.start`.
+
+        """
+        await super().start(use_clean_session, wait, timeout)
+        self._conflationbuffer = ConflationBuffer()
+        if self.use_conflation:
+            self._conflation_task = self._asyncio_loop.create_task(self._run_conflation_task())
+            self._is_conflating = True
+
+    async def stop(self, timeout=constants.DEFAULT_STOP_TIMEOUT):
+        """Disconnect from the broker. Pending values in the conflation buffer are published before disconnecting.
+
+        For details, see :meth:`._AsyncioNetworking.stop`.
+
+        """
+        self._is_conflating = False
+        if self._conflation_task is not None:
+            self._conflation_task.cancel()
+            self._conflation_task = None
+        if self.mqttclient is not None:
+            self._flush_conflationbuffer(force=True)
+        await super().stop(timeout)
+
+    async def _run_conflation_task(self):
+        """Flush the conflation buffer periodically."""
+        while True:
+            await asyncio.sleep(self.conflation_interval)
+            try:
+                self._flush_conflationbuffer()
+            except Exception as err:
+                self.logger.warning("Failed to publish values from the conflation buffer. Error: '{}'".format(err))
+
+    async def send_data(self, signalname, value):
+        """Send data on a pre-registered topic. Waits for room in the publish queue (for the 'block' policy).
+
+        For details, see :meth:`.Resource.send_data`.
+
+        """
+        await self._wait_for_publishqueue_room(1)
+        super().send_data(signalname, value)
+
+    async def send_data_many(self, signals):
+        """Send data on several pre-registered topics. Waits for room in the publish queue (for the 'block' policy).
+
+        For details, see :meth:`.Resource.send_data_many`.
+
+        """
+        if hasattr(signals, 'items'):
+            signals = signals.items()
+        signals = list(signals)
+        await self._wait_for_publishqueue_room(len(signals))
+        super().send_data_many(signals)
@@ -0,0 +1,244 @@
+#
+# Executor for running callbacks outside the network thread, for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from . import constants
+from .exceptions import CallbackQueueFullException
+
+
+Callbacktask = collections.namedtuple('Callbacktask', ['statisticskey', 'function', 'args', 'on_finished', 'queued_at'])
+
+
+class CallbackExecutor:
+    """Runs callbacks in a pool of worker threads or worker processes.
+
+    Callbacks with the same ordering key (typically the incoming topic) are run
+    one at a time, in the order they were submitted. Callbacks with different
+    ordering keys can run in parallel.
+
+    Args:
+        kind (str): ``'thread'`` or ``'process'``. See the ``CALLBACK_EXECUTOR_`` constants
+            in :mod:`sgframework.constants`.
+        max_workers (int): Number of worker threads or processes.
+        maxsize (int): Max number of callbacks waiting to be run (in total).
+
+    When running in worker processes, the callback function and its arguments
+    must be picklable. A number of threads (*max_workers*) are then waiting for
+    the results from the worker processes.
+
+    The time each callback spends in the queue and running is recorded,
+    see :meth:`.get_statistics`.
+
+    The object is thread safe.
+
+    """
+
+    def __init__(self,
+                 kind=constants.CALLBACK_EXECUTOR_THREAD,
+                 max_workers=constants.DEFAULT_CALLBACK_WORKERS,
+                 maxsize=constants.DEFAULT_CALLBACK_QUEUE_SIZE):
+        if kind not in constants.CALLBACK_EXECUTORS:
+            raise ValueError("Wrong callback executor kind given: {!r}".format(kind))
+        if int(max_workers) < 1:
+            raise ValueError("The number of callback workers must be at least 1. Given: {!r}".format(max_workers))
+        if int(maxsize) < 1:
+            raise ValueError("The callback queue size must be at least 1. Given: {!r}".format(maxsize))
+
+        self.kind = kind
+        self.max_workers = int(max_workers)
+        self.maxsize = int(maxsize)
+
+        self._threadpool = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        if self.kind == constants.CALLBACK_EXECUTOR_PROCESS:
+            self._processpool = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+        else:
+            self._processpool = None
+
+        # Callbacks waiting or running. The first task for each ordering key is the running one.
+        # Key: ordering key, Item: deque of Callbacktask
+        self._tasks = {}
+        self._number_of_waiting = 0
+        self._is_closed = False
+        self._lock = threading.Lock()
+
+        # Key: statistics key, Item: dict
+        self._callbackstatistics = {}
+        self.max_depth = 0
+        self.number_of_rejected = 0
+
+    def __len__(self):
+        return self._number_of_waiting
+
+    def __repr__(self):
+        return "CallbackExecutor: {} of max {} callbacks waiting, {} {} workers".format(
+            self._number_of_waiting, self.maxsize, self.max_workers, self.kind)
+
+    def submit(self, orderingkey, statisticskey, function, args, on_finished=None):
+        """Queue a callback for running.
+
+        Args:
+            orderingkey (hashable): Callbacks with the same key are run in order.
+            statisticskey (str): Key for the recorded timing information.
+            function (callable): The callback to run.
+            args (tuple): Arguments to the callback.
+            on_finished (callable or None): Called as ``on_finished(returnvalue, error)`` after
+                running the callback, in a worker thread. The *error* is ``None`` if successful.
+
+        Raises:
+            CallbackQueueFullException: If the queue is full.
+            RuntimeError: If the executor is shut down.
+
+        """
+        task = Callbacktask(statisticskey, function, args, on_finished, time.monotonic())
+        with self._lock:
+            if self._is_closed:
+                raise RuntimeError("The callback executor is shut down. Could not run callback for {}".format(
+                    statisticskey))
+            if self._number_of_waiting >= self.maxsize:
+                self.number_of_rejected += 1
+                raise CallbackQueueFullException(
+                    "The callback queue is full ({} callbacks). Could not run callback for {}".format(
+                        self.maxsize, statisticskey))
+            self._number_of_waiting += 1
+            self.max_depth = max(self.max_depth, self._number_of_waiting)
+            try:
+                self._tasks[orderingkey].append(task)
+                return
+            except KeyError:
+                self._tasks[orderingkey] = collections.deque([task])
+        try:
+            self._threadpool.submit(self._run_tasks, orderingkey)
+        except RuntimeError:
+            # Shut down. Callbacks queued behind this one (for the same key) will not run either.
+            with self._lock:
+                self._number_of_waiting -= len(self._tasks.pop(orderingkey, ()))
+            raise
+
+    def shutdown(self, wait=True, timeout=None):
+        """Stop the workers. No more callbacks are accepted by :meth:`.submit`.
+
+        Args:
+            wait (bool): Wait for all queued callbacks to finish.
+            timeout (numerical or None): Max waiting time in seconds. ``None`` waits until finished.
+
+        Returns:
+            True if all queued callbacks have finished, otherwise False.
+
+        """
+        with self._lock:
+            self._is_closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        is_finished = False
+        while wait:
+            with self._lock:
+                if not self._tasks:
+                    is_finished = True
+                    break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(constants.CALLBACK_SHUTDOWN_POLL_INTERVAL)
+        self._threadpool.shutdown(is_finished)
+        if self._processpool is not None:
+            self._processpool.shutdown(is_finished)
+        return is_finished
+
+    def get_statistics(self):
+        """Get statistics, for example for sizing the queue and finding slow callbacks.
+
+        Returns:
+            A dict with the keys ``depth``, ``max_depth``, ``maxsize``, ``kind``, ``workers``,
+            ``rejected`` and ``callbacks``. The ``callbacks`` item is a dict (one item per
+            statistics key) of dicts with the keys ``count``, ``failed``, ``queued_time_total``,
+            ``queued_time_max``, ``run_time_total`` and ``run_time_max``. Times are in seconds.
+
+        """
+        with self._lock:
+            return {'depth': self._number_of_waiting,
+                    'max_depth': self.max_depth,
+                    'maxsize': self.maxsize,
+                    'kind': self.kind,
+                    'workers': self.max_workers,
+                    'rejected': self.number_of_rejected,
+                    'callbacks': {key: dict(item) for key, item in self._callbackstatistics.items()}}
+
+    def _run_tasks(self, orderingkey):
+        """Run all tasks for an ordering key, in order. Runs in a worker thread."""
+        with self._lock:
+            task = self._tasks[orderingkey][0]
+
+        while True:
+            started_at = time.monotonic()
+            returnvalue = None
+            error = None
+            try:
+                if self._processpool is None:
+                    returnvalue = task.function(*task.args)
+                else:
+                    returnvalue = self._processpool.submit(task.function, *task.args).result()
+            except Exception as err:
+                error = err
+            finished_at = time.monotonic()
+
+            if task.on_finished is not None:
+                try:
+                    task.on_finished(returnvalue, error)
+                except Exception:
+                    pass
+
+            with self._lock:
+                self._record(task, started_at - task.queued_at, finished_at - started_at, error is not None)
+                self._number_of_waiting -= 1
+                queue = self._tasks[orderingkey]
+                queue.popleft()
+                if not queue:
+                    del self._tasks[orderingkey]
+                    return
+                task = queue[0]
+
+    def _record(self, task, queued_time, run_time, failed):
+        """Record timing information. The caller must hold the lock."""
+        try:
+            statistics = self._callbackstatistics[task.statisticskey]
+        except KeyError:
+            statistics = {'count': 0,
+                          'failed': 0,
+                          'queued_time_total': 0.0,
+                          'queued_time_max': 0.0,
+                          'run_time_total': 0.0,
+                          'run_time_max': 0.0}
+            self._callbackstatistics[task.statisticskey] = statistics
+        statistics['count'] += 1
+        statistics['failed'] += int(failed)
+        statistics['queued_time_total'] += queued_time
+        statistics['queued_time_max'] = max(statistics['queued_time_max'], queued_time)
+        statistics['run_time_total'] += run_time
+        statistics['run_time_max'] = max(statistics['run_time_max'], run_time)
@@ -33,15 +33,23 @@ PREFIX_DATA = "data"
 PREFIX_COMMAND = "command"
 SUFFIX_PRESENCE = "presence"
 SUFFIX_WILDCARD_MULTILEVEL = "#"
+SUFFIX_WILDCARD_SINGLELEVEL = "+"
 PAYLOAD_FALSE = "False"
 PAYLOAD_TRUE = "True"
 ECHO_MESSAGETYPES = {PREFIX_COMMAND: PREFIX_DATA}
 MQTT_TOPIC_DEPTH = 3
 MQTT_TOPIC_SEPARATOR = "/"
 MQTT_TOPIC_TEMPLATE = "{}/{}/{}"
+SHARED_SUBSCRIPTION_TEMPLATE = "$share/{}/{}"  # share group, topic filter
 
 CLIENT_ID_TEMPLATE = "{}-{}"
 
+## Raw payloads to callbacks ##
+RAW_BYTES = "bytes"
+RAW_MEMORYVIEW = "memoryview"
+RAW_MODES = [RAW_BYTES,
+             RAW_MEMORYVIEW]
+
 ## Certificate filename definitions ##
 CA_CERTS = 'ca_public_certificate.pem'
 KEYFILE = 'private_key.pem'
@@ -51,7 +59,72 @@ CERTFILE = 'public_certificate.pem'
 DEFAULT_QOS = 1
 DEFAULT_TIMEOUT = 1.0  # seconds
 DEFAULT_KEEPALIVE_TIME = 10  # seconds  (Is converted to int)
+MAX_DISPATCH_CACHE_SIZE = 10000  # topics, for fast dispatch of wildcard matches and unregistered topics
+DEFAULT_SUBSCRIBE_BATCH_SIZE = 500  # topics per SUBSCRIBE packet
+SUBSCRIBE_PACKET_OVERHEAD = 8  # bytes, fixed header, packet identifier and MQTT v5 properties length
+SUBSCRIBE_TOPIC_OVERHEAD = 3  # bytes per topic, length prefix and subscription options
+DEFAULT_CONNECTION_POOL_SIZE = 1  # MQTT connections per app or resource
+CONNECTION_NAME_TEMPLATE = "{}-{}"  # name, connection index
+DEFAULT_WORKER_PROCESSES = 2  # for MultiprocessResource
+DEFAULT_WORKER_QUEUE_SIZE = 1000  # batches of messages waiting for each worker process
+WORKER_POLL_INTERVAL = 0.1  # seconds, for checking the readiness of a worker process
+WORKER_FORCED_PUT_TIMEOUT = 1.0  # seconds, max waiting time for room for framework messages to a worker process
+MAX_STATISTICS_TOPICS = 1000  # topics, counted separately in the metrics and publication latency statistics
+STATISTICS_OTHER_TOPICS = '_other'  # key for the remaining topics, and unregistered incoming topics
+
+DEFAULT_START_TIMEOUT = 10.0  # seconds, max waiting time for connection, subscriptions and publications at start
+DEFAULT_STOP_TIMEOUT = 1.0  # seconds, max waiting time for confirmation of outgoing messages at stop
+DEFAULT_RECONNECT_DELAY_MIN = 0.5  # seconds, first delay between reconnection attempts (doubled for each failure)
+DEFAULT_RECONNECT_DELAY_MAX = 30.0  # seconds, max delay between reconnection attempts
+ASYNC_MISC_INTERVAL = 1.0  # seconds, for keepalive handling and reconnection (asyncio frameworks)
+ASYNC_POLL_INTERVAL = 0.01  # seconds, when waiting for outgoing messages to be confirmed (asyncio frameworks)
+
+## Outgoing publish queue ##
+PUBLISHQUEUE_POLICY_BLOCK = "block"
+PUBLISHQUEUE_POLICY_DROP_OLDEST = "drop_oldest"
+PUBLISHQUEUE_POLICY_DROP_NEWEST = "drop_newest"
+PUBLISHQUEUE_POLICY_RAISE = "raise"
+PUBLISHQUEUE_POLICIES = [PUBLISHQUEUE_POLICY_BLOCK,
+                         PUBLISHQUEUE_POLICY_DROP_OLDEST,
+                         PUBLISHQUEUE_POLICY_DROP_NEWEST,
+                         PUBLISHQUEUE_POLICY_RAISE]
+DEFAULT_PUBLISHQUEUE_SIZE = 1000  # messages
+DEFAULT_PUBLISHQUEUE_POLICY = PUBLISHQUEUE_POLICY_BLOCK
+DEFAULT_MAX_INFLIGHT = 20  # messages handed over to the MQTT client, but not yet confirmed
+DEFAULT_CONFLATION_INTERVAL = 0.1  # seconds, between flushes of the conflation buffer
+
+OFFLINE_POLICY_ALL = "all"
+OFFLINE_POLICY_LATEST = "latest"
+OFFLINE_POLICIES = [OFFLINE_POLICY_ALL,
+                    OFFLINE_POLICY_LATEST]
+DEFAULT_OFFLINEBUFFER_MAX_MESSAGES = 10000
+DEFAULT_OFFLINEBUFFER_MAX_BYTES = 1000000
+
+DEFAULT_TOPIC_ALIAS_MAXIMUM = 100  # MQTT v5
+DEFAULT_TOPIC_ALIAS_THRESHOLD = 10  # MQTT v5, number of publications on a topic before using an alias
+
+CALLBACK_EXECUTOR_THREAD = "thread"
+CALLBACK_EXECUTOR_PROCESS = "process"
+CALLBACK_EXECUTORS = [CALLBACK_EXECUTOR_THREAD,
+                      CALLBACK_EXECUTOR_PROCESS]
+DEFAULT_CALLBACK_WORKERS = 4
+DEFAULT_CALLBACK_QUEUE_SIZE = 1000  # incoming messages waiting for their callbacks to run
+CALLBACK_SHUTDOWN_POLL_INTERVAL = 0.01  # seconds
+
+LASTVALUECACHE_MESSAGETYPES = [PREFIX_DATA,
+                               PREFIX_DATAAVAILABLE,
+                               PREFIX_COMMANDAVAILABLE,
+                               PREFIX_RESOURCEAVAILABLE]
+
+DEFAULT_REQUEST_TIMEOUT = 5.0  # seconds, max waiting time for the echo of a request
+REQUEST_CHECK_INTERVAL = 0.05  # seconds, for timeouts of requests when using threaded networking
+
+## Loopback broker ##
+LOOPBACKBROKER_HOST = "127.0.0.1"
+LOOPBACKBROKER_POLL_INTERVAL = 0.05  # seconds, for shutdown of the loopback broker
 
-SLEEP_START = 1.0  # seconds, for setting up subscriptions etc
-SLEEP_STOP = 1.0  # seconds, for finalizing communication
-SLEEP_PUBLISH = 0.00001  # seconds, for allowing the other thread to work properly
+## Statistics ##
+DEFAULT_HISTOGRAM_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)  # seconds
+SIGNALNAME_PUBLISHLATENCY = "_publishlatency"  # for publishing the publication latency statistics
+SIGNALNAME_METRICS = "_metrics"  # for publishing the metrics
+STATISTICS_CHECK_INTERVAL = 1.0  # seconds, for publishing statistics when using threaded networking
@@ -28,3 +28,18 @@
 class SGFrameworkException(Exception):
     """Base exception for the SG framework"""
     pass
+
+
+class PublishQueueFullException(SGFrameworkException):
+    """The outgoing publish queue is full, and the message could not be queued"""
+    pass
+
+
+class CallbackQueueFullException(SGFrameworkException):
+    """The callback queue is full, and the callback could not be queued"""
+    pass
+
+
+class RequestTimeoutException(SGFrameworkException):
+    """No echo was received for a request within the timeout"""
+    pass
@@ -26,17 +26,54 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import collections
+import concurrent.futures
+import functools
+import json
 import logging
 import os
+import random
 import ssl
 import sys
+import threading
 import time
+import zlib
 
 import paho.mqtt.client as mqtt
+try:
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+except ImportError:  # Paho before 1.5 does not support MQTT v5
+    PacketTypes = None
+    Properties = None
 
 assert sys.version_info >= (3, 2, 0), "Python version 3.2 or later required!"
 
 from . import constants
+from .callbackexecutor import CallbackExecutor
+from .exceptions import CallbackQueueFullException, PublishQueueFullException, RequestTimeoutException
+from .histogram import Histogram
+from .lastvaluecache import LastValueCache
+from .metrics import Metrics, get_payload_size
+from .offlinebuffer import OfflineBuffer
+from .publishqueue import ConflationBuffer, Outgoingmessage, PublishQueue
+from .topictrie import TopicTrie, is_wildcard_topicfilter, validate_topicfilter
+
+# Precomputed routing information for an incoming topic, used by fast dispatch
+Dispatchentry = collections.namedtuple('Dispatchentry', ['topic', 'topic_hierarchy', 'inputsignalinformations'])
+
+# A request waiting for its echo. The times are from time.monotonic()
+Pendingrequest = collections.namedtuple('Pendingrequest', ['future', 'commandtopic', 'codec', 'timeout',
+                                                           'sendtime', 'deadline'])
+
+# Settings copied to the extra connections in a connection pool
+POOL_CONNECTION_ATTRIBUTES = ['protocol', 'tls_version', 'qos', 'timeout', 'keepalive',
+                              'reconnect_delay_min', 'reconnect_delay_max', 'use_fast_dispatch',
+                              'subscribe_batch_size', 'publishqueue_size', 'publishqueue_policy',
+                              'publishqueue_timeout', 'max_inflight', 'callback_executor', 'callback_workers',
+                              'callback_queue_size', 'use_offlinebuffer', 'offlinebuffer_max_messages',
+                              'offlinebuffer_max_bytes', 'topic_alias_maximum', 'topic_alias_threshold',
+                              'message_expiry', 'receive_maximum', 'userdata']
 
 
 class BaseFramework:
@@ -55,7 +92,8 @@ class BaseFramework:
     Attributes:
         protocol (enum in the Paho module): MQTT protocol version,
             defaults to ``MQTTv31``, as older versions of the Mosquitto
-            broker can not handle ``MQTTv311``.
+            broker can not handle ``MQTTv311``. Use ``MQTTv5`` for topic aliases,
+            message expiry and receive maximum (requires Paho 1.5 or later).
         tls_version (enum in the ssl module): SSL protocol version,
             defaults to ``ssl.PROTOCOL_TLSv1``
         qos (int): MQTT quality of service. 0, 1 or 2. See Paho
@@ -64,6 +102,68 @@ class BaseFramework:
             method. Default value ``DEFAULT_TIMEOUT``.
         keepalive (numerical): MQTT keepalive message interval.
             Default value ``DEFAULT_KEEPALIVE_TIME``.
+        reconnect_delay_min (numerical): Delay in seconds before the second attempt
+            to reconnect to the broker. Doubled for each failed attempt.
+            Default value ``DEFAULT_RECONNECT_DELAY_MIN``.
+        reconnect_delay_max (numerical): Max delay in seconds between attempts to
+            reconnect to the broker. Default value ``DEFAULT_RECONNECT_DELAY_MAX``.
+        use_fast_dispatch (bool): Route incoming messages with a single dictionary lookup
+            on the undecoded topic, and decode the payload only for registered topics.
+            Incoming topics are then not stripped, and each incoming message is not
+            logged for debugging. Defaults to ``False``.
+        subscribe_batch_size (int): Max number of topics in each SUBSCRIBE packet.
+            Default value ``DEFAULT_SUBSCRIBE_BATCH_SIZE``.
+        connection_pool_size (int): Number of MQTT connections to the broker, requires
+            threaded networking. See :meth:`.get_connection_statistics`.
+            Default value ``DEFAULT_CONNECTION_POOL_SIZE``.
+        publishqueue_size (int): Max number of outgoing messages waiting
+            in the publish queue. Default value ``DEFAULT_PUBLISHQUEUE_SIZE``.
+        publishqueue_policy (str): What to do with an outgoing message when the
+            publish queue is full: ``'block'``, ``'drop_oldest'``, ``'drop_newest'``
+            or ``'raise'``. See :class:`.PublishQueue`. Messages generated by the
+            framework itself are never dropped. Default value ``DEFAULT_PUBLISHQUEUE_POLICY``.
+        publishqueue_timeout (numerical or None): Max blocking time in seconds
+            for the ``'block'`` policy. Defaults to ``None`` (no limit). A
+            :exc:`.PublishQueueFullException` is raised instead of blocking within callbacks,
+            and without threaded networking also when not connected to the broker.
+        max_inflight (int): Max number of outgoing messages handed over to the
+            MQTT client but not yet confirmed. Use 0 for unlimited.
+            Default value ``DEFAULT_MAX_INFLIGHT``.
+        callback_executor (str or None): Run the callbacks in a pool of worker
+            threads (``'thread'``) or worker processes (``'process'``), instead
+            of in the network thread. See :class:`.CallbackExecutor`. With worker processes
+            the callbacks must be picklable, and get ``None`` instead of the app or resource
+            object. Defaults to ``None`` (network thread).
+        callback_workers (int): Number of worker threads or processes.
+            Default value ``DEFAULT_CALLBACK_WORKERS``.
+        callback_queue_size (int): Max number of incoming messages waiting for their
+            callbacks to run. More messages are dropped (with a warning).
+            Default value ``DEFAULT_CALLBACK_QUEUE_SIZE``.
+        use_offlinebuffer (bool): Store outgoing messages in an :class:`.OfflineBuffer`
+            while disconnected from the broker, and publish them in order after
+            reconnection. Defaults to ``False``.
+        offlinebuffer_max_messages (int): Max number of messages in the offline buffer.
+            Default value ``DEFAULT_OFFLINEBUFFER_MAX_MESSAGES``.
+        offlinebuffer_max_bytes (int): Size in bytes of the payload storage in the offline buffer.
+            Default value ``DEFAULT_OFFLINEBUFFER_MAX_BYTES``.
+        offlinebuffer_filename (str or None): Memory-mapped file for the payload
+            storage in the offline buffer. Defaults to ``None`` (in memory).
+        topic_alias_maximum (int): Max number of topic aliases for outgoing QoS 0
+            messages (MQTT v5). Use 0 to disable. Default value ``DEFAULT_TOPIC_ALIAS_MAXIMUM``.
+        topic_alias_threshold (int): Number of publications on a topic before it gets
+            a topic alias (MQTT v5). Default value ``DEFAULT_TOPIC_ALIAS_THRESHOLD``.
+        message_expiry (numerical or None): Message expiry interval in seconds for
+            outgoing messages (MQTT v5). Defaults to ``None`` (no expiry).
+        receive_maximum (int or None): Max number of incoming QoS 1 and 2 messages
+            that the broker may send before they are acknowledged (MQTT v5).
+            Defaults to ``None`` (the broker default).
+        publishlatency_interval (numerical or None): Interval in seconds for publishing
+            the publication latency statistics. Defaults to ``None`` (not published).
+            See :meth:`.get_publishlatency_statistics`.
+        metrics_interval (numerical or None): Interval in seconds for publishing
+            the metrics. Defaults to ``None`` (not published). See :meth:`.get_metrics`.
+        use_lastvaluecache (bool): Store the latest incoming value for each data and
+            availability topic. See :meth:`.get_latest`. Defaults to ``False``.
 
     Also the parameters appear as attributes. The public attributes are
     used when calling :meth:`.start`. Any changes are valid from next :meth:`.start`.
@@ -93,6 +193,14 @@ class BaseFramework:
     where *messagetype*, *servicename*, *signalname* and *inputpayload* are strings.
     The callback is protected by try/except.
     The strings to the callback have been through ``.strip()``.
+    With a payload codec (see :mod:`sgframework.payloadcodecs`) the *inputpayload* is the decoded value.
+
+    In raw mode (per registration, using the *raw* argument) the callback instead has this interface::
+
+        callbackname(resource_or_app, topic, inputpayload)
+
+    where *topic* is a string and *inputpayload* is the undecoded payload, as :class:`bytes`
+    or as a :class:`memoryview` of it.
 
     When using echo and the returnvalue of the callback is ``None``,
     the command payload is used in the echo.
@@ -122,6 +230,29 @@ class BaseFramework:
         self.qos = constants.DEFAULT_QOS
         self.timeout = constants.DEFAULT_TIMEOUT
         self.keepalive = constants.DEFAULT_KEEPALIVE_TIME
+        self.reconnect_delay_min = constants.DEFAULT_RECONNECT_DELAY_MIN
+        self.reconnect_delay_max = constants.DEFAULT_RECONNECT_DELAY_MAX
+        self.use_fast_dispatch = False
+        self.subscribe_batch_size = constants.DEFAULT_SUBSCRIBE_BATCH_SIZE
+        self.connection_pool_size = constants.DEFAULT_CONNECTION_POOL_SIZE
+        self.publishqueue_size = constants.DEFAULT_PUBLISHQUEUE_SIZE
+        self.publishqueue_policy = constants.DEFAULT_PUBLISHQUEUE_POLICY
+        self.publishqueue_timeout = None
+        self.max_inflight = constants.DEFAULT_MAX_INFLIGHT
+        self.callback_executor = None
+        self.callback_workers = constants.DEFAULT_CALLBACK_WORKERS
+        self.callback_queue_size = constants.DEFAULT_CALLBACK_QUEUE_SIZE
+        self.use_offlinebuffer = False
+        self.offlinebuffer_max_messages = constants.DEFAULT_OFFLINEBUFFER_MAX_MESSAGES
+        self.offlinebuffer_max_bytes = constants.DEFAULT_OFFLINEBUFFER_MAX_BYTES
+        self.offlinebuffer_filename = None
+        self.topic_alias_maximum = constants.DEFAULT_TOPIC_ALIAS_MAXIMUM
+        self.topic_alias_threshold = constants.DEFAULT_TOPIC_ALIAS_THRESHOLD
+        self.message_expiry = None
+        self.receive_maximum = None
+        self.publishlatency_interval = None
+        self.metrics_interval = None
+        self.use_lastvaluecache = False
 
         self.on_broker_connectionstatus_info = None
         self.mqttclient = None
@@ -131,6 +262,70 @@ class BaseFramework:
         self._use_clean_session = True
         self._use_threaded_networking = False
         self._use_last_will = False
+        self._broker_connected = False
+        self._is_looping = False
+
+        # Reconnection with exponential backoff (when not using threaded networking)
+        self._number_of_reconnect_failures = 0
+        self._next_reconnect_time = 0  # From time.monotonic()
+        self._initial_connect_pending = False  # The first attempt after start() is not a reconnect
+
+        # Outgoing messages, waiting to be handed over to the MQTT client.
+        # Only one thread at a time is handing over messages, to keep the message order.
+        self._publishqueue = PublishQueue(self.publishqueue_size, self.publishqueue_policy, self.max_inflight)
+        self._flush_lock = threading.Lock()
+        self._is_flushing = False
+        self._flush_requested = False
+
+        # Message ids for subscriptions not yet acknowledged by the broker.
+        # The condition is notified at acknowledgements, for waiting in start() and stop().
+        self._pending_subscriptions = set()
+        self._subscribed_topics = set()  # Subscribed using the current MQTT client
+        self._acknowledgement_condition = threading.Condition()
+
+        # Runs callbacks outside the network thread, if configured
+        self._callbackexecutor = None
+
+        # Outgoing messages while disconnected, if configured.
+        # The lock makes sure that stored messages are published before new messages.
+        self._offlinebuffer = None
+        self._offlinebuffer_lock = threading.Lock()
+
+        # MQTT v5 information, valid for the current connection
+        self._use_mqttv5 = False
+        self._broker_maximum_packet_size = None
+        self._topic_alias_limit = 0
+        self._topic_alias_properties = {}  # Key: topic, Item: Properties with topic alias
+        self._topic_publication_counts = {}  # Key: topic, Item: number of publications
+        self._publish_properties = {}  # Key: topic, Item: Properties without topic alias (or None)
+
+        # Counters and histograms for the message traffic
+        self._metrics = Metrics()
+
+        # Latest incoming values, if configured
+        self._lastvaluecache = None
+
+        # Requests waiting for echoes. Protected by the lock.
+        # Key: echo topic, Item: deque of Pendingrequest
+        self._pending_requests = {}
+        self._response_topics = set()  # Echo topics, subscribed at connection
+        self._request_counters = {'requests': 0, 'responses': 0, 'timeouts': 0}
+        self._request_roundtrip_times = {}  # Key: command topic, Item: Histogram
+        self._requests_lock = threading.Lock()
+        self._request_stop_event = None
+        self._request_thread = None
+
+        # Periodic publishing of statistics. Next times are from time.monotonic()
+        self._next_publishlatency_time = 0
+        self._next_metrics_time = 0
+        self._statistics_stop_event = None
+        self._statistics_thread = None
+
+        # Extra connections in the connection pool, if configured (App objects).
+        # The owner is the app or resource given to the callbacks, and differs
+        # from self for the extra connections.
+        self._pool_connections = []
+        self._owner = self
 
         # This is the 'last will' topic
         self._servicepresence_topic = constants.MQTT_TOPIC_TEMPLATE.format(
@@ -144,12 +339,28 @@ class BaseFramework:
         # Key: topic, Item: Inputsignalinfo
         self._inputsignal_infodict = {}
 
+        # The input signals having wildcards in the topic are also stored here.
+        # Item: Inputsignalinfo
+        self._inputsignal_trie = TopicTrie()
+
+        # Routing information for incoming topics, used by fast dispatch.
+        # The table holds the exactly registered topics, and is never evicted.
+        # The cache holds the other topics (matching wildcards, or unregistered), created at
+        # the first incoming message. It is limited in size, and the least recently used are evicted.
+        # Key: topic (bytes), Item: Dispatchentry (None for unregistered topics)
+        self._dispatch_table = {}
+        self._dispatch_cache = collections.OrderedDict()
+
         # Storage of outgoing signal definitions.
         # (Probably only data).
         # Typically for sending dataavailable at start
         # Key: topic, Item: Outputsignalinfo
         self._outputsignal_infodict = {}
 
+        # Handles for fast publishing on registered signals
+        # Key: topic, Item: Signalhandle
+        self._signalhandles = {}
+
     def __repr__(self):
         return "SG Base Framework: '{}', connecting to host '{}', port {}. Has {} incoming and {} outgoing topics registered.".format(
             self.name, self.host, self.port, len(self._inputsignal_infodict), len(self._outputsignal_infodict))
@@ -173,46 +384,207 @@ class BaseFramework:
 
         return text
 
-    def start(self, use_threaded_networking=False, use_clean_session=True):
+    def start(self, use_threaded_networking=False, use_clean_session=True, wait=None,
+              timeout=constants.DEFAULT_START_TIMEOUT):
         """Connect to the broker.
 
         Args:
             use_threaded_networking (bool): Start MQTT networking
                 activity in a separate thread.
-            use_clean_session (bool): Connect to broker using a clean session.
+            use_clean_session (bool): Connect to broker using a clean session. Otherwise the
+                topics are not subscribed again when the broker reports that the session is present.
+            wait (bool or None): Return when connected to the broker, and the subscriptions and
+                the capability publications have been acknowledged. Defaults to wait only
+                when using threaded networking.
+            timeout (numerical): Max waiting time in seconds, when waiting.
+
+        Returns:
+            True if ready (connected and all acknowledgements received), otherwise False.
 
         If not using threaded networking, you need to call the ``loop()``
-        method frequently.
+        method frequently. When waiting, ``loop()`` is called by this method until ready.
 
         If using a clean session, also the client name is changed to include
         the process ID. This in order to avoid client name collisions
         in the broker.
 
+        If not ready within the timeout, a warning is logged and the
+        connection attempts continue in the background.
 
         """
+        if int(self.connection_pool_size) < 1:
+            raise ValueError("The connection pool size must be at least 1: {!r}".format(self.connection_pool_size))
+        if self.connection_pool_size > 1 and not use_threaded_networking:
+            raise ValueError("A connection pool requires threaded networking.")
+        if wait is None:
+            wait = use_threaded_networking
         self._use_threaded_networking = use_threaded_networking
         self._use_clean_session = use_clean_session
 
         if self.mqttclient is not None:
             self.stop()
 
+        if self._owner is self:  # Otherwise shared with the owner
+            self._lastvaluecache = LastValueCache() if self.use_lastvaluecache else None
+        self._start_pool_connections()
+        self._create_mqttclient()
+        if self.callback_executor is not None:
+            self._callbackexecutor = CallbackExecutor(self.callback_executor,
+                                                      self.callback_workers,
+                                                      self.callback_queue_size)
+        self._connect_async()
+
+        if self._use_threaded_networking:
+            self.mqttclient.loop_start()
+            if self.metrics_interval is not None or self.publishlatency_interval is not None:
+                self._statistics_stop_event = threading.Event()
+                self._statistics_thread = threading.Thread(target=self._run_statistics_timer,
+                                                           args=(self._statistics_stop_event,),
+                                                           name='{}-statistics'.format(self.name),
+                                                           daemon=True)
+                self._statistics_thread.start()
+        if not wait:
+            return self._is_ready()
+
+        is_ready = self._wait_for_acknowledgements(self._is_ready, timeout, self.loop)
+        if not is_ready:
+            self.logger.warning("Not ready within {} s. Host: {}, Port: {}, Connected: {}, Pending subscriptions: {}".format(
+                timeout, self.host, self.port, self._broker_connected, len(self._pending_subscriptions)))
+        return is_ready
+
+    def _start_pool_connections(self):
+        """Create and start the extra connections in the connection pool (if configured).
+
+        The registered input signals are distributed over the connections according
+        to :meth:`._get_connection_index` (stored as the ``connection_index`` of each
+        :class:`.Inputsignalinfo`). The extra connections share the registrations,
+        and the acknowledgement condition (for waiting in :meth:`.start`).
+
+        """
+        self._pool_connections = []
+        self._dispatch_table.clear()  # Depends on the distribution of the input signals
+        self._dispatch_cache.clear()
+        if self.connection_pool_size == 1:
+            return
+
+        for index in range(1, int(self.connection_pool_size)):
+            connection = App(constants.CONNECTION_NAME_TEMPLATE.format(self.name, index),
+                             self.host, self.port, self.certificate_directory)
+            for attributename in POOL_CONNECTION_ATTRIBUTES:
+                setattr(connection, attributename, getattr(self, attributename))
+            if self.offlinebuffer_filename is not None:
+                connection.offlinebuffer_filename = constants.CONNECTION_NAME_TEMPLATE.format(
+                    self.offlinebuffer_filename, index)
+            connection._owner = self
+            connection._outputsignal_infodict = self._outputsignal_infodict
+            connection._acknowledgement_condition = self._acknowledgement_condition
+            connection._lastvaluecache = self._lastvaluecache
+            self._pool_connections.append(connection)
+
+        for topic, inputsignalinformation in self._inputsignal_infodict.items():
+            index = self._get_connection_index(topic)
+            inputsignalinformation.connection_index = index
+            if index:
+                self._pool_connections[index - 1]._add_inputsignalinformation(topic, inputsignalinformation)
+
+        for connection in self._pool_connections:
+            connection.start(use_threaded_networking=True, use_clean_session=self._use_clean_session, wait=False)
+        self.logger.info("Started {} extra connections to the MQTT broker.".format(len(self._pool_connections)))
+
+    def _stop_pool_connections(self, timeout):
+        """Stop the extra connections in the connection pool (if any). Is called by :meth:`.stop`.
+
+        Args:
+            timeout (numerical): Max time in seconds to wait for outgoing messages to be confirmed,
+                for each connection.
+
+        """
+        for connection in self._pool_connections:
+            connection.stop(timeout)
+        self._pool_connections = []
+
+    def _get_connection_index(self, topic):
+        """Find the connection in the connection pool to use for a topic.
+
+        Args:
+            topic (str): MQTT topic, or topic filter for input signals.
+
+        The topics are distributed by a hash of the signal name (the last level), so that
+        the messages for a signal always use the same connection and keep their order.
+
+        Returns the index of the connection, where 0 is the first connection (self).
+
+        """
+        number_of_connections = len(self._pool_connections) + 1
+        if number_of_connections == 1:
+            return 0
+        signalname = topic[topic.rfind(constants.MQTT_TOPIC_SEPARATOR) + 1:]
+        return zlib.crc32(signalname.encode('utf-8')) % number_of_connections
+
+    def _create_mqttclient(self):
+        """Create and configure the MQTT client, and reset the publish queue.
+
+        Uses the settings in the public attributes. Does not connect.
+
+        """
         self._set_broker_connectionstatus(False)
+        self._publishqueue = PublishQueue(self.publishqueue_size, self.publishqueue_policy, self.max_inflight)
+        self._pending_subscriptions = set()
+        self._subscribed_topics = set()
+        self._broker_maximum_packet_size = None
+        self._metrics = Metrics()
+        self._number_of_reconnect_failures = 0
+        self._next_reconnect_time = 0
+        self._initial_connect_pending = True
+        self._request_counters = {'requests': 0, 'responses': 0, 'timeouts': 0}
+        self._request_roundtrip_times = {}
+        self._next_publishlatency_time = 0
+        self._next_metrics_time = 0
+        if self._offlinebuffer is not None:
+            self._offlinebuffer.close()
+            self._offlinebuffer = None
+        if self.use_offlinebuffer:
+            self._offlinebuffer = OfflineBuffer(self.offlinebuffer_max_messages,
+                                                self.offlinebuffer_max_bytes,
+                                                self.offlinebuffer_filename)
+        for signalhandle in self._signalhandles.values():
+            signalhandle.qos = self.qos
 
         if self._use_clean_session:
             client_id = constants.CLIENT_ID_TEMPLATE.format(self.name, os.getpid())
         else:
             client_id = self.name
-        self.mqttclient = mqtt.Client(client_id=client_id,
-                                      clean_session=self._use_clean_session,
-                                      userdata=self.userdata,
-                                      protocol=self.protocol)
+        self._use_mqttv5 = self.protocol == getattr(mqtt, 'MQTTv5', None)
+        if self._use_mqttv5:
+            if Properties is None:
+                raise ValueError("MQTT v5 requires Paho 1.5 or later.")
+            self.mqttclient = mqtt.Client(client_id=client_id,
+                                          userdata=self.userdata,
+                                          protocol=self.protocol)
+        else:
+            self.mqttclient = mqtt.Client(client_id=client_id,
+                                          clean_session=self._use_clean_session,
+                                          userdata=self.userdata,
+                                          protocol=self.protocol)
         self.mqttclient.on_connect      = self._on_connect
         self.mqttclient.on_disconnect   = self._on_disconnect
         self.mqttclient.on_subscribe    = self._on_subscribe
         self.mqttclient.on_unsubscribe  = self._on_unsubscribe
         self.mqttclient.on_publish      = self._on_publish
-        self.mqttclient.on_message      = self._on_incoming_message
+        if self.use_fast_dispatch:
+            self.mqttclient.on_message  = self._on_incoming_message_fast
+        else:
+            self.mqttclient.on_message  = self._on_incoming_message
         self.mqttclient.on_log          = self._on_mqttclient_log_event
+        self.mqttclient.max_inflight_messages_set(self.max_inflight)
+        if self._use_threaded_networking:
+            self.mqttclient.reconnect_delay_set(self.reconnect_delay_min, self.reconnect_delay_max)
+        elif hasattr(type(self.mqttclient), 'connect_timeout'):
+            # Limit the blocking time for reconnect() in loop(). Public property in Paho 2.x.
+            self.mqttclient.connect_timeout = float(self.timeout)
+        elif hasattr(self.mqttclient, '_connect_timeout'):
+            # There is no public API for this in Paho 1.x. Without it, the socket default timeout is used.
+            self.mqttclient._connect_timeout = float(self.timeout)
 
         self.logger.info("Setting up connection to the MQTT broker. Host: {}, Port: {}, QoS: {}".
                          format(self.host, self.port, self.qos))
@@ -234,28 +606,103 @@ class BaseFramework:
                                      retain=True)
             self.logger.debug('    Setting last will: {}'.format(self._servicepresence_topic))
 
-        self.mqttclient.connect_async(self.host, self.port, keepalive=int(self.keepalive))  # Keepalive must be int
+    def _connect_async(self):
+        """Start connecting to the broker, using the settings in the public attributes."""
+        if not self._use_mqttv5:
+            self.mqttclient.connect_async(self.host, self.port, keepalive=int(self.keepalive))  # Keepalive must be int
+            return
 
-        if self._use_threaded_networking:
-            self.mqttclient.loop_start()
-            time.sleep(constants.SLEEP_START)
+        connect_properties = None
+        if self.receive_maximum is not None:
+            connect_properties = Properties(PacketTypes.CONNECT)
+            connect_properties.ReceiveMaximum = int(self.receive_maximum)
+        self.mqttclient.connect_async(self.host,
+                                      self.port,
+                                      keepalive=int(self.keepalive),
+                                      clean_start=self._use_clean_session,
+                                      properties=connect_properties)
+
+    def stop(self, timeout=constants.DEFAULT_STOP_TIMEOUT):
+        """Disconnect from the broker.
+
+        Args:
+            timeout (numerical): Max time in seconds to wait for outgoing messages to be confirmed.
+
+        Messages in the publish queue are handed over to the MQTT client before disconnecting.
+        Queued callbacks are run before disconnecting (within the timeout), if using ``callback_executor``.
+        Messages arriving meanwhile are dropped.
 
-    def stop(self):
-        """Disconnect from the broker"""
+        Waits until all in-flight messages have been confirmed (or the timeout),
+        instead of sleeping a fixed time.
+
+        """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before stop().")
         self.logger.info('Disconnecting from the MQTT broker. Host: {}, Port: {}'.format(self.host, self.port))
+        if self._statistics_thread is not None:
+            self._statistics_stop_event.set()
+            self._statistics_thread.join()
+            self._statistics_thread = None
+        if self._callbackexecutor is not None:
+            if not self._callbackexecutor.shutdown(wait=True, timeout=timeout):
+                self.logger.warning("Queued callbacks not finished within {} s.".format(timeout))
+            self._callbackexecutor = None
+        self._cancel_requests()
+        self._stop_pool_connections(timeout)
         if self._use_last_will:
-            try:
-                self.mqttclient.publish(self._servicepresence_topic,
-                                        constants.PAYLOAD_FALSE,
-                                        qos=1,
-                                        retain=True)
-            except AttributeError:
-                raise ValueError("You must call start() before stop().")
-        time.sleep(constants.SLEEP_STOP)
+            self._publish(self._servicepresence_topic, constants.PAYLOAD_FALSE, 1, True, force=True)
+        self._flush_publishqueue(ignore_inflight_limit=True)
+        self._wait_for_acknowledgements(lambda: not self._broker_connected or not self._has_unconfirmed_publications(),
+                                        timeout,
+                                        lambda: self.mqttclient.loop(self.timeout))
         self.mqttclient.disconnect()
         self.mqttclient.loop_stop()
         self._set_broker_connectionstatus(False)
 
+    def _is_ready(self):
+        """Check whether connected, and all subscriptions and publications are acknowledged."""
+        return self._broker_connected and not self._pending_subscriptions and \
+            not self._has_unconfirmed_publications() and \
+            all(connection._is_ready() for connection in self._pool_connections)
+
+    def _has_unconfirmed_publications(self):
+        """Check whether there are queued or in-flight messages in the publish queue."""
+        statistics = self._publishqueue.get_statistics()
+        return bool(statistics['depth'] or statistics['inflight'])
+
+    def _notify_acknowledgements(self):
+        """Wake up threads waiting in :meth:`._wait_for_acknowledgements`.
+
+        Is called at connection, disconnection and acknowledgements from the broker.
+
+        """
+        with self._acknowledgement_condition:
+            self._acknowledgement_condition.notify_all()
+
+    def _wait_for_acknowledgements(self, predicate, timeout, run_network):
+        """Wait until the predicate is fulfilled, or the timeout.
+
+        Args:
+            predicate (callable): Function without arguments, returning a bool.
+            timeout (numerical): Max waiting time in seconds.
+            run_network (callable): Function without arguments, that is called repeatedly while
+                waiting when not using threaded networking.
+
+        Returns:
+            True if the predicate was fulfilled, otherwise False.
+
+        """
+        if self._use_threaded_networking:
+            with self._acknowledgement_condition:
+                return self._acknowledgement_condition.wait_for(predicate, timeout)
+
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() >= deadline:
+                return False
+            run_network()
+        return True
+
     def loop(self):
         """Run network activities.
 
@@ -264,7 +711,11 @@ class BaseFramework:
         It will block until a message is received, or until
         the self.timeout value.
 
-        If not connected to the broker, it will try to connect once.
+        If not connected to the broker, it will try to connect once (if the
+        delay since the last attempt has passed), or wait for the next
+        attempt but not longer than the self.timeout value. The delay
+        between the attempts is increased exponentially, with some randomness,
+        from ``reconnect_delay_min`` up to ``reconnect_delay_max``.
 
         Do not use this function when running threaded networking.
 
@@ -273,10 +724,23 @@ class BaseFramework:
             self.logger.warning("You must should not use the loop() method when running a threaded networking interface.")
             return
 
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before loop().")
+        if self.mqttclient.socket() is None:
+            waiting_time = self._next_reconnect_time - time.monotonic()
+            if waiting_time > 0:
+                time.sleep(min(waiting_time, self.timeout))
+            else:
+                self._reconnect()
+            return
+
+        self._is_looping = True
         try:
             errorcode = self.mqttclient.loop(self.timeout)
-        except AttributeError:
-            raise ValueError("You must call start() before loop().")
+            self._expire_requests()
+            self._publish_statistics_if_due()
+        finally:
+            self._is_looping = False
 
         if not errorcode:
             return
@@ -287,23 +751,65 @@ class BaseFramework:
             self.stop()
             sys.exit()
         if errorcode == mqtt.MQTT_ERR_CONN_LOST:
-            self.logger.info("MQTT connection error, trying to reconnect. Error message: '{}'".format(
+            self.logger.info("MQTT connection error, will reconnect. Error message: '{}'".format(
                     mqtt.error_string(errorcode)))
         elif errorcode in [mqtt.MQTT_ERR_NO_CONN, mqtt.MQTT_ERR_CONN_REFUSED]:
-            self.logger.warning("MQTT connection error, trying to reconnect. Error message: '{}'".format(
+            self.logger.warning("MQTT connection error, will reconnect. Error message: '{}'".format(
                     mqtt.error_string(errorcode)))
         else:
             self.logger.warning("MQTT error. Error message: '{}'".format(mqtt.error_string(errorcode)))
-            return
 
+    def _reconnect(self):
+        """Make one attempt to reconnect to the broker. At failure, the next attempt is scheduled.
+
+        The connection is finished when the CONNACK arrives, see :meth:`._on_connect`.
+
+        """
+        self._record_connection_attempt()
         try:
             self.mqttclient.reconnect()
-        except Exception:
-            self.logger.warning("Failed to connect to the MQTT broker. Host: {}, Port: {}".format(self.host, self.port))
-            self._set_broker_connectionstatus(False)
-            time.sleep(1)
+        except Exception as err:
+            self._on_reconnect_failure(err)
+
+    def _record_connection_attempt(self):
+        """Count a reconnection attempt in the metrics. The initial connection attempt is not counted."""
+        if self._initial_connect_pending:
+            self._initial_connect_pending = False
+        else:
+            self._metrics.add_reconnect_attempt()
+
+    def _on_reconnect_failure(self, err):
+        """Log a failed attempt to reconnect, and schedule the next attempt.
+
+        Args:
+            err (Exception): The error from the connection attempt
+
+        """
+        delay = self._schedule_reconnect()
+        self.logger.warning("Failed to connect to the MQTT broker. Host: {}, Port: {}. Next attempt in {:.1f} s. Error: '{}'".format(
+            self.host, self.port, delay, err))
+        self._set_broker_connectionstatus(False)
+
+    def _schedule_reconnect(self):
+        """Schedule the next attempt to reconnect, using exponential backoff with jitter.
+
+        The delay is doubled for each failed attempt (up to ``reconnect_delay_max``), and
+        a random delay of up to half of it is subtracted, to avoid that many clients
+        reconnect simultaneously.
 
-    def register_incoming_data(self, servicename, signalname, callback, callback_on_change_only=False):
+        Returns the delay in seconds.
+
+        """
+        delay = min(self.reconnect_delay_max, self.reconnect_delay_min * 2 ** self._number_of_reconnect_failures)
+        if delay < self.reconnect_delay_max:
+            self._number_of_reconnect_failures += 1
+        delay = random.uniform(delay / 2, delay)
+        self._next_reconnect_time = time.monotonic() + delay
+        return delay
+
+    def register_incoming_data(self, servicename, signalname, callback, callback_on_change_only=False,
+                               tolerance=None, hysteresis=None, min_interval=None, codec=None, raw=None,
+                               share_group=None):
         """Register a callback for incoming data (incoming MQTT message).
 
         Primarily useful for apps (but is useful for resources to receive data
@@ -314,6 +820,18 @@ class BaseFramework:
             signalname (str):  name of the signal
             callback (function): Callback that will be used when data is received.
             callback_on_change_only (bool): Trigger callback only for changed payload.
+            tolerance (numerical or None): Numerical payloads are considered changed only if they
+                differ more than this from the payload at the last callback.
+                Implies *callback_on_change_only*.
+            hysteresis (numerical or None): Additional change required when the payload
+                changes direction (compared to the last change). Implies *callback_on_change_only*.
+            min_interval (numerical or None): Min time in seconds between callbacks (per topic).
+            codec (object or None): Payload codec. Defaults to text.
+            raw (str or None): Give the undecoded payload and the topic to the callback,
+                as ``'bytes'`` or ``'memoryview'`` (no copies). A memoryview can not be given
+                to worker processes. Defaults to ``None`` (not raw).
+            share_group (str or None): Name of a shared subscription group. Defaults to ``None``
+                (not shared).
 
         For details on the callback, see the class documentation.
 
@@ -321,10 +839,31 @@ class BaseFramework:
 
         for example: ``data/climateservice/actualindoortemperature``.
 
+        The MQTT wildcards ``+`` and ``#`` can be used for the *servicename*
+        and *signalname*, for example ``data/+/actualindoortemperature`` or ``data/climateservice/#``.
+        The callback receives the actual servicename and signalname.
+
+        Using *tolerance* and *hysteresis*, the payloads are compared as numbers
+        instead of as strings. This avoids callbacks for noisy values, for example
+        ``'22.01'`` and ``'22.02'``. The hysteresis is useful for values oscillating
+        around a level. Non-numerical payloads are compared as strings.
+
+        With a *share_group*, the subscription is done using the topic filter
+        ``$share/``\ *share_group*\ ``/data/``\ *servicename*\ ``/``\ *signalname*.
+        The broker then delivers each message to only one of the subscribers in the group,
+        so several app instances (using the same *share_group*) can split a stream of messages
+        between them. The callback receives the actual topic levels, as usual. Note that
+        retained messages are not delivered to shared subscriptions, and that the filtering
+        by *callback_on_change_only* etc is done per app instance. Shared subscriptions are
+        part of MQTT v5, but are supported by some brokers also for older protocol versions.
+
         """
-        self.logger.debug("Registering incoming data. Servicename: {}, Signalname: {}".
-                          format(servicename, signalname))
-        self._register_inputsignal(constants.PREFIX_DATA, servicename, signalname, callback, callback_on_change_only)
+        self.logger.debug("Registering incoming data. Servicename: {}, Signalname: {}, Share group: {}".
+                          format(servicename, signalname, share_group))
+        inputsignalinformation = self._register_inputsignal(constants.PREFIX_DATA, servicename, signalname,
+                                                            callback, callback_on_change_only, codec=codec, raw=raw,
+                                                            share_group=share_group)
+        inputsignalinformation.set_filter(tolerance, hysteresis, min_interval)
 
     def register_incoming_availability(self, prefix,
                                        servicename, signalname, callback):
@@ -349,6 +888,9 @@ class BaseFramework:
 
         for example: ``dataavailable/climateservice/actualindoortemperature``.
 
+        The MQTT wildcards ``+`` and ``#`` can be used for the *servicename*
+        and *signalname*, for example ``resourceavailable/+/presence``.
+
         """
         assert prefix in [constants.PREFIX_COMMANDAVAILABLE,
                           constants.PREFIX_DATAAVAILABLE,
@@ -361,7 +903,7 @@ class BaseFramework:
                           format(prefix, servicename, signalname))
         self._register_inputsignal(prefix, servicename, signalname, callback)
 
-    def send_command(self, servicename, signalname, value, send_command_as_retained=False):
+    def send_command(self, servicename, signalname, value, send_command_as_retained=False, codec=None):
         """Send a command.
 
         Primarily useful for apps (but is useful for resources to control other resources).
@@ -369,8 +911,9 @@ class BaseFramework:
         Args:
             servicename (str): destination service name
             signalname (str): destination signal name
-            value: Value to be sent. Is converted to a string before sending.
+            value: Value to be sent. Is converted to a string before sending (if no codec is given).
             send_command_as_retained (bool): Publish the command as retained.
+            codec (object or None): Payload codec. Defaults to text.
 
         Sends messages on topic: ``command/``\ *servicename*\ ``/``\ *signalname*
 
@@ -380,20 +923,468 @@ class BaseFramework:
 
 
         """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before send_command().")
         topic = constants.MQTT_TOPIC_TEMPLATE.format(
                     constants.PREFIX_COMMAND,
                     str(servicename).strip(),
                     str(signalname).strip())
-        try:
-            self.mqttclient.publish(topic, str(value), qos=self.qos, retain=send_command_as_retained)
-        except AttributeError:
-            raise ValueError("You must call start() before send_command().")
+        payload = str(value) if codec is None else codec.encode(value)
+        self._publish(topic, payload, self.qos, bool(send_command_as_retained))
         self.logger.debug("    Sending command. Topic: {}, payload: {!s}".format(topic, value))
-        time.sleep(constants.SLEEP_PUBLISH)
+
+    def send_command_many(self, servicename, commands, send_command_as_retained=False, codec=None):
+        """Send several commands to a service in one pass.
+
+        Args:
+            servicename (str): destination service name
+            commands: Mapping of signal name to value, or an iterable
+                of (signalname, value) pairs. The values are converted to strings before sending.
+            send_command_as_retained (bool): Publish the commands as retained.
+            codec (object or None): Payload codec, used for all the commands. Defaults to text.
+
+        The commands are put in the publish queue in one operation. For details,
+        see :meth:`.send_command`.
+
+        """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before send_command_many().")
+        if hasattr(commands, 'items'):
+            commands = commands.items()
+        servicename = str(servicename).strip()
+        retain = bool(send_command_as_retained)
+
+        messages = []
+        for signalname, value in commands:
+            topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_COMMAND,
+                                                         servicename,
+                                                         str(signalname).strip())
+            payload = str(value) if codec is None else codec.encode(value)
+            messages.append(Outgoingmessage(topic, payload, self.qos, retain))
+        self._publish_many(messages)
+        self.logger.debug("    Sending {} commands to service: {}".format(len(messages), servicename))
+
+    def request(self, servicename, signalname, value, timeout=constants.DEFAULT_REQUEST_TIMEOUT, codec=None):
+        """Send a command, and get a future that is resolved by the echo from the resource.
+
+        Args:
+            servicename (str): destination service name
+            signalname (str): destination signal name
+            value: Value to be sent. Is converted to a string before sending (if no codec is given).
+            timeout (numerical): Max time in seconds to wait for the echo.
+            codec (object or None): Payload codec, for the command and the echo. Defaults to text.
+
+        Returns:
+            A :class:`concurrent.futures.Future`. Its result is the echo payload (the decoded value
+            if using a codec). At timeout, the exception is a :exc:`.RequestTimeoutException`.
+
+        Sends a non-retained message on topic ``command/``\ *servicename*\ ``/``\ *signalname*, and
+        subscribes to the echo on ``data/``\ *servicename*\ ``/``\ *signalname* (once per topic).
+        Retained echo messages are ignored. Many requests can be outstanding at the same time.
+        Each echo resolves the oldest outstanding request for the command, as the echoes do not
+        carry any request identifier. An echo arriving after the timeout of its request will
+        therefore resolve the next request for the command.
+
+        When not using threaded networking, :meth:`.loop` must be called while waiting for the result.
+        Outstanding requests are cancelled by :meth:`.stop`.
+
+        """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before request().")
+        servicename = str(servicename).strip()
+        signalname = str(signalname).strip()
+        commandtopic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_COMMAND, servicename, signalname)
+        responsetopic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_DATA, servicename, signalname)
+        payload = str(value) if codec is None else codec.encode(value)
+
+        future = concurrent.futures.Future()
+        now = time.monotonic()
+        pendingrequest = Pendingrequest(future, commandtopic, codec, timeout, now, now + timeout)
+        with self._requests_lock:
+            is_new_responsetopic = responsetopic not in self._response_topics
+            self._response_topics.add(responsetopic)
+            self._pending_requests.setdefault(responsetopic, collections.deque()).append(pendingrequest)
+            self._request_counters['requests'] += 1
+        if is_new_responsetopic and not self._find_echo_registrations(responsetopic):
+            connection = self._get_echo_connection(responsetopic)
+            if connection._broker_connected:
+                connection._subscribe_to_response_topic(responsetopic)
+        if self._use_threaded_networking and self._request_thread is None:
+            self._request_stop_event = threading.Event()
+            self._request_thread = threading.Thread(target=self._run_request_timer,
+                                                    args=(self._request_stop_event,),
+                                                    name='{}-requests'.format(self.name),
+                                                    daemon=True)
+            self._request_thread.start()
+
+        try:
+            self._publish(commandtopic, payload, self.qos, False)
+        except Exception:
+            with self._requests_lock:
+                pendingrequests = self._pending_requests.get(responsetopic, ())
+                if pendingrequest in pendingrequests:
+                    pendingrequests.remove(pendingrequest)
+            raise
+        self.logger.debug("    Sending request. Topic: {}, payload: {!s}".format(commandtopic, value))
+        return future
+
+    def get_request_statistics(self):
+        """Get statistics for the requests sent by :meth:`.request`.
+
+        Returns:
+            A dict with the keys ``requests``, ``responses``, ``timeouts``, ``outstanding`` and
+            ``roundtrip_time``. The last one is a dict (key: command topic) of dicts with the
+            keys ``count``, ``mean``, ``min``, ``max``, ``p50``, ``p90``, ``p99`` and ``buckets``.
+            Times are in seconds.
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        with self._requests_lock:
+            result = dict(self._request_counters)
+            result['outstanding'] = sum(len(pendingrequests) for pendingrequests in self._pending_requests.values())
+            result['roundtrip_time'] = {commandtopic: histogram.get_statistics()
+                                        for commandtopic, histogram in self._request_roundtrip_times.items()}
+        return result
+
+    def _subscribe_to_response_topic(self, responsetopic):
+        """Subscribe to the echo topic for requests, while connected.
+
+        Args:
+            responsetopic (str): MQTT topic
+
+        """
+        self.logger.info("    Subscribing to MQTT topic for request echoes: '{}'".format(responsetopic))
+        result, mid = self.mqttclient.subscribe(responsetopic, self.qos)
+        if result == mqtt.MQTT_ERR_SUCCESS:
+            self._pending_subscriptions.add(mid)
+            self._subscribed_topics.add(responsetopic)
+        else:
+            self.logger.warning("Failed to subscribe. Error message: '{}'".format(mqtt.error_string(result)))
+
+    def _find_echo_registrations(self, responsetopic):
+        """Find the registered input signals (on any connection in the pool) giving the echoes for requests.
+
+        Args:
+            responsetopic (str): MQTT topic
+
+        Registrations in shared subscription groups are not included, as the echoes might be
+        delivered to other members of the group. Returns a list of :class:`.Inputsignalinfo` objects.
+
+        """
+        result = []
+        try:
+            result.append(self._inputsignal_infodict[responsetopic])
+        except KeyError:
+            pass
+        if len(self._inputsignal_trie):
+            result.extend(self._inputsignal_trie.match(responsetopic))
+        return [inputsignalinformation for inputsignalinformation in result
+                if inputsignalinformation.share_group is None]
+
+    def _get_echo_connection(self, responsetopic):
+        """Find the connection in the connection pool that resolves the requests for an echo topic.
+
+        Args:
+            responsetopic (str): MQTT topic
+
+        Echo topics not covered by a registered input signal are subscribed directly, by the
+        same connection as used for the commands (see :meth:`._get_connection_index`). This way
+        the subscription reaches the broker before the command. Overlapping registrations on
+        several connections give the echo on each of them, so only one of them resolves the request.
+
+        """
+        if not self._pool_connections:
+            return self
+        indices = [inputsignalinformation.connection_index
+                   for inputsignalinformation in self._find_echo_registrations(responsetopic)]
+        if not indices:
+            indices = [self._get_connection_index(responsetopic)]
+        if 0 in indices:
+            return self
+        return self._pool_connections[min(indices) - 1]
+
+    def _check_for_echo(self, topic, message):
+        """Resolve a request (if any) for an incoming message. Requests are stored by the owner of a connection pool.
+
+        Args:
+            topic (str): Topic of the incoming message
+            message (Paho MQTTMessage): The incoming message
+
+        """
+        owner = self._owner
+        if topic in owner._pending_requests and not message.retain and owner._get_echo_connection(topic) is self:
+            owner._resolve_request(topic, message.payload)
+
+    def _resolve_request(self, topic, payload):
+        """Resolve the oldest outstanding request for an incoming echo (if any), and record the round-trip time.
+
+        Args:
+            topic (str): Topic of the incoming message
+            payload (bytes): Payload of the incoming message
+
+        """
+        now = time.monotonic()
+        with self._requests_lock:
+            pendingrequests = self._pending_requests.get(topic)
+            if not pendingrequests:
+                return
+            pendingrequest = pendingrequests.popleft()
+            if not pendingrequests:
+                del self._pending_requests[topic]
+            self._request_counters['responses'] += 1
+            try:
+                histogram = self._request_roundtrip_times[pendingrequest.commandtopic]
+            except KeyError:
+                histogram = self._request_roundtrip_times[pendingrequest.commandtopic] = Histogram()
+            histogram.add(now - pendingrequest.sendtime)
+
+        future = pendingrequest.future
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            if pendingrequest.codec is None:
+                value = str(payload, encoding='utf-8', errors='replace').strip()
+            else:
+                value = pendingrequest.codec.decode(payload)
+        except Exception as err:
+            future.set_exception(err)
+            return
+        future.set_result(value)
+
+    def _expire_requests(self):
+        """Resolve the requests that have passed their timeout with a :exc:`.RequestTimeoutException`."""
+        if not self._pending_requests:
+            return
+        now = time.monotonic()
+        expired = []
+        with self._requests_lock:
+            for topic, pendingrequests in list(self._pending_requests.items()):
+                if all(pendingrequest.deadline > now for pendingrequest in pendingrequests):
+                    continue
+                remaining = collections.deque()
+                for pendingrequest in pendingrequests:
+                    if pendingrequest.deadline > now:
+                        remaining.append(pendingrequest)
+                    else:
+                        expired.append(pendingrequest)
+                if remaining:
+                    self._pending_requests[topic] = remaining
+                else:
+                    del self._pending_requests[topic]
+            self._request_counters['timeouts'] += len(expired)
+
+        for pendingrequest in expired:
+            if pendingrequest.future.set_running_or_notify_cancel():
+                pendingrequest.future.set_exception(RequestTimeoutException(
+                    "No echo for the command on {} within {} s.".format(pendingrequest.commandtopic,
+                                                                       pendingrequest.timeout)))
+
+    def _cancel_requests(self):
+        """Cancel all outstanding requests, and stop checking for timeouts. Is called by :meth:`.stop`."""
+        if self._request_thread is not None:
+            self._request_stop_event.set()
+            self._request_thread.join()
+            self._request_thread = None
+        with self._requests_lock:
+            pendingrequests = [pendingrequest for pendingrequests in self._pending_requests.values()
+                               for pendingrequest in pendingrequests]
+            self._pending_requests = {}
+        for pendingrequest in pendingrequests:
+            pendingrequest.future.cancel()
+
+    def _run_request_timer(self, stop_event):
+        """Check the timeouts of the requests, when using threaded networking. Runs in a separate thread."""
+        while not stop_event.wait(constants.REQUEST_CHECK_INTERVAL):
+            try:
+                self._expire_requests()
+            except Exception as err:
+                self.logger.warning("Failed to check the timeouts of requests. Error: '{}'".format(err))
+
+    def get_publishqueue_statistics(self):
+        """Get statistics for the outgoing publish queue.
+
+        Returns:
+            A dict with the keys ``depth`` (number of queued messages), ``max_depth``
+            (highest number of queued messages), ``maxsize``, ``policy``, ``inflight``,
+            ``max_inflight``, ``handed_over``, ``confirmed``, ``dropped_oldest``,
+            ``dropped_newest``, ``rejected`` and ``blocked``.
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        return self._publishqueue.get_statistics()
+
+    def get_callback_statistics(self):
+        """Get statistics for the callbacks, when using ``callback_executor``.
+
+        Returns:
+            A dict with the keys ``depth`` (number of queued or running callbacks), ``max_depth``,
+            ``maxsize``, ``kind``, ``workers``, ``rejected`` and ``callbacks``.
+            The ``callbacks`` item is a dict (key: registered topic) of dicts with the keys
+            ``count``, ``failed``, ``queued_time_total``, ``queued_time_max``, ``run_time_total``
+            and ``run_time_max``. Times are in seconds.
+
+            Returns ``None`` if not using ``callback_executor``.
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        if self._callbackexecutor is None:
+            return None
+        return self._callbackexecutor.get_statistics()
+
+    def get_publishlatency_statistics(self):
+        """Get statistics for the time from handing over outgoing messages to the MQTT client until confirmation.
+
+        Returns:
+            A dict with the keys ``per_qos`` and ``per_topic``. Each of them is a dict (key: QoS or topic)
+            of dicts with the keys ``count``, ``mean``, ``min``, ``max``, ``p50``, ``p90``, ``p99`` and
+            ``buckets`` (a list of [upper bound, count] pairs). Times are in seconds.
+
+        Increasing latencies indicate congestion in the broker or the network. With
+        ``publishlatency_interval`` the statistics are also published as JSON on the
+        topic ``data/<name>/_publishlatency``. The statistics are reset by :meth:`.start`.
+
+        """
+        return self._publishqueue.get_latency_statistics()
+
+    def get_metrics(self):
+        """Get the metrics for the message traffic.
+
+        Returns:
+            A dict with the keys ``elapsed_time``, ``messages_in``, ``messages_out``,
+            ``messages_in_per_second``, ``messages_out_per_second``, ``bytes_in``, ``bytes_out``,
+            ``messages_in_per_topic``, ``messages_out_per_topic``, ``callbacks``, ``failed_callbacks``,
+            ``connections``, ``reconnects``, ``dispatch_time`` and ``callback_time``.
+            See :meth:`.Metrics.get_metrics`.
+
+        With ``metrics_interval`` the metrics are also published as retained JSON on the
+        topic ``data/<name>/_metrics``. The metrics are reset by :meth:`.start`.
+
+        """
+        return self._metrics.get_metrics()
+
+    def get_connection_statistics(self):
+        """Get statistics for each connection to the broker, when using ``connection_pool_size``.
+
+        Returns:
+            A list of dicts (the first connection first) with the keys ``name``, ``connected``,
+            ``subscriptions`` (number of registered input signals), ``publishqueue``
+            (see :meth:`.get_publishqueue_statistics`) and ``metrics`` (see :meth:`.get_metrics`).
+
+        With ``connection_pool_size`` above 1, the registered signals are spread over several
+        MQTT connections, distributed by a hash of the signal name. All messages for a signal
+        (for example a command and its echo) use the same connection. The presence topic and
+        the 'last will' use the first connection only. The extra connections are :class:`.App`
+        objects named ``<name>-<index>``. Signals registered after :meth:`.start` are handled
+        by the first connection.
+
+        """
+        result = []
+        for connection in [self] + list(self._pool_connections):
+            if connection is self and self._pool_connections:
+                subscriptions = sum(1 for inputsignalinformation in self._inputsignal_infodict.values()
+                                    if not inputsignalinformation.connection_index)
+            else:
+                subscriptions = len(connection._inputsignal_infodict)
+            result.append({'name': connection.name,
+                           'connected': connection._broker_connected,
+                           'subscriptions': subscriptions,
+                           'publishqueue': connection.get_publishqueue_statistics(),
+                           'metrics': connection.get_metrics()})
+        return result
+
+    def _publish_statistics_if_due(self):
+        """Publish the metrics and the publication latency statistics, if configured and the interval has passed."""
+        if not self._broker_connected:
+            return
+        now = time.monotonic()
+        if self.publishlatency_interval is not None and now >= self._next_publishlatency_time:
+            self._next_publishlatency_time = now + self.publishlatency_interval
+            topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_DATA,
+                                                         self.name,
+                                                         constants.SIGNALNAME_PUBLISHLATENCY)
+            payload = json.dumps(self.get_publishlatency_statistics(), sort_keys=True)
+            self._publish(topic, payload, 0, False, force=True)
+        if self.metrics_interval is not None and now >= self._next_metrics_time:
+            self._next_metrics_time = now + self.metrics_interval
+            topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_DATA,
+                                                         self.name,
+                                                         constants.SIGNALNAME_METRICS)
+            payload = json.dumps(self.get_metrics(), sort_keys=True)
+            self._publish(topic, payload, 0, True, force=True)
+
+    def _run_statistics_timer(self, stop_event):
+        """Publish statistics periodically, when using threaded networking. Runs in a separate thread."""
+        while not stop_event.wait(constants.STATISTICS_CHECK_INTERVAL):
+            try:
+                self._publish_statistics_if_due()
+            except Exception as err:
+                self.logger.warning("Failed to publish statistics. Error: '{}'".format(err))
+
+    def get_latest(self, servicename, signalname, messagetype=constants.PREFIX_DATA):
+        """Get the latest incoming value for a topic, when using ``use_lastvaluecache``.
+
+        Args:
+            servicename (str): name of the service sending the data
+            signalname (str): name of the signal
+            messagetype (str): One of ``data`` (the default), ``dataavailable``,
+                ``commandavailable`` and ``resourceavailable``.
+
+        Returns:
+            A :class:`.Cachedvalue` with the attributes ``value`` and ``timestamp``
+            (from :func:`time.time`), or ``None`` if no value has been received.
+
+        Raises:
+            ValueError: If not using ``use_lastvaluecache``.
+
+        The value is always the payload string, also for signals registered with a codec or
+        in raw mode. It is stored before any filtering of the callbacks.
+
+        """
+        if self._lastvaluecache is None:
+            raise ValueError("You must set use_lastvaluecache and call start() before get_latest().")
+        return self._lastvaluecache.get(messagetype, str(servicename).strip(), str(signalname).strip())
+
+    def get_latest_values(self, messagetype=None):
+        """Iterate over the latest incoming values, when using ``use_lastvaluecache``.
+
+        Args:
+            messagetype (str or None): Give only values for this message type. Defaults to all.
+
+        Returns:
+            An iterator of tuples (messagetype, servicename, signalname, cachedvalue),
+            where *cachedvalue* is a :class:`.Cachedvalue`. It is a snapshot, and is
+            not affected by later incoming messages.
+
+        Raises:
+            ValueError: If not using ``use_lastvaluecache``.
+
+        """
+        if self._lastvaluecache is None:
+            raise ValueError("You must set use_lastvaluecache and call start() before get_latest_values().")
+        return self._lastvaluecache.snapshot(messagetype)
+
+    def get_offlinebuffer_statistics(self):
+        """Get statistics for the offline buffer, when using ``use_offlinebuffer``.
+
+        Returns:
+            A dict with the keys ``depth`` (number of stored messages), ``bytes``,
+            ``max_messages``, ``max_bytes``, ``put``, ``replaced``, ``dropped`` and ``taken``.
+
+            Returns ``None`` if not using ``use_offlinebuffer``.
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        if self._offlinebuffer is None:
+            return None
+        return self._offlinebuffer.get_statistics()
 
     def _register_inputsignal(self, messagetype, servicename, signalname, callback,
                               callback_on_change_only=False, echo=False, send_echo_as_retained=False,
-                              defaultvalue=None):
+                              defaultvalue=None, codec=None, raw=None, share_group=None):
         """Register a callback for an incoming MQTT message.
 
         Args:
@@ -406,6 +1397,9 @@ class BaseFramework:
             send_echo_as_retained (bool): True if the echo should be published as retained.
             defaultvalue: Value to be echoed on startup. Set to None to avoid sending.
                   The value is converted to a string before sending. It will be updated by _on_incoming_message().
+            codec (object or None): Payload codec. Defaults to text.
+            raw (str or None): Give the undecoded payload to the callback, as ``'bytes'`` or ``'memoryview'``.
+            share_group (str or None): Name of a shared subscription group.
 
         For details on the callback, see the class documentation.
 
@@ -416,21 +1410,48 @@ class BaseFramework:
 
         For example: ``data/climateservice/actualindoortemperature``.
 
+        The *servicename* and *signalname* can contain the MQTT wildcards ``+`` and ``#``.
+        Topics with wildcards are stored in a :class:`.TopicTrie` for routing.
+
+        Returns the :class:`.Inputsignalinfo` object.
+
         """
         topic = constants.MQTT_TOPIC_TEMPLATE.format(str(messagetype).strip(),
                                                      str(servicename).strip(),
                                                      str(signalname).strip())
-        self._inputsignal_infodict[topic] = Inputsignalinfo(str(messagetype).strip(),
-                                                            str(servicename).strip(),
-                                                            str(signalname).strip(),
-                                                            callback,
-                                                            bool(callback_on_change_only),
-                                                            bool(echo),
-                                                            bool(send_echo_as_retained),
-                                                            defaultvalue)
+        validate_topicfilter(topic)
+        inputsignalinformation = Inputsignalinfo(str(messagetype).strip(),
+                                                 str(servicename).strip(),
+                                                 str(signalname).strip(),
+                                                 callback,
+                                                 bool(callback_on_change_only),
+                                                 bool(echo),
+                                                 bool(send_echo_as_retained),
+                                                 defaultvalue,
+                                                 codec,
+                                                 raw,
+                                                 share_group)
+        self._add_inputsignalinformation(topic, inputsignalinformation)
+        return inputsignalinformation
+
+    def _add_inputsignalinformation(self, topic, inputsignalinformation):
+        """Store a registered input signal, for subscription and routing of incoming messages.
+
+        Args:
+            topic (str): MQTT topic (can contain wildcards)
+            inputsignalinformation (Inputsignalinfo): The registered input signal
+
+        """
+        self._inputsignal_infodict[topic] = inputsignalinformation
+        if is_wildcard_topicfilter(topic):
+            self._inputsignal_trie.insert(topic, inputsignalinformation)
+            self._dispatch_table.clear()  # Recreated at incoming messages
+            self._dispatch_cache.clear()
+        else:
+            self._create_dispatchentry(topic.encode('utf-8'))
 
     def _register_outputsignal(self, messagetype, servicename, signalname,
-                               defaultvalue, send_as_retained):
+                               defaultvalue, send_as_retained, codec=None):
         """Registering outgoing MQTT messages.
 
         This is typically used for automatically send availability information.
@@ -443,6 +1464,7 @@ class BaseFramework:
             defaultvalue: Value to be sent on startup. Set to None to avoid sending.
                   The value is converted to a string before sending.
             send_as_retained (bool): True if the signal should be published as retained.
+            codec (object or None): Payload codec. Defaults to text.
 
         Publishes to: *messagetype*\ ``/``\ *servicename*\ ``/``\ *signalname*
 
@@ -451,42 +1473,351 @@ class BaseFramework:
         There is also a mechanism to automatically publish availability topics,
         for example: ``dataavailable/climateservice/actualindoortemperature``.
 
+        Returns the :class:`.Outputsignalinfo` object.
 
         """
         topic = constants.MQTT_TOPIC_TEMPLATE.format(str(messagetype).strip(),
                                                      str(servicename).strip(),
                                                      str(signalname).strip())
-        self._outputsignal_infodict[topic] = Outputsignalinfo(str(messagetype).strip(),
-                                                              str(servicename).strip(),
-                                                              str(signalname).strip(),
-                                                              defaultvalue,
-                                                              bool(send_as_retained))
+        outputsignalinformation = Outputsignalinfo(str(messagetype).strip(),
+                                                   str(servicename).strip(),
+                                                   str(signalname).strip(),
+                                                   defaultvalue,
+                                                   bool(send_as_retained),
+                                                   codec)
+        self._outputsignal_infodict[topic] = outputsignalinformation
+        return outputsignalinformation
 
     def _publish_capablities_and_defaultvalues(self):
         """To be overrided"""
         pass
 
-    def _subscribe_to_inputsignals(self):
-        """Do the subscription to input signals"""
-        for signalname, inputsignalinformation in self._inputsignal_infodict.items():
+    def _publish(self, topic, payload, qos, retain, force=False):
+        """Put an outgoing MQTT message in the publish queue, and hand over
+        queued messages to the MQTT client as far as the in-flight window allows.
+
+        Args:
+            topic (str): MQTT topic
+            payload (str): MQTT payload
+            qos (int): MQTT quality of service
+            retain (bool): True if the message should be published as retained.
+            force (bool): Ignore the publish queue size limit. Used for messages
+                generated by the framework itself.
+
+        """
+        self._publish_many([Outgoingmessage(topic, payload, qos, retain)], force)
+
+    def _publish_many(self, messages, force=False):
+        """Put several outgoing MQTT messages in the publish queue, and flush the queue once.
+
+        Args:
+            messages (list of Outgoingmessage): Messages to be published.
+            force (bool): Ignore the publish queue size limit.
+
+        """
+        if self._pool_connections:
+            messages = self._publish_on_pool_connections(messages, force)
+            if not messages:
+                return
+        if self._store_offline(messages, force):
+            return
+        if self._use_threaded_networking:
+            wait = None
+            in_network_activity = threading.current_thread() is getattr(self.mqttclient, '_thread', None)
+        else:
+            wait = self._loop_while_connected
+            in_network_activity = self._is_looping
+        timeout = 0 if in_network_activity else self.publishqueue_timeout
+        self._publishqueue.put_many(messages, force=force, wait=wait, timeout=timeout)
+        self._flush_publishqueue()
+
+    def _loop_while_connected(self):
+        """Run the network activities while blocking on a full publish queue, without threaded networking.
+
+        Raises:
+            PublishQueueFullException: If not connected to the broker, as the queue can not drain.
+
+        """
+        if not self._broker_connected:
+            raise PublishQueueFullException("The publish queue is full, and not connected to the broker. "
+                                            "Host: {}, Port: {}".format(self.host, self.port))
+        self.loop()
+
+    def _publish_on_pool_connections(self, messages, force=False):
+        """Hand over outgoing MQTT messages to the extra connections in the connection pool.
+
+        Args:
+            messages (list of Outgoingmessage): Messages to be published.
+            force (bool): Ignore the publish queue size limit.
+
+        The presence topic is always published on the first connection, as it has the 'last will'.
+
+        Returns a list of the messages for the first connection (self).
+
+        """
+        own_messages = []
+        pool_messages = {}  # Key: connection index, Item: list of Outgoingmessage
+        for message in messages:
+            if message.topic == self._servicepresence_topic:
+                index = 0
+            else:
+                index = self._get_connection_index(message.topic)
+            if index:
+                pool_messages.setdefault(index, []).append(message)
+            else:
+                own_messages.append(message)
+        for index, messages_for_connection in pool_messages.items():
+            self._pool_connections[index - 1]._publish_many(messages_for_connection, force)
+        return own_messages
+
+    def _store_offline(self, messages, force=False):
+        """Store outgoing MQTT messages in the offline buffer, if disconnected (and using ``use_offlinebuffer``).
+
+        When there are stored messages, also new messages are stored (to keep the order).
+
+        Args:
+            messages (list of Outgoingmessage): Messages to be published.
+            force (bool): Messages generated by the framework itself, that not should be stored.
+
+        Returns True if the messages were stored.
+
+        """
+        offlinebuffer = self._offlinebuffer
+        if offlinebuffer is None or force:
+            return False
+        with self._offlinebuffer_lock:
+            if self._broker_connected and not len(offlinebuffer):
+                return False
+            for message in messages:
+                offlinebuffer.put(message, self._get_offline_policy(message.topic))
+        return True
+
+    def _get_offline_policy(self, topic):
+        """Find the offline buffer policy for an outgoing topic. Defaults to storing all messages."""
+        try:
+            return self._outputsignal_infodict[topic].offline_policy
+        except KeyError:
+            return constants.OFFLINE_POLICY_ALL
+
+    def _replay_offlinebuffer(self):
+        """Move stored messages from the offline buffer to the publish queue, as far as there is room."""
+        offlinebuffer = self._offlinebuffer
+        if offlinebuffer is None or not len(offlinebuffer):
+            return
+        with self._offlinebuffer_lock:
+            room = self._publishqueue.maxsize - len(self._publishqueue)
+            if room > 0 and self._broker_connected:
+                messages = offlinebuffer.take(room)
+                self._publishqueue.put_many(messages, force=True)
+                self.logger.debug("    Publishing messages from the offline buffer. Number of messages: {}".format(
+                    len(messages)))
+
+    def _flush_publishqueue(self, ignore_inflight_limit=False):
+        """Hand over queued messages to the MQTT client, as far as the in-flight window allows.
+
+        Args:
+            ignore_inflight_limit (bool): Hand over all queued messages.
+
+        Only one thread at a time is handing over messages, in order to keep
+        the message order. Calls during an ongoing flush makes the flushing
+        thread do another round.
+
+        """
+        with self._flush_lock:
+            if self._is_flushing:
+                self._flush_requested = True
+                return
+            self._is_flushing = True
+
+        try:
+            while True:
+                self._hand_over_queued_messages(ignore_inflight_limit)
+                with self._flush_lock:
+                    if not self._flush_requested:
+                        self._is_flushing = False
+                        return
+                    self._flush_requested = False
+        except Exception:
+            with self._flush_lock:
+                self._is_flushing = False
+            raise
+
+    def _hand_over_queued_messages(self, ignore_inflight_limit):
+        """Publish queued messages using the MQTT client. Is called by :meth:`._flush_publishqueue`."""
+        while self._broker_connected:
+            message = self._publishqueue.get(ignore_inflight_limit)
+            if message is None:
+                return
+            sendtime = time.monotonic()
+            if self._use_mqttv5:
+                publish_topic, properties = self._get_mqttv5_publish_arguments(message)
+                messageinfo = self.mqttclient.publish(publish_topic,
+                                                      message.payload,
+                                                      qos=message.qos,
+                                                      retain=message.retain,
+                                                      properties=properties)
+            else:
+                messageinfo = self.mqttclient.publish(message.topic,
+                                                      message.payload,
+                                                      qos=message.qos,
+                                                      retain=message.retain)
+            if messageinfo.rc == mqtt.MQTT_ERR_NO_CONN and message.qos == 0:
+                # The MQTT client does not store QoS 0 messages when disconnected
+                self._publishqueue.putback(message)
+                return
+            self._publishqueue.mark_inflight(messageinfo.mid, message.qos, message.topic, sendtime)
+            self._metrics.add_outgoing(message.topic, get_payload_size(message.payload))
+
+    def _get_mqttv5_publish_arguments(self, message):
+        """Find the topic and properties for publishing a message using MQTT v5.
+
+        Frequently published QoS 0 topics are given topic aliases. The first message
+        with a new alias carries the full topic, and later messages an empty topic.
+        Messages with higher QoS never use topic aliases.
+
+        Args:
+            message (Outgoingmessage): Message to be published.
+
+        Returns the tuple (topic, properties), where the properties can be ``None``.
+
+        """
+        topic = message.topic
+        if message.qos == 0:
+            try:
+                return '', self._topic_alias_properties[topic]
+            except KeyError:
+                pass
+            if len(self._topic_alias_properties) < self._topic_alias_limit:
+                count = self._topic_publication_counts.get(topic, 0) + 1
+                self._topic_publication_counts[topic] = count
+                if count >= self.topic_alias_threshold:
+                    alias = len(self._topic_alias_properties) + 1
+                    properties = self._create_publish_properties(topic, alias)
+                    self._topic_alias_properties[topic] = properties
+                    self.logger.debug("    Using topic alias {} for topic: {}".format(alias, topic))
+                    return topic, properties
+
+        try:
+            return topic, self._publish_properties[topic]
+        except KeyError:
+            properties = self._create_publish_properties(topic)
+            self._publish_properties[topic] = properties
+            return topic, properties
+
+    def _create_publish_properties(self, topic, alias=None):
+        """Create MQTT v5 properties for publishing on a topic.
+
+        Args:
+            topic (str): MQTT topic
+            alias (int or None): Topic alias
+
+        Returns a Paho Properties object, or ``None`` if no properties are needed.
+
+        """
+        try:
+            message_expiry = self._outputsignal_infodict[topic].message_expiry
+        except KeyError:
+            message_expiry = None
+        if message_expiry is None:
+            message_expiry = self.message_expiry
+        if alias is None and message_expiry is None:
+            return None
+
+        properties = Properties(PacketTypes.PUBLISH)
+        if alias is not None:
+            properties.TopicAlias = alias
+        if message_expiry is not None:
+            properties.MessageExpiryInterval = int(message_expiry)
+        return properties
+
+    def _subscribe_to_inputsignals(self, session_present=False):
+        """Do the subscription to input signals, in as few SUBSCRIBE packets as possible.
+
+        Args:
+            session_present (bool): The broker has a persistent session for this client.
+                Then only topics not subscribed earlier by this MQTT client are subscribed.
+
+        """
+        topics = []
+        for inputsignalinformation in self._inputsignal_infodict.values():
+            if self._pool_connections and inputsignalinformation.connection_index:
+                continue  # Subscribed by another connection in the connection pool
             subscription_topic = constants.MQTT_TOPIC_TEMPLATE.format(
                                     inputsignalinformation.messagetype,
                                     inputsignalinformation.servicename,
                                     inputsignalinformation.signalname)
-            self.logger.info("    Subscribing to MQTT topic: '{}'".format(subscription_topic))
-            self.mqttclient.subscribe(subscription_topic, qos=self.qos)
+            if inputsignalinformation.share_group is not None:
+                # The incoming messages have the topic without the prefix
+                subscription_topic = constants.SHARED_SUBSCRIPTION_TEMPLATE.format(
+                                        inputsignalinformation.share_group,
+                                        subscription_topic)
+            if session_present and subscription_topic in self._subscribed_topics:
+                continue
+            topics.append(subscription_topic)
+        owner = self._owner
+        for responsetopic in list(owner._response_topics):
+            if owner._find_echo_registrations(responsetopic) or \
+                    owner._get_echo_connection(responsetopic) is not self or \
+                    (session_present and responsetopic in self._subscribed_topics):
+                continue
+            topics.append(responsetopic)
+
+        if session_present:
+            self.logger.info("    The broker has a session present. Subscribing to {} new MQTT topics.".format(
+                len(topics)))
+        for batch in self._get_subscription_batches(topics):
+            self.logger.info("    Subscribing to {} MQTT topics: '{}'".format(len(batch), "', '".join(batch)))
+            result, mid = self.mqttclient.subscribe([(topic, self.qos) for topic in batch])
+            if result == mqtt.MQTT_ERR_SUCCESS:
+                self._pending_subscriptions.add(mid)
+                self._subscribed_topics.update(batch)
+            else:
+                self.logger.warning("Failed to subscribe. Error message: '{}'".format(mqtt.error_string(result)))
+
+    def _get_subscription_batches(self, topics):
+        """Divide topics into batches, each fitting in a SUBSCRIBE packet.
+
+        Args:
+            topics (list of str): Topics to subscribe to
+
+        The batches are limited by ``subscribe_batch_size``, and by the max packet size
+        given by the broker (MQTT v5).
+
+        Returns a list of lists of topics.
+
+        """
+        batches = []
+        batch = []
+        packet_size = constants.SUBSCRIBE_PACKET_OVERHEAD
+        for topic in topics:
+            topic_size = len(topic.encode('utf-8')) + constants.SUBSCRIBE_TOPIC_OVERHEAD
+            if batch and (len(batch) >= self.subscribe_batch_size or
+                          (self._broker_maximum_packet_size is not None and
+                           packet_size + topic_size > self._broker_maximum_packet_size)):
+                batches.append(batch)
+                batch = []
+                packet_size = constants.SUBSCRIBE_PACKET_OVERHEAD
+            batch.append(topic)
+            packet_size += topic_size
+        if batch:
+            batches.append(batch)
+        return batches
 
     def _set_broker_connectionstatus(self, broker_connected):
         """
         Set information whether the broker is connected.
         This is triggering a callback to the user script.
 
-        The information is not stored in the framework, it is the responsibility of the user script.
+        The framework stores the information only for deciding when to hand over
+        messages from the publish queue. Otherwise it is the responsibility of the user script.
 
         Args:
             broker_connected (bool): Indicates whether the broker is connected or not
 
         """
+        self._broker_connected = bool(broker_connected)
+        if not broker_connected:
+            self._metrics.add_disconnection()
         if self.on_broker_connectionstatus_info is not None:
             self.logger.debug("    Setting broker connection status to user script: {}".format(broker_connected))
             try:
@@ -500,98 +1831,402 @@ class BaseFramework:
     def _on_incoming_message(self, mqttclient, userdata, message):
         """MQTT callback at incoming messages.
 
-        Executes a preregistered callback, and publishes an echo (if configured).
+        Executes the preregistered callbacks (for all registrations matching the
+        topic), and publishes an echo (if configured).
 
         Updates the default value for echoed signals if configured.
 
         Method signature according to Paho documentation.
 
         """
+        starttime = time.monotonic()
+        is_registered = False
+        try:
+            if self._owner._pending_requests:
+                self._check_for_echo(str(message.topic), message)
+            is_registered = self._dispatch_incoming_message(message)
+        finally:
+            self._metrics.add_incoming(str(message.topic) if is_registered else None,
+                                       len(message.payload), time.monotonic() - starttime)
+
+    def _dispatch_incoming_message(self, message):
+        """Run the callbacks for an incoming message. Is called by :meth:`._on_incoming_message`.
 
+        Args:
+            message (Paho MQTTMessage): The incoming message
+
+        Returns True if the topic matches a registered input signal, otherwise False.
+
+        """
         ## Extract information from the message ##
-        inputpayload = str(message.payload, encoding='utf-8').strip()  # Paho MQTT delivers bytes for Python3
+        inputpayload = str(message.payload, encoding='utf-8', errors='replace').strip()  # Paho MQTT delivers bytes
         inputtopic = str(message.topic).strip()
 
         topic_hierarchy = inputtopic.split(constants.MQTT_TOPIC_SEPARATOR)
         if len(topic_hierarchy) != constants.MQTT_TOPIC_DEPTH:
             self.logger.warning("Received wrong MQTT topic structure: {}, payload: '{}'".format(
                     inputtopic, inputpayload))
-            return
+            return False
 
         self.logger.debug("Received message. Topic: {}, payload: '{}'".format(inputtopic, inputpayload))
 
-        try:
-            inputsignalinformation = self._inputsignal_infodict[inputtopic]
-        except KeyError:
+        inputsignalinformations = self._find_inputsignalinformations(inputtopic)
+        if not inputsignalinformations:
+            if inputtopic in self._owner._response_topics:
+                return False
             self.logger.warning("Received unregistered input message. Topic: {}, payload: '{}'".format(
                     inputtopic, inputpayload))
-            return
+            return False
 
         messagetype, servicename, signalname = topic_hierarchy
         messagetype = messagetype.strip()
         servicename = servicename.strip()
         signalname = signalname.strip()
 
+        if self._lastvaluecache is not None:
+            self._update_lastvaluecache(messagetype, servicename, signalname, inputpayload)
+        for inputsignalinformation in inputsignalinformations:
+            if inputsignalinformation.raw is not None:
+                value = inputsignalinformation.get_raw_payload(message.payload)
+            elif inputsignalinformation.codec is None:
+                value = inputpayload
+            else:
+                try:
+                    value = inputsignalinformation.codec.decode(message.payload)
+                except Exception as err:
+                    self.logger.warning("Failed to decode payload. Topic: {}, codec: {!r}. Error: '{}'".format(
+                        inputtopic, inputsignalinformation.codec, err))
+                    continue
+            self._handle_inputsignal(inputsignalinformation, inputtopic,
+                                     messagetype, servicename, signalname, value)
+        return True
+
+    def _on_incoming_message_fast(self, mqttclient, userdata, message):
+        """MQTT callback at incoming messages, when using fast dispatch.
+
+        Does a single dictionary lookup on the undecoded topic. The payload is
+        decoded only for registered topics. Otherwise the same as :meth:`._on_incoming_message`.
+
+        Method signature according to Paho documentation.
+
+        """
+        starttime = time.monotonic()
+        rawtopic = message._topic  # Undecoded topic (bytes) in Paho
+        if self._owner._pending_requests:
+            self._check_for_echo(rawtopic.decode('utf-8', 'replace'), message)
+        try:
+            dispatchentry = self._dispatch_table[rawtopic]
+        except KeyError:
+            try:
+                dispatchentry = self._dispatch_cache[rawtopic]
+                self._dispatch_cache.move_to_end(rawtopic)
+            except KeyError:
+                dispatchentry = self._create_dispatchentry(rawtopic)
+        if dispatchentry is None:
+            inputtopic = rawtopic.decode('utf-8', 'replace')
+            if inputtopic not in self._owner._response_topics:
+                self.logger.warning("Received unregistered input message or wrong MQTT topic structure. "
+                                    "Topic: {}".format(inputtopic))
+            self._metrics.add_incoming(None, len(message.payload), time.monotonic() - starttime)
+            return
+
+        inputpayload = None
+        messagetype, servicename, signalname = dispatchentry.topic_hierarchy
+        if self._lastvaluecache is not None:
+            inputpayload = str(message.payload, encoding='utf-8', errors='replace').strip()
+            self._update_lastvaluecache(messagetype, servicename, signalname, inputpayload)
+        for inputsignalinformation in dispatchentry.inputsignalinformations:
+            if inputsignalinformation.raw is not None:
+                value = inputsignalinformation.get_raw_payload(message.payload)
+            elif inputsignalinformation.codec is None:
+                if inputpayload is None:
+                    inputpayload = str(message.payload, encoding='utf-8', errors='replace').strip()
+                value = inputpayload
+            else:
+                try:
+                    value = inputsignalinformation.codec.decode(message.payload)
+                except Exception as err:
+                    self.logger.warning("Failed to decode payload. Topic: {}, codec: {!r}. Error: '{}'".format(
+                        dispatchentry.topic, inputsignalinformation.codec, err))
+                    continue
+            self._handle_inputsignal(inputsignalinformation, dispatchentry.topic,
+                                     messagetype, servicename, signalname, value)
+        self._metrics.add_incoming(dispatchentry.topic, len(message.payload), time.monotonic() - starttime)
+
+    def _update_lastvaluecache(self, messagetype, servicename, signalname, value):
+        """Store an incoming value in the last value cache, for data and availability messages.
+
+        Arguments are described in :meth:`._handle_inputsignal`. The value is always the
+        payload string, regardless of any codec or raw mode in the registrations.
+
+        """
+        if messagetype not in constants.LASTVALUECACHE_MESSAGETYPES:
+            return
+        self._lastvaluecache.put(messagetype, servicename, signalname, value)
+
+    def _create_dispatchentry(self, rawtopic):
+        """Calculate routing information for an incoming topic, and store it for fast dispatch.
+
+        Args:
+            rawtopic (bytes): Undecoded topic of the incoming message
+
+        Returns a :class:`.Dispatchentry`, or ``None`` if the topic is not registered
+        or has the wrong structure.
+
+        Exactly registered topics are stored in the dispatch table. Other topics are stored
+        in the dispatch cache, where the least recently used topic is evicted when it is full.
+
+        """
+        topic = rawtopic.decode('utf-8')
+        inputsignalinformations = self._find_inputsignalinformations(topic)
+        topic_hierarchy = tuple(topic.split(constants.MQTT_TOPIC_SEPARATOR))
+        if not inputsignalinformations or len(topic_hierarchy) != constants.MQTT_TOPIC_DEPTH:
+            dispatchentry = None
+        elif topic in self._inputsignal_infodict:
+            dispatchentry = Dispatchentry(topic,
+                                          self._inputsignal_infodict[topic].topic_hierarchy,
+                                          tuple(inputsignalinformations))
+        else:
+            dispatchentry = Dispatchentry(topic, topic_hierarchy, tuple(inputsignalinformations))
+
+        if topic in self._inputsignal_infodict:
+            self._dispatch_table[rawtopic] = dispatchentry
+            return dispatchentry
+        if len(self._dispatch_cache) >= constants.MAX_DISPATCH_CACHE_SIZE:
+            try:
+                self._dispatch_cache.popitem(last=False)
+            except KeyError:  # Cleared by another thread
+                pass
+        self._dispatch_cache[rawtopic] = dispatchentry
+        return dispatchentry
+
+    def _find_inputsignalinformations(self, inputtopic):
+        """Find the registered input signals matching an incoming MQTT topic.
+
+        Args:
+            inputtopic (str): Topic of the incoming message
+
+        Exact topics are looked up in a dictionary, and topics with wildcards
+        in a :class:`.TopicTrie`.
+
+        Returns a list of :class:`.Inputsignalinfo` objects.
+
+        """
+        result = []
+        try:
+            result.append(self._inputsignal_infodict[inputtopic])
+        except KeyError:
+            pass
+        if len(self._inputsignal_trie):
+            result.extend(self._inputsignal_trie.match(inputtopic))
+        if self._pool_connections:
+            # Overlapping wildcard subscriptions can give messages for signals handled by other connections
+            result = [inputsignalinformation for inputsignalinformation in result
+                      if not inputsignalinformation.connection_index]
+        return result
+
+    def _handle_inputsignal(self, inputsignalinformation, inputtopic,
+                            messagetype, servicename, signalname, inputpayload):
+        """Check for payload changes and callback interval (if configured), and run the registered callback for an incoming message.
+
+        Args:
+            inputsignalinformation (Inputsignalinfo): The registration matching the incoming message
+            inputtopic (str): Topic of the incoming message
+            messagetype (str): Message type (first level) of the incoming topic
+            servicename (str): Service name (second level) of the incoming topic
+            signalname (str): Signal name (third level) of the incoming topic
+            inputpayload (str): Payload of the incoming message (decoded value if using a codec,
+                bytes or memoryview in raw mode)
+
+        """
         ## Check for input payload changes (compared to last message) ##
-        if inputsignalinformation.callback_on_change_only:
-            if inputsignalinformation.last_payload is not None:
-                if inputsignalinformation.last_payload == inputpayload:
-                    self.logger.debug("The payload has not changed, skipping callback. Topic: {}, payload: '{}'".format(
-                            inputtopic, inputpayload))
-                    return
-            inputsignalinformation.last_payload = inputpayload
-
-        ## Run registered callback ##
+        if inputsignalinformation.use_callback_filter and \
+                not inputsignalinformation.filter_payload(inputtopic, inputpayload):
+            self.logger.debug("The payload has not changed enough, skipping callback. Topic: {}, payload: '{}'".format(
+                    inputtopic, inputpayload))
+            return
+
+        self._run_callback(inputsignalinformation, inputtopic, messagetype, servicename, signalname, inputpayload)
+
+    def _run_callback(self, inputsignalinformation, inputtopic,
+                      messagetype, servicename, signalname, inputpayload):
+        """Run the registered callback for an incoming message, and publish an echo (if configured).
+
+        Arguments are described in :meth:`._handle_inputsignal`.
+
+        """
+        if self._callbackexecutor is not None:
+            self._submit_callback(inputsignalinformation, inputtopic,
+                                  messagetype, servicename, signalname, inputpayload)
+            return
+
+        arguments = self._get_callback_arguments(self._owner, inputsignalinformation, inputtopic,
+                                                 messagetype, servicename, signalname, inputpayload)
+        starttime = time.monotonic()
         try:
-            returnvalue = inputsignalinformation.callback(self,
-                                                          messagetype,
-                                                          servicename,
-                                                          signalname,
-                                                          inputpayload)
+            returnvalue = inputsignalinformation.callback(*arguments)
         except Exception as err:
+            self._metrics.add_callback(time.monotonic() - starttime, failed=True)
             self.logger.warning("Failed to run callback for topic: {}, payload: {}. Error: '{}'".format(
                                 inputtopic, inputpayload, err))
             return
+        self._metrics.add_callback(time.monotonic() - starttime)
+
+        self._send_echo(inputsignalinformation, messagetype, servicename, signalname, inputpayload, returnvalue)
+
+    def _get_callback_arguments(self, resource_or_app, inputsignalinformation, inputtopic,
+                                messagetype, servicename, signalname, inputpayload):
+        """Get the arguments to the registered callback, depending on the raw mode.
+
+        Args:
+            resource_or_app: The first argument to the callback
+
+        Other arguments are described in :meth:`._handle_inputsignal`.
+
+        Returns a tuple.
+
+        """
+        if inputsignalinformation.raw is None:
+            return (resource_or_app, messagetype, servicename, signalname, inputpayload)
+        return (resource_or_app, inputtopic, inputpayload)
+
+    def _submit_callback(self, inputsignalinformation, inputtopic,
+                         messagetype, servicename, signalname, inputpayload):
+        """Queue the registered callback for running in the callback executor.
+
+        Callbacks for the same topic are run in order. The echo (if configured) is
+        published when the callback is finished.
+
+        Arguments are described in :meth:`._handle_inputsignal`.
+
+        """
+        callbackexecutor = self._callbackexecutor
+        if callbackexecutor is None:
+            self.logger.warning("Dropping incoming message, as the callback executor is shut down. "
+                                "Topic: {}, payload: {}".format(inputtopic, inputpayload))
+            return
+        if callbackexecutor.kind == constants.CALLBACK_EXECUTOR_PROCESS:
+            resource_or_app = None  # Can not be transferred to another process
+        else:
+            resource_or_app = self._owner
+        on_finished = functools.partial(self._on_callback_finished, inputsignalinformation, inputtopic,
+                                        messagetype, servicename, signalname, inputpayload)
+        try:
+            callbackexecutor.submit(inputtopic,
+                                    constants.MQTT_TOPIC_TEMPLATE.format(*inputsignalinformation.topic_hierarchy),
+                                    inputsignalinformation.callback,
+                                    self._get_callback_arguments(resource_or_app, inputsignalinformation,
+                                                                 inputtopic, messagetype, servicename,
+                                                                 signalname, inputpayload),
+                                    on_finished)
+        except (CallbackQueueFullException, RuntimeError) as err:
+            # RuntimeError if the executor is shut down by stop() while dispatching
+            self.logger.warning("Dropping incoming message. Topic: {}, payload: {}. Error: '{}'".format(
+                                inputtopic, inputpayload, err))
+
+    def _on_callback_finished(self, inputsignalinformation, inputtopic,
+                              messagetype, servicename, signalname, inputpayload,
+                              returnvalue, error):
+        """Publish the echo after a callback in the callback executor. Runs in a worker thread.
+
+        Arguments are described in :meth:`._handle_inputsignal` and :meth:`.CallbackExecutor.submit`.
+        The run time is recorded by the callback executor (see :meth:`.get_callback_statistics`).
+
+        """
+        self._metrics.add_callback(None, failed=error is not None)
+        if error is not None:
+            self.logger.warning("Failed to run callback for topic: {}, payload: {}. Error: '{}'".format(
+                                inputtopic, inputpayload, error))
+            return
+        try:
+            self._send_echo(inputsignalinformation, messagetype, servicename, signalname, inputpayload, returnvalue)
+        except Exception as err:
+            self.logger.warning("Failed to send echo for topic: {}, payload: {}. Error: '{}'".format(
+                                inputtopic, inputpayload, err))
+
+    def _send_echo(self, inputsignalinformation, messagetype, servicename, signalname, inputpayload, returnvalue):
+        """Publish an echo for an incoming message (if configured).
+
+        Args:
+            returnvalue: Return value from the callback. If ``None``, the input payload is echoed.
 
-        ## Send echo message ##
+        Other arguments are described in :meth:`._handle_inputsignal`.
+
+        """
         if inputsignalinformation.echo:
-            echo_payload = inputpayload if returnvalue is None else str(returnvalue)
+            echo_value = inputpayload if returnvalue is None else returnvalue
+            echo_payload = inputsignalinformation.encode(echo_value)
             echo_messagetype = constants.ECHO_MESSAGETYPES[messagetype]
             echo_publication_topic = constants.MQTT_TOPIC_TEMPLATE.format(
                                         echo_messagetype,
                                         servicename,
                                         signalname)
-            self.mqttclient.publish(echo_publication_topic,
-                                    echo_payload,
-                                    qos=self.qos,
-                                    retain=inputsignalinformation.send_echo_as_retained)
+            self._owner._publish(echo_publication_topic,
+                                 echo_payload,
+                                 self.qos,
+                                 inputsignalinformation.send_echo_as_retained,
+                                 force=True)
             self.logger.debug("    Sending message echo. Topic: {}, payload: {}'".
                               format(echo_publication_topic, echo_payload))
             if inputsignalinformation.defaultvalue is not None:
                 inputsignalinformation.defaultvalue = echo_payload
 
-    def _on_connect(self, mqttclient, userdata, flags, rc):
+    def _on_connect(self, mqttclient, userdata, flags, rc, properties=None):
         """MQTT callback at connection attempts.
 
         This callback is responsible for doing the subscriptions, and to
         publish capabilities and default values.
 
-        Method signature according to Paho documentation.
+        Method signature according to Paho documentation. The *properties*
+        are given for MQTT v5, and then the *rc* is a reason code object.
 
         """
+        result_text = mqtt.connack_string(rc) if properties is None else str(rc)
         if rc != mqtt.CONNACK_ACCEPTED:
             self.logger.warning("  Failed connection to MQTT broker. Host: {}, Port: {}, Result: '{}'".format(
-                mqttclient._host, mqttclient._port, mqtt.connack_string(rc)))
+                mqttclient._host, mqttclient._port, result_text))
+            self._schedule_reconnect()
             self._set_broker_connectionstatus(False)
             return
 
         self.logger.info("  Successful connection to MQTT broker. Host: {}, Port: {}, Result: '{}'".format(
-            mqttclient._host, mqttclient._port, mqtt.connack_string(rc)))
+            mqttclient._host, mqttclient._port, result_text))
+        if properties is not None:
+            self._set_mqttv5_connection_properties(properties)
+        self._metrics.add_connection()
+        self._number_of_reconnect_failures = 0
         self._set_broker_connectionstatus(True)
-        self._subscribe_to_inputsignals()
+        session_present = bool(flags.get('session present')) and not self._use_clean_session
+        self._subscribe_to_inputsignals(session_present)
         self._publish_capablities_and_defaultvalues()
+        self._replay_offlinebuffer()
+        self._flush_publishqueue()
+        self._notify_acknowledgements()
 
-    def _on_disconnect(self, mqttclient, userdata, rc):
+    def _set_mqttv5_connection_properties(self, properties):
+        """Use the MQTT v5 properties from the broker at connection. Resets the topic aliases.
+
+        Args:
+            properties (Paho Properties object): Properties in the CONNACK packet
+
+        """
+        self._topic_alias_properties = {}
+        self._topic_publication_counts = {}
+        self._publish_properties = {}
+        self._topic_alias_limit = min(int(self.topic_alias_maximum), getattr(properties, 'TopicAliasMaximum', 0))
+        self._broker_maximum_packet_size = getattr(properties, 'MaximumPacketSize', None)
+
+        broker_receive_maximum = getattr(properties, 'ReceiveMaximum', None)
+        if broker_receive_maximum is not None:
+            max_inflight = int(self.max_inflight)
+            if max_inflight == 0 or broker_receive_maximum < max_inflight:
+                max_inflight = broker_receive_maximum
+            self._publishqueue.max_inflight = max_inflight
+
+        self.logger.debug("    Broker allows {} topic aliases, receive maximum: {}".format(
+            getattr(properties, 'TopicAliasMaximum', 0), broker_receive_maximum))
+
+    def _on_disconnect(self, mqttclient, userdata, rc, properties=None):
         """MQTT callback at disconnect.
 
         Method signature according to Paho documentation.
@@ -600,16 +2235,21 @@ class BaseFramework:
         self.logger.warning("Now disconnected from MQTT broker. Host: {}, Port: {}, Result: '{}'".format(
                 mqttclient._host, mqttclient._port, mqtt.connack_string(rc)))
         self._set_broker_connectionstatus(False)
+        self._publishqueue.drop_lost_inflight()
+        self._pending_subscriptions = set()
+        self._notify_acknowledgements()
 
-    def _on_subscribe(self, mqttclient, userdata, mid, granted_qos):
+    def _on_subscribe(self, mqttclient, userdata, mid, granted_qos, properties=None):
         """MQTT callback at subscribe.
 
         Method signature according to Paho documentation.
 
         """
         self.logger.debug('  Subscribed. Message id: {}, QOS: {}'.format(mid, granted_qos))
+        self._pending_subscriptions.discard(mid)
+        self._notify_acknowledgements()
 
-    def _on_unsubscribe(self, mqttclient, userdata, mid):
+    def _on_unsubscribe(self, mqttclient, userdata, mid, properties=None, reasoncodes=None):
         """MQTT callback at unsubscribe.
 
         Method signature according to Paho documentation.
@@ -624,6 +2264,10 @@ class BaseFramework:
 
         """
         self.logger.debug('  Publication confirmation. Message id: {}'.format(mid))
+        self._publishqueue.confirm(mid)
+        self._replay_offlinebuffer()
+        self._flush_publishqueue()
+        self._notify_acknowledgements()
 
     def _on_mqttclient_log_event(self, mqttclient, userdata, level, buf):
         """MQTT callback at log event.
@@ -682,19 +2326,98 @@ class Resource(BaseFramework):
 
     The broker is automatically broadcasting 'False' on 'last will' topic at lost connection.
 
+    Resource specific attributes:
+
+    * **use_conflation** (bool): Put outgoing data in a :class:`.ConflationBuffer`, where a new
+      value replaces any pending value for the same topic. The buffer is flushed to the publish
+      queue every ``conflation_interval``, when the publish queue is empty (by :meth:`.loop`
+      without threaded networking). See :meth:`.get_conflation_statistics`. Defaults to ``False``.
+    * **conflation_interval** (numerical): Time in seconds between flushes of the
+      conflation buffer. Default value ``DEFAULT_CONFLATION_INTERVAL``.
+
     """ + str(BaseFramework.__doc__)
 
     def __init__(self, name, host, port=1883, certificate_directory=None):
         super().__init__(name, host, port, certificate_directory)
         self._use_last_will = True
 
+        self.use_conflation = False
+        self.conflation_interval = constants.DEFAULT_CONFLATION_INTERVAL
+        self._conflationbuffer = ConflationBuffer()
+        self._is_conflating = False
+        self._conflation_stop_event = None
+        self._conflation_thread = None
+        self._next_conflation_time = 0
+
     def __repr__(self):
         return "SG Resource: '{}', connecting to host '{}', port {}. Has {} incoming and {} outgoing topics registered.".format(
             self.name, self.host, self.port, len(self._inputsignal_infodict), len(self._outputsignal_infodict))
 
+    def start(self, use_threaded_networking=False, use_clean_session=True, wait=None,
+              timeout=constants.DEFAULT_START_TIMEOUT):
+        """Connect to the broker.
+
+        For details, see :meth:`.BaseFramework.start`. Also starts the flushing of the conflation buffer,
+        if using ``use_conflation``.
+
+        """
+        is_ready = super().start(use_threaded_networking, use_clean_session, wait, timeout)
+        self._conflationbuffer = ConflationBuffer()
+        self._next_conflation_time = time.monotonic() + self.conflation_interval
+        if self.use_conflation and self._use_threaded_networking:
+            self._conflation_stop_event = threading.Event()
+            self._conflation_thread = threading.Thread(target=self._run_conflation_timer,
+                                                       args=(self._conflation_stop_event,),
+                                                       name='{}-conflation'.format(self.name),
+                                                       daemon=True)
+            self._conflation_thread.start()
+        self._is_conflating = self.use_conflation
+        return is_ready
+
+    def loop(self):
+        """Run network activities. Also flushes the conflation buffer, if using ``use_conflation``.
+
+        For details, see :meth:`.BaseFramework.loop`.
+
+        """
+        super().loop()
+        if self._is_conflating and not self._use_threaded_networking and \
+                time.monotonic() >= self._next_conflation_time:
+            self._next_conflation_time = time.monotonic() + self.conflation_interval
+            self._flush_conflationbuffer()
+
+    def stop(self, timeout=constants.DEFAULT_STOP_TIMEOUT):
+        """Disconnect from the broker.
+
+        Pending values in the conflation buffer are published before disconnecting.
+        For details, see :meth:`.BaseFramework.stop`.
+
+        """
+        self._is_conflating = False
+        if self._conflation_thread is not None:
+            self._conflation_stop_event.set()
+            self._conflation_thread.join()
+            self._conflation_thread = None
+        if self.mqttclient is not None:
+            self._flush_conflationbuffer(force=True)
+        super().stop(timeout)
+
+    def get_conflation_statistics(self):
+        """Get statistics for the conflation buffer, when using ``use_conflation``.
+
+        Returns:
+            A dict with the keys ``depth`` (number of topics with pending values), ``max_depth``,
+            ``put`` (number of values), ``conflated`` (number of values replaced by newer values)
+            and ``taken`` (number of values moved to the publish queue).
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        return self._conflationbuffer.get_statistics()
+
     def register_incoming_command(self, signalname, callback,
                                   callback_on_change_only=False, echo=True, send_echo_as_retained=False,
-                                  defaultvalue=None):
+                                  defaultvalue=None, codec=None, raw=None):
         """Register a callback for an incoming command (incoming MQTT message).
 
         Args:
@@ -709,6 +2432,10 @@ class Resource(BaseFramework):
                 to None to avoid sending. The value is converted to a string
                 before sending. It will be updated by the internal
                 :meth:`._on_incoming_message()` callback for incoming MQTT messages.
+            codec (object or None): Payload codec, for the command and the echo. Defaults to text.
+            raw (str or None): Give the undecoded payload and the topic to the callback,
+                as ``'bytes'`` or ``'memoryview'`` (no copies). The payload returned from the
+                callback (or the input payload) is echoed as is. Defaults to ``None`` (not raw).
 
         For details on the callback, see the class documentation.
 
@@ -718,19 +2445,32 @@ class Resource(BaseFramework):
 
         ``commandavailable/``\ *myresourcename*\ ``/``\ *signalname*
 
+        Returns a :class:`.Signalhandle` for publishing on the echo topic
+        ``data/``\ *myresourcename*\ ``/``\ *signalname*, for example when
+        the state is changed by other means than the command.
+
         """
         self.logger.debug("Registering incoming command. Signalname: {}".
                           format(signalname))
-        self._register_inputsignal(constants.PREFIX_COMMAND,
-                                   self.name,
-                                   signalname,
-                                   callback,
-                                   callback_on_change_only,
-                                   echo,
-                                   send_echo_as_retained,
-                                   defaultvalue)
-
-    def register_outgoing_data(self, signalname, defaultvalue=None, send_data_as_retained=False):
+        if is_wildcard_topicfilter(str(signalname)):
+            raise ValueError("Wildcards are not allowed in command names: {!r}".format(signalname))
+        inputsignalinformation = self._register_inputsignal(constants.PREFIX_COMMAND,
+                                                            self.name,
+                                                            signalname,
+                                                            callback,
+                                                            callback_on_change_only,
+                                                            echo,
+                                                            send_echo_as_retained,
+                                                            defaultvalue,
+                                                            codec,
+                                                            raw)
+        return self._create_signalhandle(constants.PREFIX_DATA,
+                                         inputsignalinformation,
+                                         inputsignalinformation.send_echo_as_retained)
+
+    def register_outgoing_data(self, signalname, defaultvalue=None, send_data_as_retained=False,
+                               deadband=None, relative_deadband=None, min_interval=None, refresh_interval=None,
+                               offline_policy=constants.OFFLINE_POLICY_ALL, message_expiry=None, codec=None):
         """Pre-register information on a outgoing data topic (MQTT messages).
         Note that the actual data sending is later done with the :meth:`.send_data()` method.
 
@@ -739,6 +2479,18 @@ class Resource(BaseFramework):
             defaultvalue: Value to be sent on startup and reconnect. Set to None to avoid sending.
                          The value is converted to a string before sending. It will be updated by send_data().
             send_data_as_retained (bool): Whether the data should be published as retained
+            deadband (numerical or None): Skip numerical values that differ at most this much
+                from the last published value.
+            relative_deadband (numerical or None): Skip numerical values that differ at most this
+                fraction (of the last published value) from the last published value. For example 0.01 for 1 %.
+            min_interval (numerical or None): Min time in seconds between publications.
+            refresh_interval (numerical or None): Publish also values within the deadband,
+                if this time in seconds has passed since last publication.
+            offline_policy (str): Store ``'all'`` values or only the ``'latest'`` value in the
+                offline buffer, when disconnected from the broker (and using ``use_offlinebuffer``).
+            message_expiry (numerical or None): Message expiry interval in seconds (MQTT v5),
+                for stale telemetry. Defaults to use the ``message_expiry`` attribute.
+            codec (object or None): Payload codec. Defaults to text.
 
         When the resource is starting, it is publishing a retained message to:
 
@@ -750,20 +2502,40 @@ class Resource(BaseFramework):
 
         Typically the data is published using non-retained messages.
 
+        Returns a :class:`.Signalhandle`. Its :meth:`.Signalhandle.publish` method is
+        a faster alternative to :meth:`.send_data()`, for frequently sent signals.
+
+        Use the *deadband*, *relative_deadband*, *min_interval* and *refresh_interval*
+        arguments to reduce the number of published messages for signals that
+        are sampled often but change slowly. The values given to :meth:`.send_data()`
+        (and the signal handle) are then filtered. Non-numerical values are skipped by the
+        deadbands only if identical to the last published value. The *refresh_interval*
+        is checked when sending data, so it requires that data is sent frequently.
+        The defaultvalue (if used) is updated also by skipped values.
+
         """
         self.logger.debug("Registering outgoing data. Signalname: {}".format(signalname))
-        self._register_outputsignal(constants.PREFIX_DATA,
-                                    self.name,
-                                    signalname,
-                                    defaultvalue,
-                                    send_data_as_retained)
+        outputsignalinformation = self._register_outputsignal(constants.PREFIX_DATA,
+                                                              self.name,
+                                                              signalname,
+                                                              defaultvalue,
+                                                              send_data_as_retained,
+                                                              codec)
+        if offline_policy not in constants.OFFLINE_POLICIES:
+            raise ValueError("Wrong offline policy given: {!r}".format(offline_policy))
+        outputsignalinformation.set_filter(deadband, relative_deadband, min_interval, refresh_interval)
+        outputsignalinformation.offline_policy = offline_policy
+        outputsignalinformation.message_expiry = message_expiry
+        return self._create_signalhandle(constants.PREFIX_DATA,
+                                         outputsignalinformation,
+                                         outputsignalinformation.send_as_retained)
 
     def send_data(self, signalname, value):
         """Send data on a pre-registered topic.
 
         Args:
             signalname (str): signal name
-            value: Value to be sent. Is convered to a string before sending.
+            value: Value to be sent. Is convered to a string before sending (if no codec is used).
 
         Sends to the topic: ``data/``\ *myresourcename*\ ``/``\ *signalname*
 
@@ -784,17 +2556,113 @@ class Resource(BaseFramework):
             self.logger.warning("This data signalname has not been registered: {}, value: '{!s}'".format(
                     signalname, value))
             return
-        try:
-            self.mqttclient.publish(topic,
-                                    str(value),
-                                    qos=self.qos,
-                                    retain=output_data_information.send_as_retained)
-        except AttributeError:
+        if self.mqttclient is None:
             raise ValueError("You must call start() before send_data().")
-        self.logger.debug("    Sending data. Name: {}, payload: '{!s}'".format(topic, value))
-        time.sleep(constants.SLEEP_PUBLISH)
+        payload = output_data_information.encode(value)
         if output_data_information.defaultvalue is not None:
-            output_data_information.defaultvalue = str(value)
+            output_data_information.defaultvalue = payload
+        if output_data_information.use_filter and not output_data_information.filter_value(value, payload):
+            return
+        self._publish_data(topic, payload, self.qos, output_data_information.send_as_retained)
+        self.logger.debug("    Sending data. Name: {}, payload: '{!s}'".format(topic, value))
+
+    def send_data_many(self, signals):
+        """Send data on several pre-registered topics in one pass.
+
+        Args:
+            signals: Mapping of signal name to value, or an iterable of
+                (signalname, value) pairs. The values are converted to strings before sending.
+
+        The messages are put in the publish queue in one operation, which is
+        faster than calling :meth:`.send_data` for each signal. Signals that not
+        have been registered are skipped, as well as values filtered by the deadband
+        and interval settings. For other details, see :meth:`.send_data`.
+
+        """
+        if self.mqttclient is None:
+            raise ValueError("You must call start() before send_data_many().")
+        if hasattr(signals, 'items'):
+            signals = signals.items()
+
+        messages = []
+        for signalname, value in signals:
+            topic = constants.MQTT_TOPIC_TEMPLATE.format(constants.PREFIX_DATA,
+                                                         self.name,
+                                                         str(signalname).strip())
+            try:
+                output_data_information = self._outputsignal_infodict[topic]
+            except KeyError:
+                self.logger.warning("This data signalname has not been registered: {}, value: '{!s}'".format(
+                    signalname, value))
+                continue
+            payload = output_data_information.encode(value)
+            if output_data_information.defaultvalue is not None:
+                output_data_information.defaultvalue = payload
+            if output_data_information.use_filter and not output_data_information.filter_value(value, payload):
+                continue
+            messages.append(Outgoingmessage(topic, payload, self.qos, output_data_information.send_as_retained))
+        self._publish_data_many(messages)
+        self.logger.debug("    Sending data. Number of messages: {}".format(len(messages)))
+
+    def _publish_data(self, topic, payload, qos, retain):
+        """Publish outgoing data, via the conflation buffer if using ``use_conflation``.
+
+        Arguments are described in :meth:`.BaseFramework._publish`.
+
+        """
+        if self._is_conflating:
+            self._conflationbuffer.put(Outgoingmessage(topic, payload, qos, retain))
+        else:
+            self._publish(topic, payload, qos, retain)
+
+    def _publish_data_many(self, messages):
+        """Publish several outgoing data messages, via the conflation buffer if using ``use_conflation``.
+
+        Args:
+            messages (list): :class:`.Outgoingmessage` objects
+
+        """
+        if self._is_conflating:
+            self._conflationbuffer.put_many(messages)
+        else:
+            self._publish_many(messages)
+
+    def _flush_conflationbuffer(self, force=False):
+        """Move the pending values in the conflation buffer to the publish queue.
+
+        Args:
+            force (bool): Flush also when there are messages in the publish queue.
+
+        """
+        if not force and len(self._publishqueue):
+            return
+        messages = self._conflationbuffer.take_all()
+        if messages:
+            self._publish_many(messages)
+
+    def _run_conflation_timer(self, stop_event):
+        """Flush the conflation buffer periodically. Runs in a separate thread."""
+        while not stop_event.wait(self.conflation_interval):
+            try:
+                self._flush_conflationbuffer()
+            except Exception as err:
+                self.logger.warning("Failed to publish values from the conflation buffer. Error: '{}'".format(err))
+
+    def _create_signalhandle(self, messagetype, signalinformation, retain):
+        """Create a handle for publishing on a registered signal.
+
+        Args:
+            messagetype (str): Message type for the published messages, most often ``data``.
+            signalinformation (Inputsignalinfo or Outputsignalinfo): The registered signal.
+            retain (bool): True if the messages should be published as retained.
+
+        The handle is updated with the QoS by :meth:`.start`.
+
+        """
+        topic = constants.MQTT_TOPIC_TEMPLATE.format(messagetype, self.name, signalinformation.signalname)
+        signalhandle = Signalhandle(self, signalinformation, topic, self.qos, retain)
+        self._signalhandles[topic] = signalhandle
+        return signalhandle
 
     def _publish_capablities_and_defaultvalues(self):
         """
@@ -814,10 +2682,7 @@ class Resource(BaseFramework):
 
         """
         ## Indicate service presence (same topic as 'last will') ##
-        self.mqttclient.publish(self._servicepresence_topic,
-                                constants.PAYLOAD_TRUE,
-                                qos=self.qos,
-                                retain=True)
+        self._publish(self._servicepresence_topic, constants.PAYLOAD_TRUE, self.qos, True, force=True)
         self.logger.debug("    Capabilities: '{}'".format(self._servicepresence_topic))
 
         ## Publish dataavailable/ (and default value for data/) for outputsignals ##
@@ -829,17 +2694,11 @@ class Resource(BaseFramework):
                                     constants.PREFIX_DATAAVAILABLE,
                                     self.name,
                                     datainformation.signalname)
-            self.mqttclient.publish(dataavailable_topic,
-                                    constants.PAYLOAD_TRUE,
-                                    qos=self.qos,
-                                    retain=True)
+            self._publish(dataavailable_topic, constants.PAYLOAD_TRUE, self.qos, True, force=True)
             self.logger.debug("    Capabilities: {}'".format(dataavailable_topic))
             if datainformation.defaultvalue is not None:
-                payload = str(datainformation.defaultvalue)
-                self.mqttclient.publish(datatopic,
-                                        payload,
-                                        qos=self.qos,
-                                        retain=datainformation.send_as_retained)
+                payload = datainformation.get_default_payload()
+                self._publish(datatopic, payload, self.qos, datainformation.send_as_retained, force=True)
                 self.logger.info("  Publishing initial value for {}: {!r}".format(datatopic, payload))
 
         ## Publish commandavailable/ for inputsignals ##
@@ -852,31 +2711,22 @@ class Resource(BaseFramework):
                                         constants.PREFIX_COMMANDAVAILABLE,
                                         self.name,
                                         commandinformation.signalname)
-            self.mqttclient.publish(commandavailable_topic,
-                                    constants.PAYLOAD_TRUE,
-                                    qos=self.qos,
-                                    retain=True)
+            self._publish(commandavailable_topic, constants.PAYLOAD_TRUE, self.qos, True, force=True)
             self.logger.debug("    Capabilities: '{}'".format(commandavailable_topic))
             if commandinformation.echo:
                 dataavailable_topic = constants.MQTT_TOPIC_TEMPLATE.format(
                                         constants.PREFIX_DATAAVAILABLE,
                                         self.name,
                                         commandinformation.signalname)
-                self.mqttclient.publish(dataavailable_topic,
-                                        constants.PAYLOAD_TRUE,
-                                        qos=self.qos,
-                                        retain=True)
+                self._publish(dataavailable_topic, constants.PAYLOAD_TRUE, self.qos, True, force=True)
                 self.logger.debug("    Capabilities: '{}'".format(dataavailable_topic))
                 if commandinformation.defaultvalue is not None:
                     data_topic = constants.MQTT_TOPIC_TEMPLATE.format(
                                         constants.PREFIX_DATA,
                                         self.name,
                                         commandinformation.signalname)
-                    payload = str(commandinformation.defaultvalue)
-                    self.mqttclient.publish(data_topic,
-                                            payload,
-                                            qos=self.qos,
-                                            retain=commandinformation.send_echo_as_retained)
+                    payload = commandinformation.get_default_payload()
+                    self._publish(data_topic, payload, self.qos, commandinformation.send_echo_as_retained, force=True)
                     self.logger.info("  Publishing initial value for {}: {!r}".format(data_topic, payload))
 
 ####################
@@ -889,7 +2739,8 @@ class Inputsignalinfo:
     Storage of incoming signal definitions that should be subscribed to.
     It can be data, dataavailable, command, commandavailable, resourceavailable.
     Also holds the callback to be used at incoming signals, and possibly
-    a copy of last received payload.
+    a copy of last received payload (per topic, as the servicename and
+    signalname can contain wildcards).
 
     Arguments are described in the :meth:`.BaseFramework._register_inputsignal` method.
 
@@ -900,7 +2751,17 @@ class Inputsignalinfo:
     """
     def __init__(self, messagetype, servicename, signalname,
                  callback, callback_on_change_only,
-                 echo, send_echo_as_retained, defaultvalue):
+                 echo, send_echo_as_retained, defaultvalue, codec=None, raw=None, share_group=None):
+
+        if raw is not None and raw not in constants.RAW_MODES:
+            raise ValueError("Wrong raw mode given: {!r}".format(raw))
+        if share_group is not None:
+            share_group = str(share_group).strip()
+            if not share_group or any(character in share_group for character in '/+#'):
+                raise ValueError("Wrong share group name given (must be non-empty, without '/', '+' and '#'): {!r}".format(
+                    share_group))
+        if raw is not None and codec is not None:
+            raise ValueError("A codec can not be used in raw mode.")
 
         messagetype = str(messagetype).strip()
         if messagetype not in [constants.PREFIX_COMMANDAVAILABLE,
@@ -914,22 +2775,133 @@ class Inputsignalinfo:
         self.messagetype = messagetype
         self.servicename = str(servicename).strip()
         self.signalname = str(signalname).strip()
+        self.topic_hierarchy = (self.messagetype, self.servicename, self.signalname)
         self.send_echo_as_retained = bool(send_echo_as_retained)
         self.callback = callback
         self.callback_on_change_only = bool(callback_on_change_only)
         self.echo = bool(echo)
+        self.codec = codec
+        self.raw = raw
+        self.share_group = share_group
         self.defaultvalue = defaultvalue
-        self.last_payload = None
+        self.connection_index = 0  # In the connection pool
+        self.set_filter()
+
+    def encode(self, value):
+        """Convert a value to a payload, using the codec (if any).
+
+        In raw mode, bytes and bytearrays are used as is (and memoryviews are converted to bytes).
+
+        """
+        if self.codec is not None:
+            return self.codec.encode(value)
+        if self.raw is not None:
+            if isinstance(value, memoryview):
+                return value.tobytes()
+            if isinstance(value, (bytes, bytearray)):
+                return value
+        return str(value)
+
+    def get_default_payload(self):
+        """Get the payload for the defaultvalue. The defaultvalue is an encoded payload, once updated."""
+        if isinstance(self.defaultvalue, (bytes, bytearray)) and (self.codec is not None or self.raw is not None):
+            return self.defaultvalue
+        return self.encode(self.defaultvalue)
+
+    def get_raw_payload(self, payload):
+        """Get the payload for the callback in raw mode.
+
+        Args:
+            payload (bytes): Payload as received from the MQTT client
+
+        """
+        if self.raw == constants.RAW_MEMORYVIEW:
+            return memoryview(payload)
+        return payload
+
+    def set_filter(self, tolerance=None, hysteresis=None, min_interval=None):
+        """Configure filtering of incoming payloads, in addition to *callback_on_change_only*.
+
+        Arguments are described in the :meth:`.BaseFramework.register_incoming_data` method.
+
+        Resets the filtering state.
+
+        """
+        for name, argument in [('tolerance', tolerance),
+                               ('hysteresis', hysteresis),
+                               ('min_interval', min_interval)]:
+            if argument is not None and float(argument) < 0:
+                raise ValueError("The {} must not be negative. Given: {!r}".format(name, argument))
+
+        self.tolerance = None if tolerance is None else float(tolerance)
+        self.hysteresis = None if hysteresis is None else float(hysteresis)
+        self.min_interval = None if min_interval is None else float(min_interval)
+        if self.tolerance is not None or self.hysteresis is not None:
+            self.callback_on_change_only = True
+        self.use_callback_filter = self.callback_on_change_only or self.min_interval is not None
+
+        # Information at last callback, per topic (the servicename and signalname can contain wildcards)
+        self.last_payloads = {}  # Key: topic, Item: payload
+        self.last_numbers = {}  # Key: topic, Item: float (or None)
+        self.last_directions = {}  # Key: topic, Item: 1 (increasing) or -1 (decreasing)
+        self.last_callback_times = {}  # Key: topic, Item: time
+
+    def filter_payload(self, topic, payload):
+        """Check whether the callback should be run for an incoming payload, according
+        to the change and interval settings. Updates the filtering state.
+
+        Args:
+            topic (str): Topic of the incoming message
+            payload (str): Payload of the incoming message
+
+        Returns True if the callback should be run.
+
+        """
+        now = time.monotonic()
+        if self.min_interval is not None:
+            last_callback_time = self.last_callback_times.get(topic)
+            if last_callback_time is not None and now - last_callback_time < self.min_interval:
+                return False
+
+        direction = None
+        if self.callback_on_change_only:
+            if self.tolerance is None and self.hysteresis is None:
+                number = None
+            else:
+                try:
+                    number = float(payload)
+                except (TypeError, ValueError):
+                    number = None
+            last_number = self.last_numbers.get(topic)
+
+            if number is not None and last_number is not None:
+                difference = number - last_number
+                direction = 1 if difference > 0 else -1
+                limit = self.tolerance or 0.0
+                if self.hysteresis is not None and direction != self.last_directions.get(topic, direction):
+                    limit += self.hysteresis
+                if abs(difference) <= limit:
+                    return False
+            elif self.last_payloads.get(topic) == payload:
+                return False
+            self.last_payloads[topic] = payload
+            self.last_numbers[topic] = number
+
+        if direction is not None:
+            self.last_directions[topic] = direction
+        self.last_callback_times[topic] = now
+        return True
 
     def __repr__(self):
-        TEMPLATE = "IN: '{}'-'{}'-'{}' Default: '{}' Echo: {} (echo retained: {}) Callback only on change: {}"
+        TEMPLATE = "IN: '{}'-'{}'-'{}' Default: '{}' Echo: {} (echo retained: {}) Callback only on change: {} Share group: {}"
         return TEMPLATE.format(self.messagetype,
                                self.servicename,
                                self.signalname,
                                self.defaultvalue,
                                self.echo,
                                self.send_echo_as_retained,
-                               self.callback_on_change_only)
+                               self.callback_on_change_only,
+                               self.share_group)
 
 
 class Outputsignalinfo:
@@ -941,7 +2913,7 @@ class Outputsignalinfo:
     TODO: .messagetype should be a property.
 
     """
-    def __init__(self, messagetype, servicename, signalname, defaultvalue, send_as_retained):
+    def __init__(self, messagetype, servicename, signalname, defaultvalue, send_as_retained, codec=None):
         messagetype = str(messagetype).strip()
         if messagetype not in [constants.PREFIX_COMMANDAVAILABLE,
                                constants.PREFIX_DATAAVAILABLE,
@@ -956,6 +2928,99 @@ class Outputsignalinfo:
         self.signalname = str(signalname).strip()
         self.defaultvalue = defaultvalue
         self.send_as_retained = bool(send_as_retained)
+        self.offline_policy = constants.OFFLINE_POLICY_ALL
+        self.message_expiry = None
+        self.codec = codec
+        self.set_filter()
+
+    def encode(self, value):
+        """Convert a value to a payload, using the codec (if any)."""
+        if self.codec is None:
+            return str(value)
+        return self.codec.encode(value)
+
+    def get_default_payload(self):
+        """Get the payload for the defaultvalue. The defaultvalue is an encoded payload, once updated."""
+        if self.codec is None:
+            return str(self.defaultvalue)
+        if isinstance(self.defaultvalue, (bytes, bytearray)):
+            return self.defaultvalue
+        return self.codec.encode(self.defaultvalue)
+
+    def set_filter(self, deadband=None, relative_deadband=None, min_interval=None, refresh_interval=None):
+        """Configure filtering of outgoing values.
+
+        Arguments are described in the :meth:`.Resource.register_outgoing_data` method.
+
+        Resets the filtering state.
+
+        """
+        for name, argument in [('deadband', deadband),
+                               ('relative_deadband', relative_deadband),
+                               ('min_interval', min_interval),
+                               ('refresh_interval', refresh_interval)]:
+            if argument is not None and float(argument) < 0:
+                raise ValueError("The {} must not be negative. Given: {!r}".format(name, argument))
+        if deadband is not None and relative_deadband is not None:
+            raise ValueError("Use either deadband or relative_deadband, not both.")
+        if min_interval is not None and refresh_interval is not None and float(refresh_interval) < float(min_interval):
+            raise ValueError("The refresh_interval must not be shorter than the min_interval. Given: {!r} and {!r}".format(
+                refresh_interval, min_interval))
+
+        self.deadband = None if deadband is None else float(deadband)
+        self.relative_deadband = None if relative_deadband is None else float(relative_deadband)
+        self.min_interval = None if min_interval is None else float(min_interval)
+        self.refresh_interval = None if refresh_interval is None else float(refresh_interval)
+        self.use_filter = (self.deadband is not None or
+                           self.relative_deadband is not None or
+                           self.min_interval is not None)
+        self.number_of_filtered = 0
+        self._last_published_time = None
+        self._last_published_payload = None
+        self._last_published_number = None
+
+    def filter_value(self, value, payload):
+        """Check whether an outgoing value should be published, according to
+        the deadband and interval settings. Updates the filtering state.
+
+        Args:
+            value: The value to be sent
+            payload (str): The value converted to a string
+
+        Returns True if the value should be published.
+
+        """
+        now = time.monotonic()
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+
+        if self._last_published_time is not None:
+            elapsed = now - self._last_published_time
+            if self.min_interval is not None and elapsed < self.min_interval:
+                self.number_of_filtered += 1
+                return False
+            if self.refresh_interval is None or elapsed < self.refresh_interval:
+                if self._is_within_deadband(number, payload):
+                    self.number_of_filtered += 1
+                    return False
+
+        self._last_published_time = now
+        self._last_published_payload = payload
+        self._last_published_number = number
+        return True
+
+    def _is_within_deadband(self, number, payload):
+        """Compare with the last published value. Returns False if no deadband is used."""
+        if self.deadband is None and self.relative_deadband is None:
+            return False
+        if number is None or self._last_published_number is None:
+            return payload == self._last_published_payload
+        difference = abs(number - self._last_published_number)
+        if self.deadband is not None:
+            return difference <= self.deadband
+        return difference <= self.relative_deadband * abs(self._last_published_number)
 
     def __repr__(self):
         TEMPLATE = "OUT: '{}'-'{}'-'{}' Default: '{}' Retained: {}"
@@ -964,3 +3029,49 @@ class Outputsignalinfo:
                                self.signalname,
                                self.defaultvalue,
                                self.send_as_retained)
+
+
+class Signalhandle:
+    """Pre-bound handle for publishing on a registered signal.
+
+    Returned by :meth:`.Resource.register_outgoing_data` and :meth:`.Resource.register_incoming_command`.
+    The topic is calculated once at registration, so :meth:`.publish` does not
+    need any string formatting or dictionary lookup. Hot producers should keep
+    the handles, instead of calling :meth:`.Resource.send_data` with signal names.
+
+    Attributes:
+        topic (str): MQTT topic, for example ``data/climateservice/actualindoortemperature``
+        qos (int): MQTT quality of service. Updated from the framework at :meth:`.BaseFramework.start`.
+        retain (bool): True if the messages are published as retained.
+
+    """
+    def __init__(self, framework, signalinformation, topic, qos, retain):
+        self.topic = topic
+        self.qos = qos
+        self.retain = bool(retain)
+        self._framework = framework
+        self._signalinformation = signalinformation
+        self._use_filter = getattr(signalinformation, 'use_filter', False)
+
+    def __repr__(self):
+        return "Signal handle: '{}' QoS: {} Retained: {}".format(self.topic, self.qos, self.retain)
+
+    def publish(self, value):
+        """Publish a value on the topic.
+
+        Args:
+            value: Value to be sent. Is converted to a string before sending (if no codec is used).
+
+        Updates the defaultvalue for the signal (if used). Values are filtered
+        according to the deadband and interval settings at registration (if any).
+
+        """
+        framework = self._framework
+        if framework.mqttclient is None:
+            raise ValueError("You must call start() before publishing.")
+        payload = self._signalinformation.encode(value)
+        if self._signalinformation.defaultvalue is not None:
+            self._signalinformation.defaultvalue = payload
+        if self._use_filter and not self._signalinformation.filter_value(value, payload):
+            return
+        framework._publish_data(self.topic, payload, self.qos, self.retain)
@@ -0,0 +1,114 @@
+#
+# Histograms for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import bisect
+
+from . import constants
+
+
+class Histogram:
+    """Histogram with fixed buckets, for example for latencies in seconds.
+
+    Args:
+        bounds (sequence of numbers): Upper bounds of the buckets, in increasing order.
+            Values above the last bound are counted in an overflow bucket.
+
+    Not thread safe. The owner is responsible for locking.
+
+    """
+
+    def __init__(self, bounds=constants.DEFAULT_HISTOGRAM_BOUNDS):
+        self.bounds = list(bounds)
+        if not self.bounds or self.bounds != sorted(self.bounds):
+            raise ValueError("The histogram bounds must be given in increasing order. Given: {!r}".format(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def __repr__(self):
+        return "Histogram: {} values, mean {}, max {}".format(self.count, self.get_mean(), self.max)
+
+    def add(self, value):
+        """Add a value to the histogram.
+
+        Args:
+            value (numerical): The value, for example a latency in seconds.
+
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def get_mean(self):
+        """Get the mean value, or None if there are no values."""
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def get_percentile(self, percentile):
+        """Estimate a percentile, as the upper bound of the bucket where it is found.
+
+        Args:
+            percentile (numerical): Percentile 0-100.
+
+        Returns the bound, or the max value for the overflow bucket. Returns None if there are no values.
+
+        """
+        if not self.count:
+            return None
+        limit = self.count * percentile / 100.0
+        accumulated = 0
+        for bound, count in zip(self.bounds, self.counts):
+            accumulated += count
+            if accumulated >= limit:
+                return min(bound, self.max)
+        return self.max
+
+    def get_statistics(self):
+        """Get the histogram contents.
+
+        Returns:
+            A dict with the keys ``count``, ``mean``, ``min``, ``max``, ``p50``, ``p90``, ``p99``
+            and ``buckets``. The buckets is a list of [upper bound, count] pairs, where the upper
+            bound is None for the overflow bucket.
+
+        """
+        return {'count': self.count,
+                'mean': self.get_mean(),
+                'min': self.min,
+                'max': self.max,
+                'p50': self.get_percentile(50),
+                'p90': self.get_percentile(90),
+                'p99': self.get_percentile(99),
+                'buckets': [[bound, count] for bound, count in zip(self.bounds + [None], self.counts)]}
@@ -0,0 +1,100 @@
+#
+# Cache of the latest incoming values for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import time
+
+
+# The latest value for a topic. The timestamp is from time.time().
+Cachedvalue = collections.namedtuple('Cachedvalue', ['value', 'timestamp'])
+
+
+class LastValueCache:
+    """Cache of the latest incoming value per topic.
+
+    The values are stored per message type, service name and signal name,
+    for lookup in constant time. Each value is stored together with the time
+    it was received.
+
+    The object is thread safe (values can be put from the network thread while
+    read from other threads).
+
+    """
+
+    def __init__(self):
+        # Key: (messagetype, servicename, signalname), Item: Cachedvalue
+        self._values = {}
+        self.number_of_put = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "Last value cache: {} topics, {} values received.".format(len(self._values), self.number_of_put)
+
+    def put(self, messagetype, servicename, signalname, value, timestamp=None):
+        """Store the latest value for a topic.
+
+        Args:
+            messagetype (str): Message type, for example ``data``.
+            servicename (str): Service name
+            signalname (str): Signal name
+            value: The value, for example a payload string.
+            timestamp (float or None): Time of reception, from :func:`time.time`. Defaults to now.
+
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self._values[(messagetype, servicename, signalname)] = Cachedvalue(value, timestamp)
+        self.number_of_put += 1
+
+    def get(self, messagetype, servicename, signalname):
+        """Get the latest value for a topic.
+
+        Returns a :class:`.Cachedvalue` (with the attributes ``value`` and ``timestamp``),
+        or ``None`` if no value has been received.
+
+        """
+        return self._values.get((messagetype, servicename, signalname))
+
+    def snapshot(self, messagetype=None):
+        """Iterate over the latest values.
+
+        Args:
+            messagetype (str or None): Give only values for this message type. Defaults to all.
+
+        Returns an iterator of tuples (messagetype, servicename, signalname, cachedvalue).
+        The values are copied when calling this method, so later incoming values are not included.
+
+        """
+        items = list(self._values.items())
+        return (key + (cachedvalue,) for key, cachedvalue in items if messagetype is None or key[0] == messagetype)
+
+    def clear(self):
+        """Remove all values."""
+        self._values.clear()
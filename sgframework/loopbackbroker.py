@@ -0,0 +1,566 @@
+#
+# In-process MQTT broker for testing the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import logging
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+from . import constants
+from .topictrie import TopicTrie, validate_topicfilter
+
+
+# MQTT control packet types (upper four bits of the fixed header)
+_CONNECT = 0x10
+_CONNACK = 0x20
+_PUBLISH = 0x30
+_PUBACK = 0x40
+_PUBREC = 0x50
+_PUBREL = 0x60
+_PUBCOMP = 0x70
+_SUBSCRIBE = 0x80
+_SUBACK = 0x90
+_UNSUBSCRIBE = 0xA0
+_UNSUBACK = 0xB0
+_PINGREQ = 0xC0
+_PINGRESP = 0xD0
+_DISCONNECT = 0xE0
+
+_CONNACK_ACCEPTED = 0
+_CONNACK_REFUSED_PROTOCOL_VERSION = 1
+_SUBACK_FAILURE = 0x80
+_SUPPORTED_PROTOCOLS = {(b'MQIsdp', 3), (b'MQTT', 4)}  # MQTT 3.1 and 3.1.1
+_MAX_QOS = 1
+
+_Message = collections.namedtuple('_Message', ['topic', 'payload', 'qos', 'retain'])
+# The subscribers is a dict with key (session, share group), item: QoS
+_Subscription = collections.namedtuple('_Subscription', ['topicfilter', 'subscribers'])
+
+
+class _PacketError(Exception):
+    """Malformed or unsupported MQTT packet from a client"""
+    pass
+
+
+class LoopbackBroker:
+    """Minimal MQTT broker, running in background threads in the same process.
+
+    Args:
+        host (str): Network interface to listen on.
+        port (int): Port to listen on. Use 0 for a free port, see :attr:`.port`.
+
+    Intended for tests and benchmarks on machines without a MQTT broker. The framework (and any other
+    MQTT client) connects to it as usual, for example::
+
+        broker = LoopbackBroker()
+        broker.start()
+        resource = Resource('climateservice', broker.host, port=broker.port)
+
+    Supports MQTT 3.1 and 3.1.1 (the ``protocol`` setting of the framework, but not MQTT 5),
+    QoS 0 and 1, retained messages, last will messages and the ``+`` and ``#`` wildcards.
+    QoS 2 publications are accepted, but are delivered with QoS 1. Shared subscriptions
+    (``$share/group/topicfilter``) are delivered to one member per group, in turn.
+
+    There is no authentication, TLS, persistent session state or retransmission.
+    A client connecting with the client id of a connected client takes over, and the
+    earlier connection is closed (and its last will is published).
+
+    Can be used as a context manager, that starts and stops the broker.
+
+    """
+
+    def __init__(self, host=constants.LOOPBACKBROKER_HOST, port=0):
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(__name__)
+
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()  # Protects the state below
+        self._sessions = {}  # Key: client id, Item: _Session
+        self._subscriptions = TopicTrie()  # Item: _Subscription
+        self._retained_checker = TopicTrie()  # Reused for matching the retained messages at subscription
+        self._retained = {}  # Key: topic, Item: _Message
+        self._share_counters = collections.Counter()  # Key: (share group, topic filter)
+        self._anonymous_clients = 0
+        self._statistics = {'connections': 0, 'received': 0, 'delivered': 0}
+
+    def __repr__(self):
+        return "SG LoopbackBroker on {}:{}, {} connected clients, {} retained messages".format(
+            self.host, self.port, len(self._sessions), len(self._retained))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start listening for connections, in a background thread.
+
+        If the port is 0, a free port is selected and stored in :attr:`.port`.
+
+        """
+        if self._server is not None:
+            raise ValueError("The loopback broker is already started.")
+        self._server = _Server((self.host, self.port), _ConnectionHandler)
+        self._server.broker = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': constants.LOOPBACKBROKER_POLL_INTERVAL},
+                                        name='loopbackbroker-{}'.format(self.port),
+                                        daemon=True)
+        self._thread.start()
+        self.logger.info("Loopback MQTT broker listening on {}:{}".format(self.host, self.port))
+
+    def stop(self):
+        """Stop the broker and close all client connections. Last will messages are not published.
+
+        The retained messages are kept, and are available if the broker is started again.
+
+        """
+        if self._server is None:
+            raise ValueError("You must call start() before stop().")
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.will = None
+            session.close()
+
+    def drop_client(self, client_id):
+        """Close the connection to a client without any MQTT DISCONNECT, as for a network failure.
+
+        Args:
+            client_id (str): MQTT client id
+
+        The last will of the client is published.
+
+        Raises:
+            KeyError: If there is no connected client with the client id.
+
+        """
+        with self._lock:
+            session = self._sessions[client_id]
+        session.close()
+
+    def get_retained_messages(self):
+        """Get the retained messages.
+
+        Returns:
+            A dict with the topics as keys, and the payloads (bytes) as items.
+
+        """
+        with self._lock:
+            return {topic: message.payload for topic, message in self._retained.items()}
+
+    def get_client_ids(self):
+        """Get the client ids of the connected clients, as a sorted list."""
+        with self._lock:
+            return sorted(self._sessions)
+
+    def get_statistics(self):
+        """Get the broker statistics.
+
+        Returns:
+            A dict with the keys ``clients`` (connected now), ``connections`` (since the creation),
+            ``subscriptions`` (number of topic filters), ``retained``, ``received`` (publications
+            from clients) and ``delivered`` (publications to clients).
+
+        """
+        with self._lock:
+            result = dict(self._statistics)
+            result['clients'] = len(self._sessions)
+            result['subscriptions'] = len(self._subscriptions)
+            result['retained'] = len(self._retained)
+        return result
+
+    ## Internal methods, called by the connection handlers ##
+
+    def _add_session(self, session):
+        """Register a connected client. Closes any earlier connection with the same client id."""
+        with self._lock:
+            previous_session = self._sessions.get(session.client_id)
+            self._sessions[session.client_id] = session
+            self._statistics['connections'] += 1
+        if previous_session is not None:
+            self.logger.info("Client '{}' taken over by a new connection.".format(session.client_id))
+            previous_session.close()
+
+    def _remove_session(self, session):
+        """Unregister a disconnected client, and remove its subscriptions."""
+        with self._lock:
+            if self._sessions.get(session.client_id) is session:
+                del self._sessions[session.client_id]
+            for topicfilter, share_group in session.subscriptions:
+                self._remove_subscription(session, topicfilter, share_group)
+            session.subscriptions.clear()
+
+    def _name_anonymous_client(self):
+        """Create a client id for a client connecting with an empty client id."""
+        with self._lock:
+            self._anonymous_clients += 1
+            return 'loopbackbroker-client-{}'.format(self._anonymous_clients)
+
+    def _subscribe(self, session, subscription_topic, qos):
+        """Add a subscription.
+
+        Returns the tuple (granted QoS, list of matching retained messages). The granted QoS
+        is the SUBACK failure code for an invalid topic filter. Shared subscriptions get no
+        retained messages.
+
+        """
+        topicfilter, share_group = _parse_subscription_topic(subscription_topic)
+        try:
+            validate_topicfilter(topicfilter)
+        except ValueError:
+            return _SUBACK_FAILURE, []
+        if not topicfilter:
+            return _SUBACK_FAILURE, []
+        granted_qos = min(qos, _MAX_QOS)
+
+        with self._lock:
+            subscription = self._subscriptions.get(topicfilter)
+            if subscription is None:
+                subscription = _Subscription(topicfilter, {})
+                self._subscriptions.insert(topicfilter, subscription)
+            subscription.subscribers[(session, share_group)] = granted_qos
+            session.subscriptions.add((topicfilter, share_group))
+            if share_group is not None:
+                return granted_qos, []
+
+            self._retained_checker.insert(topicfilter, True)
+            try:
+                retained = [message._replace(qos=min(message.qos, granted_qos))
+                            for topic, message in sorted(self._retained.items())
+                            if self._retained_checker.match(topic)]
+            finally:
+                self._retained_checker.remove(topicfilter)
+            self._statistics['delivered'] += len(retained)
+        return granted_qos, retained
+
+    def _unsubscribe(self, session, subscription_topic):
+        """Remove a subscription (if any)."""
+        topicfilter, share_group = _parse_subscription_topic(subscription_topic)
+        with self._lock:
+            session.subscriptions.discard((topicfilter, share_group))
+            self._remove_subscription(session, topicfilter, share_group)
+
+    def _publish(self, message):
+        """Store a retained message, and deliver the message to the matching subscribers."""
+        with self._lock:
+            self._statistics['received'] += 1
+            if message.retain:
+                if message.payload:
+                    self._retained[message.topic] = message
+                else:
+                    self._retained.pop(message.topic, None)
+
+            deliveries = {}  # Key: session, Item: QoS
+            for subscription in self._subscriptions.match(message.topic):
+                shared = collections.defaultdict(list)
+                for (session, share_group), qos in subscription.subscribers.items():
+                    if share_group is None:
+                        deliveries[session] = max(qos, deliveries.get(session, 0))
+                    else:
+                        shared[share_group].append((session, qos))
+                for share_group, members in sorted(shared.items()):
+                    key = (share_group, subscription.topicfilter)
+                    session, qos = members[self._share_counters[key] % len(members)]
+                    self._share_counters[key] += 1
+                    deliveries[session] = max(qos, deliveries.get(session, 0))
+            self._statistics['delivered'] += len(deliveries)
+
+        # A message is delivered with the retain flag only when sent because of a new subscription
+        for session, qos in deliveries.items():
+            session.send_publish(message.topic, message.payload, min(qos, message.qos), False)
+
+    def _remove_subscription(self, session, topicfilter, share_group):
+        """Remove a subscription from the topic trie. Call with the lock held."""
+        subscription = self._subscriptions.get(topicfilter)
+        if subscription is None:
+            return
+        subscription.subscribers.pop((session, share_group), None)
+        if not subscription.subscribers:
+            self._subscriptions.remove(topicfilter)
+
+
+def _parse_subscription_topic(subscription_topic):
+    """Split a subscription topic into the topic filter and the share group (None if not shared)."""
+    prefix = constants.SHARED_SUBSCRIPTION_TEMPLATE.format('', '').split(constants.MQTT_TOPIC_SEPARATOR)[0]
+    levels = subscription_topic.split(constants.MQTT_TOPIC_SEPARATOR, 2)
+    if len(levels) == 3 and levels[0] == prefix and levels[1]:
+        return levels[2], levels[1]
+    return subscription_topic, None
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """TCP server with one thread per client connection."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _Session:
+    """A connected client. Outgoing packets are written by a separate thread, so a slow
+    client does not block the publishing clients.
+
+    """
+
+    def __init__(self, connection, client_id, will):
+        self.connection = connection
+        self.client_id = client_id
+        self.will = will  # _Message or None
+        self.subscriptions = set()  # (topic filter, share group)
+        self._outgoing = queue.Queue()
+        self._packet_ids = collections.deque(range(1, 65536))
+        self._packet_id_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_packets,
+                                        name='loopbackbroker-writer-{}'.format(client_id),
+                                        daemon=True)
+        self._writer.start()
+
+    def send(self, data):
+        """Queue a packet for writing to the client."""
+        self._outgoing.put(data)
+
+    def send_publish(self, topic, payload, qos, retain):
+        """Queue a PUBLISH packet for the client."""
+        header = _PUBLISH | (qos << 1) | int(retain)
+        body = _encode_string(topic.encode('utf-8'))
+        if qos > 0:
+            with self._packet_id_lock:
+                packet_id = self._packet_ids[0]
+                self._packet_ids.rotate(-1)
+            body += struct.pack('!H', packet_id)
+        self.send(_encode_packet(header, body + payload))
+
+    def close(self):
+        """Close the network connection. The connection handler will then clean up."""
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def stop_writer(self):
+        """Stop the writer thread, after writing the already queued packets."""
+        self._outgoing.put(None)
+        if self._writer is not threading.current_thread():
+            self._writer.join()
+
+    def _write_packets(self):
+        while True:
+            data = self._outgoing.get()
+            if data is None:
+                return
+            try:
+                self.connection.sendall(data)
+            except OSError:
+                pass
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """Handles the MQTT packets from one client connection."""
+
+    def handle(self):
+        broker = self.server.broker
+        connection = self.request
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = connection.makefile('rb')
+        session = None
+        try:
+            packet_type, flags, body = _read_packet(reader)
+            if packet_type != _CONNECT:
+                return
+            client_id, will, keepalive, return_code = _parse_connect(body)
+            if return_code != _CONNACK_ACCEPTED:
+                connection.sendall(_encode_packet(_CONNACK, bytes([0, return_code])))
+                return
+            if not client_id:
+                client_id = broker._name_anonymous_client()
+            if keepalive:
+                connection.settimeout(keepalive * 1.5)
+            session = _Session(connection, client_id, will)
+            broker._add_session(session)
+            session.send(_encode_packet(_CONNACK, bytes([0, _CONNACK_ACCEPTED])))
+
+            while True:
+                packet_type, flags, body = _read_packet(reader)
+                if packet_type == _DISCONNECT:
+                    session.will = None
+                    return
+                self._handle_packet(broker, session, packet_type, flags, body)
+        except (_PacketError, OSError, EOFError) as err:
+            broker.logger.debug("Closing connection to MQTT client. Reason: {}".format(err))
+        finally:
+            reader.close()
+            if session is not None:
+                broker._remove_session(session)
+                session.stop_writer()
+                if session.will is not None:
+                    broker._publish(session.will)
+
+    def _handle_packet(self, broker, session, packet_type, flags, body):
+        if packet_type == _PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic_length = struct.unpack('!H', body[:2])[0]
+            topic = body[2:2 + topic_length].decode('utf-8')
+            position = 2 + topic_length
+            if qos > 0:
+                packet_id = body[position:position + 2]
+                position += 2
+            broker._publish(_Message(topic, body[position:], min(qos, _MAX_QOS), bool(flags & 0x01)))
+            if qos == 1:
+                session.send(_encode_packet(_PUBACK, packet_id))
+            elif qos == 2:
+                session.send(_encode_packet(_PUBREC, packet_id))
+        elif packet_type == _PUBREL:
+            session.send(_encode_packet(_PUBCOMP, body[:2]))
+        elif packet_type == _SUBSCRIBE:
+            packet_id = body[:2]
+            position = 2
+            return_codes = []
+            retained = []
+            while position < len(body):
+                topicfilter, position = _decode_string(body, position)
+                granted_qos, messages = broker._subscribe(session, topicfilter, body[position] & 0x03)
+                return_codes.append(granted_qos)
+                retained.extend(messages)
+                position += 1
+            session.send(_encode_packet(_SUBACK, packet_id + bytes(return_codes)))
+            for message in retained:
+                session.send_publish(message.topic, message.payload, message.qos, True)
+        elif packet_type == _UNSUBSCRIBE:
+            packet_id = body[:2]
+            position = 2
+            while position < len(body):
+                topicfilter, position = _decode_string(body, position)
+                broker._unsubscribe(session, topicfilter)
+            session.send(_encode_packet(_UNSUBACK, packet_id))
+        elif packet_type == _PINGREQ:
+            session.send(_encode_packet(_PINGRESP, b''))
+        elif packet_type in (_PUBACK, _PUBREC, _PUBCOMP):
+            pass  # No retransmissions, so the acknowledgements are not tracked
+        else:
+            raise _PacketError("Unexpected MQTT packet type: {:#x}".format(packet_type))
+
+
+## Packet encoding and decoding ##
+
+def _read_packet(reader):
+    """Read a MQTT packet from a binary file-like object.
+
+    Returns the tuple (packet type, flags, body). Raises EOFError if the connection is closed.
+
+    """
+    first_byte = reader.read(1)
+    if not first_byte:
+        raise EOFError("Connection closed by the client")
+    remaining_length = 0
+    for index in range(4):
+        length_byte = reader.read(1)
+        if not length_byte:
+            raise EOFError("Connection closed by the client")
+        remaining_length += (length_byte[0] & 0x7F) << (7 * index)
+        if not length_byte[0] & 0x80:
+            break
+    else:
+        raise _PacketError("Malformed remaining length")
+    body = reader.read(remaining_length)
+    if len(body) != remaining_length:
+        raise EOFError("Connection closed by the client")
+    return first_byte[0] & 0xF0, first_byte[0] & 0x0F, body
+
+
+def _parse_connect(body):
+    """Parse the body of a CONNECT packet.
+
+    Returns the tuple (client id, will message or None, keepalive, CONNACK return code).
+    The client id is empty if not given by the client.
+
+    """
+    protocol_name, position = _decode_bytes(body, 0)
+    protocol_level = body[position]
+    if (protocol_name, protocol_level) not in _SUPPORTED_PROTOCOLS:
+        return None, None, 0, _CONNACK_REFUSED_PROTOCOL_VERSION
+    connect_flags = body[position + 1]
+    keepalive = struct.unpack('!H', body[position + 2:position + 4])[0]
+    client_id, position = _decode_string(body, position + 4)
+
+    will = None
+    if connect_flags & 0x04:
+        will_topic, position = _decode_string(body, position)
+        will_payload, position = _decode_bytes(body, position)
+        will = _Message(will_topic, will_payload, min((connect_flags >> 3) & 0x03, _MAX_QOS),
+                        bool(connect_flags & 0x20))
+    return client_id, will, keepalive, _CONNACK_ACCEPTED
+
+
+def _decode_bytes(data, position):
+    """Decode a length-prefixed byte string. Returns the tuple (bytes, position after it)."""
+    length = struct.unpack('!H', data[position:position + 2])[0]
+    end = position + 2 + length
+    if end > len(data):
+        raise _PacketError("Truncated string in MQTT packet")
+    return data[position + 2:end], end
+
+
+def _decode_string(data, position):
+    """Decode a length-prefixed UTF-8 string. Returns the tuple (str, position after it)."""
+    raw, position = _decode_bytes(data, position)
+    try:
+        return raw.decode('utf-8'), position
+    except UnicodeDecodeError:
+        raise _PacketError("Invalid UTF-8 string in MQTT packet")
+
+
+def _encode_string(data):
+    """Encode bytes with a length prefix."""
+    return struct.pack('!H', len(data)) + data
+
+
+def _encode_packet(header, body):
+    """Encode a MQTT packet, from the first header byte and the body (bytes)."""
+    length = len(body)
+    encoded_length = bytearray()
+    while True:
+        length_byte = length & 0x7F
+        length >>= 7
+        if length:
+            encoded_length.append(length_byte | 0x80)
+        else:
+            encoded_length.append(length_byte)
+            break
+    return bytes([header]) + bytes(encoded_length) + body
@@ -0,0 +1,193 @@
+#
+# Metrics for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import threading
+import time
+
+from . import constants
+from .histogram import Histogram
+
+
+def get_payload_size(payload):
+    """Get the size in bytes of an MQTT payload.
+
+    Args:
+        payload (str, bytes or bytearray): The payload. Strings are counted as UTF-8.
+
+    """
+    if isinstance(payload, str):
+        return len(payload.encode('utf-8'))
+    return len(payload)
+
+
+class Metrics:
+    """Counters and histograms for the message traffic of an app or resource.
+
+    At most ``MAX_STATISTICS_TOPICS`` topics are counted separately in each direction. The messages
+    for other topics are counted under the key ``STATISTICS_OTHER_TOPICS``.
+
+    The object is thread safe.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+        self._messages_in_per_topic = {}  # Key: topic, Item: number of messages
+        self._messages_out_per_topic = {}  # Key: topic, Item: number of messages
+        self._dispatch_time = Histogram()
+        self._callback_time = Histogram()
+        self.number_of_messages_in = 0
+        self.number_of_messages_out = 0
+        self.number_of_bytes_in = 0
+        self.number_of_bytes_out = 0
+        self.number_of_callbacks = 0
+        self.number_of_failed_callbacks = 0
+        self.number_of_connections = 0
+        self.number_of_reconnect_attempts = 0
+        self._disconnected_time = 0.0
+        self._disconnected_since = self._started_at  # Not yet connected
+
+    def __repr__(self):
+        return "Metrics: {} messages in, {} messages out, {} failed callbacks, {} connections".format(
+            self.number_of_messages_in, self.number_of_messages_out,
+            self.number_of_failed_callbacks, self.number_of_connections)
+
+    def add_incoming(self, topic, number_of_bytes, dispatch_time):
+        """Record an incoming message.
+
+        Args:
+            topic (str or None): MQTT topic. Use None for unregistered topics.
+            number_of_bytes (int): Payload size
+            dispatch_time (float): Time in seconds for handling the message (including
+                the callbacks, if run in the network thread).
+
+        """
+        with self._lock:
+            self.number_of_messages_in += 1
+            self.number_of_bytes_in += number_of_bytes
+            _count_topic(self._messages_in_per_topic, topic)
+            self._dispatch_time.add(dispatch_time)
+
+    def add_outgoing(self, topic, number_of_bytes):
+        """Record an outgoing message, handed over to the MQTT client.
+
+        Args:
+            topic (str): MQTT topic
+            number_of_bytes (int): Payload size
+
+        """
+        with self._lock:
+            self.number_of_messages_out += 1
+            self.number_of_bytes_out += number_of_bytes
+            _count_topic(self._messages_out_per_topic, topic)
+
+    def add_callback(self, run_time, failed=False):
+        """Record a callback.
+
+        Args:
+            run_time (float or None): Time in seconds for running the callback. Use None if unknown.
+            failed (bool): True if the callback raised an exception.
+
+        """
+        with self._lock:
+            self.number_of_callbacks += 1
+            self.number_of_failed_callbacks += int(failed)
+            if run_time is not None:
+                self._callback_time.add(run_time)
+
+    def add_connection(self):
+        """Record a successful connection to the broker."""
+        with self._lock:
+            self.number_of_connections += 1
+            if self._disconnected_since is not None:
+                self._disconnected_time += time.monotonic() - self._disconnected_since
+                self._disconnected_since = None
+
+    def add_disconnection(self):
+        """Record that the connection to the broker is lost (or a connection attempt has failed)."""
+        with self._lock:
+            if self._disconnected_since is None:
+                self._disconnected_since = time.monotonic()
+
+    def add_reconnect_attempt(self):
+        """Record an attempt to reconnect to the broker."""
+        with self._lock:
+            self.number_of_reconnect_attempts += 1
+
+    def get_metrics(self):
+        """Get the recorded metrics.
+
+        Returns:
+            A dict with the keys ``elapsed_time`` (seconds since the metrics were reset), ``messages_in``,
+            ``messages_out``, ``messages_in_per_second``, ``messages_out_per_second``, ``bytes_in``,
+            ``bytes_out``, ``messages_in_per_topic``, ``messages_out_per_topic`` (see above), ``callbacks``,
+            ``failed_callbacks``, ``connections``, ``reconnects``, ``reconnect_attempts`` (not including the
+            initial connection attempt), ``disconnected_time`` (seconds, including the ongoing disconnection),
+            ``dispatch_time`` and ``callback_time``.
+            The dispatch and callback times are histogram statistics (see :meth:`.Histogram.get_statistics`),
+            in seconds.
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed_time = now - self._started_at
+            disconnected_time = self._disconnected_time
+            if self._disconnected_since is not None:
+                disconnected_time += now - self._disconnected_since
+            return {'elapsed_time': elapsed_time,
+                    'messages_in': self.number_of_messages_in,
+                    'messages_out': self.number_of_messages_out,
+                    'messages_in_per_second': self.number_of_messages_in / elapsed_time if elapsed_time else 0.0,
+                    'messages_out_per_second': self.number_of_messages_out / elapsed_time if elapsed_time else 0.0,
+                    'bytes_in': self.number_of_bytes_in,
+                    'bytes_out': self.number_of_bytes_out,
+                    'messages_in_per_topic': dict(self._messages_in_per_topic),
+                    'messages_out_per_topic': dict(self._messages_out_per_topic),
+                    'callbacks': self.number_of_callbacks,
+                    'failed_callbacks': self.number_of_failed_callbacks,
+                    'connections': self.number_of_connections,
+                    'reconnects': max(0, self.number_of_connections - 1),
+                    'reconnect_attempts': self.number_of_reconnect_attempts,
+                    'disconnected_time': disconnected_time,
+                    'dispatch_time': self._dispatch_time.get_statistics(),
+                    'callback_time': self._callback_time.get_statistics()}
+
+
+def _count_topic(counters, topic):
+    """Increase the counter for a topic, limited to ``MAX_STATISTICS_TOPICS`` topics.
+
+    Args:
+        counters (dict): Key: topic, Item: number of messages
+        topic (str or None): MQTT topic. None is counted as the other topics.
+
+    """
+    if topic is None or (topic not in counters and len(counters) >= constants.MAX_STATISTICS_TOPICS):
+        topic = constants.STATISTICS_OTHER_TOPICS
+    counters[topic] = counters.get(topic, 0) + 1
@@ -0,0 +1,329 @@
+#
+# Resource with the outgoing data published by worker processes, for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import zlib
+
+from . import constants
+from .exceptions import PublishQueueFullException
+from .framework import POOL_CONNECTION_ATTRIBUTES, App, Resource
+
+# A worker process, and its queue of outgoing messages
+Worker = collections.namedtuple('Worker', ['name', 'process', 'messagequeue', 'ready_event'])
+
+
+class MultiprocessResource(Resource):
+    __doc__ = """Resource framework for the Secure Gateway, publishing the outgoing data from worker processes
+
+    The resource object itself is the coordinator. It owns the presence topic and the 'last will',
+    publishes the availability information and handles the incoming commands (and their echoes).
+    The registered outgoing data signals are divided into shards, by a hash of the signal name,
+    and each shard is published by a worker process with its own MQTT connection. The messages for
+    a signal always use the same worker process, and keep their order. This way the publishing
+    (building the MQTT packets, the socket traffic and the acknowledgements) runs in parallel on
+    several CPU cores, instead of under a single Python interpreter lock.
+
+    The values given to :meth:`.send_data` (and the other ways of sending data) are converted and
+    filtered in the calling process, and are then given to the worker processes via
+    :class:`multiprocessing.Queue` objects. Messages sent together using :meth:`.send_data_many`
+    are transferred together, which is much faster than one by one.
+
+    MultiprocessResource specific attributes:
+
+    * **worker_processes** (int): Number of worker processes.
+      Default value ``DEFAULT_WORKER_PROCESSES``.
+    * **worker_queue_size** (int): Max number of batches of messages waiting for each
+      worker process. Default value ``DEFAULT_WORKER_QUEUE_SIZE``.
+
+    When a worker queue is full, the ``publishqueue_policy`` decides what happens: ``'block'`` waits
+    (up to ``publishqueue_timeout``), ``'raise'`` raises a :exc:`.PublishQueueFullException`
+    and the other policies drop the messages (with a warning). Messages generated by the framework
+    (for example the default values at connection) wait at most ``WORKER_FORCED_PUT_TIMEOUT``.
+    Messages for a worker process that has died are dropped. The worker processes use the
+    same connection settings as the resource, except the ``userdata`` (which is not transferred).
+    The worker processes are started by :meth:`.start` (before connecting, as they are forked)
+    and stopped by :meth:`.stop`. Use :meth:`.get_worker_statistics` to see the load per process.
+    A connection pool (``connection_pool_size``) can not be used together with worker processes.
+
+    """ + str(Resource.__doc__)
+
+    def __init__(self, name, host, port=1883, certificate_directory=None):
+        super().__init__(name, host, port, certificate_directory)
+        self.worker_processes = constants.DEFAULT_WORKER_PROCESSES
+        self.worker_queue_size = constants.DEFAULT_WORKER_QUEUE_SIZE
+        self._workers = []
+
+        # Key: worker name, Item: dict with counters. Protected by the lock.
+        self._worker_statistics = {}
+        self._worker_statistics_lock = threading.Lock()
+
+    def __repr__(self):
+        return "SG MultiprocessResource: '{}', connecting to host '{}', port {}. Has {} incoming and {} outgoing topics registered, {} worker processes.".format(
+            self.name, self.host, self.port, len(self._inputsignal_infodict), len(self._outputsignal_infodict),
+            self.worker_processes)
+
+    def start(self, use_threaded_networking=False, use_clean_session=True, wait=None,
+              timeout=constants.DEFAULT_START_TIMEOUT):
+        """Start the worker processes, and connect to the broker.
+
+        For details, see :meth:`.Resource.start`. When waiting, also the
+        worker processes must be ready (within the same timeout).
+
+        """
+        if int(self.worker_processes) < 1:
+            raise ValueError("The number of worker processes must be at least 1: {!r}".format(self.worker_processes))
+        if self.connection_pool_size != 1:
+            raise ValueError("A connection pool can not be used together with worker processes.")
+        if wait is None:
+            wait = use_threaded_networking
+        deadline = time.monotonic() + timeout
+
+        is_ready = super().start(use_threaded_networking, use_clean_session, wait, timeout)
+        if not wait:
+            return is_ready
+
+        for worker in self._workers:
+            if not worker.ready_event.wait(max(0, deadline - time.monotonic())):
+                self.logger.warning("Worker process {} not ready within {} s.".format(worker.name, timeout))
+                is_ready = False
+        return is_ready
+
+    def get_worker_statistics(self):
+        """Get statistics for the worker processes.
+
+        Returns:
+            A list of dicts with the keys ``name``, ``alive``, ``ready``, ``batches``
+            (number of transferred batches of messages), ``messages`` and ``dropped``.
+
+        The statistics are reset by :meth:`.start`.
+
+        """
+        result = []
+        with self._worker_statistics_lock:
+            for worker in self._workers:
+                statistics = dict(self._worker_statistics[worker.name])
+                statistics['name'] = worker.name
+                statistics['alive'] = worker.process.is_alive()
+                statistics['ready'] = worker.ready_event.is_set()
+                result.append(statistics)
+        return result
+
+    def _start_pool_connections(self):
+        """Start the worker processes. Is called by :meth:`.start`, before connecting.
+
+        Each worker process gets the outgoing data signals in its shard (see :meth:`._get_worker_index`).
+
+        """
+        super()._start_pool_connections()
+        self._workers = []
+        self._worker_statistics = {}
+
+        settings = {attributename: getattr(self, attributename) for attributename in POOL_CONNECTION_ATTRIBUTES
+                    if attributename != 'userdata'}
+        settings['callback_executor'] = None  # No incoming messages
+        shards = [[] for _ in range(int(self.worker_processes))]
+        for topic, outputsignalinformation in self._outputsignal_infodict.items():
+            shards[self._get_worker_index(topic)].append((outputsignalinformation.messagetype,
+                                                          outputsignalinformation.servicename,
+                                                          outputsignalinformation.signalname,
+                                                          outputsignalinformation.send_as_retained,
+                                                          outputsignalinformation.offline_policy,
+                                                          outputsignalinformation.message_expiry))
+
+        for index, outputsignals in enumerate(shards, start=1):
+            name = constants.CONNECTION_NAME_TEMPLATE.format(self.name, index)
+            worker_settings = dict(settings)
+            if self.offlinebuffer_filename is not None:
+                worker_settings['offlinebuffer_filename'] = constants.CONNECTION_NAME_TEMPLATE.format(
+                    self.offlinebuffer_filename, index)
+            messagequeue = multiprocessing.Queue(int(self.worker_queue_size))
+            ready_event = multiprocessing.Event()
+            process = multiprocessing.Process(target=_run_worker,
+                                              args=(name, self.host, self.port, self.certificate_directory,
+                                                    worker_settings, outputsignals, self._use_clean_session,
+                                                    messagequeue, ready_event),
+                                              name=name,
+                                              daemon=True)
+            process.start()
+            self._workers.append(Worker(name, process, messagequeue, ready_event))
+            self._worker_statistics[name] = {'batches': 0, 'messages': 0, 'dropped': 0}
+        self.logger.info("Started {} worker processes.".format(len(self._workers)))
+
+    def _stop_pool_connections(self, timeout):
+        """Stop the worker processes, after they have published the queued messages. Is called by :meth:`.stop`.
+
+        Args:
+            timeout (numerical): Max time in seconds to wait for outgoing messages to be confirmed,
+                in each worker process.
+
+        Worker processes still running after the timeout (plus the ``timeout`` attribute) are terminated.
+
+        """
+        super()._stop_pool_connections(timeout)
+        for worker in self._workers:
+            try:
+                worker.messagequeue.put((None, timeout), True, timeout)
+            except queue.Full:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout + self.timeout)
+            if worker.process.is_alive():
+                self.logger.warning("Terminating worker process {}, as it did not stop within {} s.".format(
+                    worker.name, timeout + self.timeout))
+                worker.process.terminate()
+                worker.messagequeue.cancel_join_thread()
+            worker.messagequeue.close()
+        self._workers = []
+
+    def _get_worker_index(self, topic):
+        """Find the worker process to use for an outgoing data topic.
+
+        Args:
+            topic (str): MQTT topic
+
+        The topics are distributed by a hash of the signal name (the last level),
+        in the same way as for the connection pool.
+
+        Returns the index of the worker process.
+
+        """
+        signalname = topic[topic.rfind(constants.MQTT_TOPIC_SEPARATOR) + 1:]
+        return zlib.crc32(signalname.encode('utf-8')) % int(self.worker_processes)
+
+    def _publish_many(self, messages, force=False):
+        """Give the messages for registered outgoing data to the worker processes, and publish the others.
+
+        For details, see :meth:`.BaseFramework._publish_many`.
+
+        """
+        if self._workers:
+            messages = self._publish_on_workers(messages, force)
+            if not messages:
+                return
+        super()._publish_many(messages, force)
+
+    def _publish_on_workers(self, messages, force=False):
+        """Put outgoing MQTT messages for registered outgoing data in the queues of the worker processes.
+
+        Args:
+            messages (list of Outgoingmessage): Messages to be published.
+            force (bool): Wait for room in the queues, regardless of the ``publishqueue_policy``.
+                Used for messages generated by the framework itself. The waiting time is limited to
+                ``WORKER_FORCED_PUT_TIMEOUT``, as this can run in the network thread.
+
+        Raises:
+            PublishQueueFullException: If a worker queue is full, and using the ``'raise'`` policy.
+
+        Messages for a worker process that is not alive are dropped (and counted).
+
+        Returns a list of the other messages, to be published by the resource itself.
+
+        """
+        own_messages = []
+        worker_messages = {}  # Key: worker index, Item: list of Outgoingmessage
+        for message in messages:
+            if message.topic in self._outputsignal_infodict:
+                worker_messages.setdefault(self._get_worker_index(message.topic), []).append(message)
+            else:
+                own_messages.append(message)
+
+        block = force or self.publishqueue_policy == constants.PUBLISHQUEUE_POLICY_BLOCK
+        timeout = constants.WORKER_FORCED_PUT_TIMEOUT if force else self.publishqueue_timeout
+        for index, messages_for_worker in worker_messages.items():
+            worker = self._workers[index]
+            if not worker.process.is_alive():
+                with self._worker_statistics_lock:
+                    self._worker_statistics[worker.name]['dropped'] += len(messages_for_worker)
+                self.logger.warning("The worker process {} is not running. Dropping {} messages.".format(
+                    worker.name, len(messages_for_worker)))
+                continue
+            try:
+                worker.messagequeue.put((messages_for_worker, force), block, timeout)
+            except queue.Full:
+                if self.publishqueue_policy == constants.PUBLISHQUEUE_POLICY_RAISE and not force:
+                    raise PublishQueueFullException("The queue for worker process {} is full.".format(worker.name))
+                with self._worker_statistics_lock:
+                    self._worker_statistics[worker.name]['dropped'] += len(messages_for_worker)
+                self.logger.warning("The queue for worker process {} is full. Dropping {} messages.".format(
+                    worker.name, len(messages_for_worker)))
+                continue
+            with self._worker_statistics_lock:
+                statistics = self._worker_statistics[worker.name]
+                statistics['batches'] += 1
+                statistics['messages'] += len(messages_for_worker)
+        return own_messages
+
+
+def _run_worker(name, host, port, certificate_directory, settings, outputsignals, use_clean_session,
+               messagequeue, ready_event):
+    """Publish the messages from a message queue, using an own MQTT connection. Runs in a worker process.
+
+    Args:
+        name (str): Name of the worker, used as MQTT client name
+        host (str): Broker host name.
+        port (int): Broker port number.
+        certificate_directory (str or None): Full path to the directory of the certificate files.
+        settings (dict): Values for the public attributes of the :class:`.App` object
+        outputsignals (list): Tuples (messagetype, servicename, signalname, send_as_retained,
+            offline_policy, message_expiry) for the outgoing data handled by the worker
+        use_clean_session (bool): Connect to broker using a clean session.
+        messagequeue (multiprocessing.Queue): Tuples (messages, force). Stops at the tuple (None, timeout).
+        ready_event (multiprocessing.Event): Is set when connected and ready (the first time).
+
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Keyboard interrupts are handled by the coordinator
+
+    connection = App(name, host, port, certificate_directory)
+    for attributename, value in settings.items():
+        setattr(connection, attributename, value)
+    for messagetype, servicename, signalname, send_as_retained, offline_policy, message_expiry in outputsignals:
+        outputsignalinformation = connection._register_outputsignal(messagetype, servicename, signalname,
+                                                                    None, send_as_retained)
+        outputsignalinformation.offline_policy = offline_policy
+        outputsignalinformation.message_expiry = message_expiry
+
+    connection.start(use_threaded_networking=True, use_clean_session=use_clean_session, wait=False)
+    while True:
+        if not ready_event.is_set() and connection._is_ready():
+            ready_event.set()
+        try:
+            messages, argument = messagequeue.get(True, constants.WORKER_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        if messages is None:
+            connection.stop(argument)
+            return
+        try:
+            connection._publish_many(messages, argument)
+        except Exception as err:
+            connection.logger.warning("Failed to publish {} messages. Error: '{}'".format(len(messages), err))
@@ -0,0 +1,247 @@
+#
+# Offline store-and-forward buffer for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import mmap
+import threading
+
+from . import constants
+from .publishqueue import Outgoingmessage
+
+
+_Record = collections.namedtuple('_Record', ['topic', 'qos', 'retain', 'is_text', 'offset', 'size'])
+_Slot = collections.namedtuple('_Slot', ['sequencenumber', 'offset', 'size'])
+
+
+class OfflineBuffer:
+    """Memory-bounded buffer for outgoing messages while disconnected from the broker.
+
+    The payloads are stored in a ring buffer of fixed size, either in memory
+    or in a memory-mapped file. The memory usage is thereby limited also when
+    disconnected for a long time. When the buffer is full, the oldest messages
+    are dropped.
+
+    Args:
+        max_messages (int): Max number of stored messages.
+        max_bytes (int): Size of the payload storage in bytes.
+        filename (str or None): Memory-mapped file for the payload storage. The file is
+            created or truncated. Use ``None`` for storage in memory.
+
+    Policies for each message:
+
+    * **all**: Store all messages.
+    * **latest**: Store only the latest message for the topic. A new message
+      replaces (and is stored after) any stored message on the same topic.
+
+    Messages are taken out in the order they were put in the buffer.
+
+    The object is thread safe.
+
+    """
+
+    def __init__(self,
+                 max_messages=constants.DEFAULT_OFFLINEBUFFER_MAX_MESSAGES,
+                 max_bytes=constants.DEFAULT_OFFLINEBUFFER_MAX_BYTES,
+                 filename=None):
+        if int(max_messages) < 1:
+            raise ValueError("The offline buffer must allow at least 1 message. Given: {!r}".format(max_messages))
+        if int(max_bytes) < 1:
+            raise ValueError("The offline buffer size must be at least 1 byte. Given: {!r}".format(max_bytes))
+
+        self.max_messages = int(max_messages)
+        self.max_bytes = int(max_bytes)
+        self.filename = filename
+
+        if filename is None:
+            self._file = None
+            self._storage = bytearray(self.max_bytes)
+        else:
+            self._file = open(filename, 'w+b')
+            self._file.truncate(self.max_bytes)
+            self._storage = mmap.mmap(self._file.fileno(), self.max_bytes)
+
+        self._records = collections.OrderedDict()  # Key: sequence number, Item: _Record. Stored messages, in order.
+        self._latest = {}  # Key: topic, Item: sequence number. For messages with the 'latest' policy.
+        self._slots = collections.deque()  # _Slot for each record in the storage (also removed records), in order.
+        self._tail = 0  # Storage offset for next payload
+        self._sequencenumber = 0
+        self._lock = threading.Lock()
+
+        self.number_of_bytes = 0
+        self.number_of_put = 0
+        self.number_of_replaced = 0
+        self.number_of_dropped = 0
+        self.number_of_taken = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return "Offline buffer: {} of max {} messages, {} of max {} bytes ({}).".format(
+            len(self._records), self.max_messages, self.number_of_bytes, self.max_bytes,
+            'memory' if self.filename is None else self.filename)
+
+    def put(self, message, policy=constants.OFFLINE_POLICY_ALL):
+        """Store an outgoing message.
+
+        Args:
+            message (Outgoingmessage): Message to be published later.
+            policy (str): ``'all'`` or ``'latest'``. See the ``OFFLINE_POLICY_`` constants
+                in :mod:`sgframework.constants`.
+
+        Messages larger than the storage are dropped.
+
+        """
+        if isinstance(message.payload, str):
+            data = message.payload.encode('utf-8')
+            is_text = True
+        else:
+            data = bytes(message.payload)
+            is_text = False
+        size = len(data)
+
+        with self._lock:
+            self.number_of_put += 1
+            if policy == constants.OFFLINE_POLICY_LATEST:
+                try:
+                    self._remove(self._latest[message.topic])
+                    self.number_of_replaced += 1
+                except KeyError:
+                    pass
+
+            if size > self.max_bytes:
+                self.number_of_dropped += 1
+                return
+            while len(self._records) >= self.max_messages:
+                self._remove(next(iter(self._records)))
+                self.number_of_dropped += 1
+            offset = self._allocate(size)
+
+            sequencenumber = self._sequencenumber
+            self._sequencenumber += 1
+            self._storage[offset:offset + size] = data
+            self._slots.append(_Slot(sequencenumber, offset, size))
+            self._tail = offset + size
+            self._records[sequencenumber] = _Record(message.topic, message.qos, message.retain, is_text, offset, size)
+            self.number_of_bytes += size
+            if policy == constants.OFFLINE_POLICY_LATEST:
+                self._latest[message.topic] = sequencenumber
+
+    def take(self, max_number):
+        """Take out the oldest stored messages.
+
+        Args:
+            max_number (int): Max number of messages to take out.
+
+        Returns a list of :class:`.Outgoingmessage`.
+
+        """
+        messages = []
+        with self._lock:
+            while self._records and len(messages) < max_number:
+                sequencenumber, record = self._records.popitem(last=False)
+                data = bytes(self._storage[record.offset:record.offset + record.size])
+                payload = data.decode('utf-8') if record.is_text else data
+                messages.append(Outgoingmessage(record.topic, payload, record.qos, record.retain))
+                self.number_of_bytes -= record.size
+                if self._latest.get(record.topic) == sequencenumber:
+                    del self._latest[record.topic]
+            self._release_unused_slots()
+            self.number_of_taken += len(messages)
+        return messages
+
+    def close(self):
+        """Close the memory-mapped file (if used). Stored messages are discarded."""
+        with self._lock:
+            self._records.clear()
+            self._latest.clear()
+            self._slots.clear()
+            self.number_of_bytes = 0
+            if self._file is not None:
+                self._storage.close()
+                self._file.close()
+                self._file = None
+
+    def get_statistics(self):
+        """Get statistics, for example for sizing the buffer.
+
+        Returns:
+            A dict with the keys ``depth`` (number of stored messages), ``bytes`` (size of
+            stored payloads), ``max_messages``, ``max_bytes``, ``put``, ``replaced`` (by newer
+            messages on the same topic), ``dropped`` and ``taken``.
+
+        """
+        with self._lock:
+            return {'depth': len(self._records),
+                    'bytes': self.number_of_bytes,
+                    'max_messages': self.max_messages,
+                    'max_bytes': self.max_bytes,
+                    'put': self.number_of_put,
+                    'replaced': self.number_of_replaced,
+                    'dropped': self.number_of_dropped,
+                    'taken': self.number_of_taken}
+
+    def _remove(self, sequencenumber):
+        """Remove a stored message. The storage is released later. The caller must hold the lock."""
+        record = self._records.pop(sequencenumber)
+        self.number_of_bytes -= record.size
+        if self._latest.get(record.topic) == sequencenumber:
+            del self._latest[record.topic]
+
+    def _release_unused_slots(self):
+        """Release storage for removed messages, from the oldest end. The caller must hold the lock."""
+        while self._slots and self._slots[0].sequencenumber not in self._records:
+            self._slots.popleft()
+        if not self._slots:
+            self._tail = 0
+
+    def _allocate(self, size):
+        """Find storage for a payload, dropping the oldest messages if necessary.
+
+        A payload is stored in one piece, so the storage at the end might be unused
+        when wrapping around. The caller must hold the lock.
+
+        Returns the storage offset.
+
+        """
+        while True:
+            self._release_unused_slots()
+            if not self._slots:
+                return 0
+            head = self._slots[0].offset
+            if self._tail > head or (self._tail == head and self._slots[0].size == 0):
+                if self._tail + size <= self.max_bytes:
+                    return self._tail
+                if size <= head:
+                    return 0
+            elif self._tail + size <= head:
+                return self._tail
+
+            # Drop the oldest message
+            self._remove(self._slots.popleft().sequencenumber)
+            self.number_of_dropped += 1
@@ -0,0 +1,145 @@
+#
+# Payload codecs for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import struct
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class TextCodec:
+    """Text payloads. This is the default behavior also without any codec.
+
+    Values are converted using ``str(value)``, and incoming payloads are
+    decoded as UTF-8 and stripped.
+
+    """
+    name = 'text'
+
+    def __repr__(self):
+        return "TextCodec"
+
+    def encode(self, value):
+        """Convert a value to a payload (str)."""
+        return str(value)
+
+    def decode(self, payload):
+        """Convert a payload (bytes) to a value (str)."""
+        return str(payload, encoding='utf-8').strip()
+
+
+class StructCodec:
+    """Numbers packed as binary data, using the :mod:`struct` module.
+
+    Args:
+        structformat (str): Format string, for example ``'<d'`` for a little-endian double,
+            or ``'<hhB'`` for two shorts and an unsigned char.
+
+    For a format with a single item, the value is a number. Otherwise it is a tuple.
+
+    """
+    name = 'struct'
+
+    def __init__(self, structformat):
+        try:
+            self._struct = struct.Struct(structformat)
+        except struct.error as err:
+            raise ValueError("Wrong struct format given: {!r}. Error: {}".format(structformat, err))
+        self._is_single = len(self._struct.unpack(bytes(self._struct.size))) == 1
+        self.structformat = structformat
+
+    def __repr__(self):
+        return "StructCodec({!r})".format(self.structformat)
+
+    def encode(self, value):
+        """Convert a value (number or tuple) to a payload (bytes)."""
+        if self._is_single:
+            return self._struct.pack(value)
+        return self._struct.pack(*value)
+
+    def decode(self, payload):
+        """Convert a payload (bytes) to a value (number or tuple)."""
+        values = self._struct.unpack(payload)
+        if self._is_single:
+            return values[0]
+        return values
+
+
+class CborCodec:
+    """CBOR payloads. Requires the ``cbor2`` package.
+
+    The values can be numbers, strings, lists, dicts etc.
+
+    """
+    name = 'cbor'
+
+    def __init__(self):
+        if cbor2 is None:
+            raise ImportError("The cbor2 package is required for the CBOR codec.")
+
+    def __repr__(self):
+        return "CborCodec"
+
+    def encode(self, value):
+        """Convert a value to a payload (bytes)."""
+        return cbor2.dumps(value)
+
+    def decode(self, payload):
+        """Convert a payload (bytes) to a value."""
+        return cbor2.loads(payload)
+
+
+class MessagePackCodec:
+    """MessagePack payloads. Requires the ``msgpack`` package.
+
+    The values can be numbers, strings, lists, dicts etc.
+
+    """
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack package is required for the MessagePack codec.")
+
+    def __repr__(self):
+        return "MessagePackCodec"
+
+    def encode(self, value):
+        """Convert a value to a payload (bytes)."""
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, payload):
+        """Convert a payload (bytes) to a value."""
+        return msgpack.unpackb(payload, raw=False)
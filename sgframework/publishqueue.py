@@ -0,0 +1,412 @@
+#
+# Outgoing publish queue for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import collections
+import threading
+import time
+
+from . import constants
+from .histogram import Histogram
+from .exceptions import PublishQueueFullException
+
+
+Outgoingmessage = collections.namedtuple('Outgoingmessage', ['topic', 'payload', 'qos', 'retain'])
+
+
+class PublishQueue:
+    """Bounded queue for outgoing MQTT messages.
+
+    Messages wait in the queue until there is room in the in-flight window.
+    A message is in flight from the moment it is handed over to the MQTT
+    client, until the MQTT client confirms the publication (the Paho
+    ``on_publish`` callback). This gives backpressure when the broker is slow.
+
+    Args:
+        maxsize (int): Max number of messages waiting in the queue.
+        policy (str): What to do when the queue is full. One of the
+            ``PUBLISHQUEUE_POLICY_`` constants in :mod:`sgframework.constants`.
+        max_inflight (int): Max number of messages in flight. Use 0 for unlimited.
+
+    Policies when the queue is full:
+
+    * **block**: Wait until there is room in the queue.
+    * **drop_oldest**: Discard the oldest message in the queue.
+    * **drop_newest**: Discard the message to be queued.
+    * **raise**: Raise :exc:`.PublishQueueFullException`.
+
+    The object is thread safe.
+
+    """
+
+    # Publication confirmations for not (yet) known message ids. Limited, as confirmations for
+    # messages published outside the queue never will be matched.
+    MAX_EARLY_CONFIRMATIONS = 1000
+
+    def __init__(self,
+                 maxsize=constants.DEFAULT_PUBLISHQUEUE_SIZE,
+                 policy=constants.DEFAULT_PUBLISHQUEUE_POLICY,
+                 max_inflight=constants.DEFAULT_MAX_INFLIGHT):
+        if policy not in constants.PUBLISHQUEUE_POLICIES:
+            raise ValueError("Wrong publish queue policy given: {!r}".format(policy))
+        if int(maxsize) < 1:
+            raise ValueError("The publish queue size must be at least 1. Given: {!r}".format(maxsize))
+        if int(max_inflight) < 0:
+            raise ValueError("The max number of messages in flight must not be negative. Given: {!r}".format(
+                max_inflight))
+
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self.max_inflight = int(max_inflight)
+
+        self._queue = collections.deque()
+        self._inflight = {}  # Key: mid, Item: (qos, topic, sendtime)
+        self._early_confirmations = collections.OrderedDict()  # Key: mid, Item: confirmation time
+        self._condition = threading.Condition()
+
+        # Time from handing over a message to the MQTT client until confirmation
+        self._latency_per_qos = {}  # Key: qos, Item: Histogram
+        self._latency_per_topic = {}  # Key: topic, Item: Histogram
+
+        self.max_depth = 0
+        self.number_of_handed_over = 0
+        self.number_of_confirmed = 0
+        self.number_of_dropped_oldest = 0
+        self.number_of_dropped_newest = 0
+        self.number_of_rejected = 0
+        self.number_of_blocked = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __repr__(self):
+        return "Publish queue: {} of max {} messages queued ({}), {} of max {} in flight.".format(
+            len(self._queue), self.maxsize, self.policy, len(self._inflight), self.max_inflight)
+
+    def put(self, message, force=False, wait=None, timeout=None):
+        """Put an outgoing message last in the queue.
+
+        Args:
+            message (Outgoingmessage): Message to be published.
+            force (bool): Ignore the queue size limit.
+            wait (function or None): Only used for the 'block' policy. It is
+                called repeatedly (without arguments) while the queue is full,
+                and should make the queue drain. For example running network
+                activities when not using threaded networking. If ``None``,
+                another thread is supposed to drain the queue. It may raise
+                :exc:`.PublishQueueFullException` to stop waiting.
+            timeout (numerical or None): Only used for the 'block' policy.
+                Max blocking time in seconds. ``None`` blocks until there is room.
+
+        Raises:
+            PublishQueueFullException: For the 'raise' policy when the queue is full,
+                and for the 'block' policy at timeout.
+
+        """
+        with self._condition:
+            if force or len(self._queue) < self.maxsize:
+                self._append(message)
+                return
+            if self.policy == constants.PUBLISHQUEUE_POLICY_DROP_NEWEST:
+                self.number_of_dropped_newest += 1
+                return
+            if self.policy == constants.PUBLISHQUEUE_POLICY_DROP_OLDEST:
+                self._queue.popleft()
+                self.number_of_dropped_oldest += 1
+                self._append(message)
+                return
+            if self.policy == constants.PUBLISHQUEUE_POLICY_RAISE:
+                self.number_of_rejected += 1
+                raise PublishQueueFullException("The publish queue is full ({} messages). Topic: {}".format(
+                    self.maxsize, message.topic))
+            self.number_of_blocked += 1
+
+        ## Policy 'block' ##
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._condition:
+                if len(self._queue) < self.maxsize:
+                    self._append(message)
+                    return
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.number_of_rejected += 1
+                    raise PublishQueueFullException(
+                        "Timeout when waiting for room in the publish queue ({} messages). Topic: {}".format(
+                            self.maxsize, message.topic))
+                if wait is None:
+                    self._condition.wait(remaining)
+                    continue
+            try:
+                wait()
+            except PublishQueueFullException:
+                with self._condition:
+                    self.number_of_rejected += 1
+                raise
+
+    def put_many(self, messages, force=False, wait=None, timeout=None):
+        """Put several outgoing messages last in the queue.
+
+        Args:
+            messages (list of Outgoingmessage): Messages to be published.
+
+        If there is room for all messages they are queued in one operation,
+        otherwise the policy is applied for each message. Other arguments are
+        described in :meth:`.put`.
+
+        """
+        with self._condition:
+            if force or len(self._queue) + len(messages) <= self.maxsize:
+                for message in messages:
+                    self._append(message)
+                return
+        for message in messages:
+            self.put(message, force, wait, timeout)
+
+    def putback(self, message):
+        """Put a message first in the queue, for example when it could not be handed over.
+
+        Args:
+            message (Outgoingmessage): Message to be published.
+
+        """
+        with self._condition:
+            self._queue.appendleft(message)
+
+    def get(self, ignore_inflight_limit=False):
+        """Get the first message in the queue, if the in-flight window allows.
+
+        Args:
+            ignore_inflight_limit (bool): Get a message even if the in-flight window is full.
+
+        Returns the message (an :class:`.Outgoingmessage`), or ``None`` if the queue is empty
+        or the in-flight window is full.
+
+        """
+        with self._condition:
+            if not self._queue:
+                return None
+            if not ignore_inflight_limit and self.max_inflight and len(self._inflight) >= self.max_inflight:
+                return None
+            message = self._queue.popleft()
+            self._condition.notify()
+            return message
+
+    def mark_inflight(self, mid, qos, topic=None, sendtime=None):
+        """Register that a message has been handed over to the MQTT client.
+
+        Args:
+            mid (int): MQTT message id
+            qos (int): MQTT quality of service for the message.
+            topic (str or None): Topic for the message, for the latency statistics.
+            sendtime (float or None): Time (from :func:`time.monotonic`) when the message was
+                handed over. Defaults to now.
+
+        The confirmation might already have arrived (from another thread).
+
+        """
+        if sendtime is None:
+            sendtime = time.monotonic()
+        with self._condition:
+            self.number_of_handed_over += 1
+            if mid in self._early_confirmations:
+                confirmationtime = self._early_confirmations.pop(mid)
+                self._add_latency(qos, topic, confirmationtime - sendtime)
+                self.number_of_confirmed += 1
+                return
+            self._inflight[mid] = (qos, topic, sendtime)
+
+    def confirm(self, mid):
+        """Register that the MQTT client has confirmed the publication of a message.
+
+        Args:
+            mid (int): MQTT message id
+
+        """
+        now = time.monotonic()
+        with self._condition:
+            try:
+                qos, topic, sendtime = self._inflight.pop(mid)
+            except KeyError:
+                self._early_confirmations[mid] = now
+                if len(self._early_confirmations) > self.MAX_EARLY_CONFIRMATIONS:
+                    self._early_confirmations.popitem(last=False)
+                return
+            self._add_latency(qos, topic, now - sendtime)
+            self.number_of_confirmed += 1
+
+    def drop_lost_inflight(self):
+        """Forget in-flight messages that are lost at a broker disconnect.
+
+        QoS 0 messages that not yet have been written to the socket are discarded
+        by the MQTT client at reconnect. Messages with higher QoS are resent by
+        the MQTT client, and will be confirmed later.
+
+        """
+        with self._condition:
+            for mid in [mid for mid, (qos, _, _) in self._inflight.items() if qos == 0]:
+                del self._inflight[mid]
+            self._early_confirmations.clear()
+
+    def get_statistics(self):
+        """Get statistics, for example for sizing the queue.
+
+        Returns:
+            A dict with the keys ``depth``, ``max_depth``, ``maxsize``, ``policy``, ``inflight``,
+            ``max_inflight``, ``handed_over``, ``confirmed``, ``dropped_oldest``, ``dropped_newest``,
+            ``rejected`` and ``blocked``.
+
+        """
+        with self._condition:
+            return {'depth': len(self._queue),
+                    'max_depth': self.max_depth,
+                    'maxsize': self.maxsize,
+                    'policy': self.policy,
+                    'inflight': len(self._inflight),
+                    'max_inflight': self.max_inflight,
+                    'handed_over': self.number_of_handed_over,
+                    'confirmed': self.number_of_confirmed,
+                    'dropped_oldest': self.number_of_dropped_oldest,
+                    'dropped_newest': self.number_of_dropped_newest,
+                    'rejected': self.number_of_rejected,
+                    'blocked': self.number_of_blocked}
+
+    def get_latency_statistics(self):
+        """Get statistics for the time from handing over messages to the MQTT client until confirmation.
+
+        For QoS 0 the confirmation is when the message is written to the socket, and for
+        QoS 1 and 2 when the broker has acknowledged the message.
+
+        Returns:
+            A dict with the keys ``per_qos`` and ``per_topic``, each having a dict
+            with histogram statistics (see :meth:`.Histogram.get_statistics`). Times are in seconds.
+            At most ``MAX_STATISTICS_TOPICS`` topics have separate histograms, and the remaining
+            topics share the histogram ``STATISTICS_OTHER_TOPICS``.
+
+        """
+        with self._condition:
+            return {'per_qos': {qos: histogram.get_statistics()
+                                for qos, histogram in self._latency_per_qos.items()},
+                    'per_topic': {topic: histogram.get_statistics()
+                                  for topic, histogram in self._latency_per_topic.items()}}
+
+    def _add_latency(self, qos, topic, latency):
+        """Add a confirmation latency to the histograms. The caller must hold the lock."""
+        try:
+            self._latency_per_qos[qos].add(latency)
+        except KeyError:
+            self._latency_per_qos[qos] = Histogram()
+            self._latency_per_qos[qos].add(latency)
+        if topic is None:
+            return
+        try:
+            self._latency_per_topic[topic].add(latency)
+        except KeyError:
+            if len(self._latency_per_topic) >= constants.MAX_STATISTICS_TOPICS:
+                topic = constants.STATISTICS_OTHER_TOPICS
+            self._latency_per_topic.setdefault(topic, Histogram()).add(latency)
+
+    def _append(self, message):
+        """Append a message. The caller must hold the lock."""
+        self._queue.append(message)
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+
+
+class ConflationBuffer:
+    """Buffer for outgoing messages, keeping only the latest pending message per topic.
+
+    A new message for a topic replaces the pending message for that topic
+    (keeping its position), which is counted as conflated. The pending messages
+    are taken out in the order the topics first were put in the buffer.
+
+    The object is thread safe.
+
+    """
+
+    def __init__(self):
+        self._messages = collections.OrderedDict()  # Key: topic, Item: Outgoingmessage
+        self._lock = threading.Lock()
+
+        self.max_depth = 0
+        self.number_of_put = 0
+        self.number_of_conflated = 0
+        self.number_of_taken = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __repr__(self):
+        return "Conflation buffer: {} topics pending, {} messages conflated.".format(
+            len(self._messages), self.number_of_conflated)
+
+    def put(self, message):
+        """Put an outgoing message in the buffer, replacing any pending message on the same topic.
+
+        Args:
+            message (Outgoingmessage): Message to be published.
+
+        """
+        with self._lock:
+            self.number_of_put += 1
+            if message.topic in self._messages:
+                self.number_of_conflated += 1
+            self._messages[message.topic] = message
+            if len(self._messages) > self.max_depth:
+                self.max_depth = len(self._messages)
+
+    def put_many(self, messages):
+        """Put several outgoing messages in the buffer. See :meth:`.put`."""
+        for message in messages:
+            self.put(message)
+
+    def take_all(self):
+        """Take out all pending messages.
+
+        Returns a list of :class:`.Outgoingmessage`.
+
+        """
+        with self._lock:
+            messages = list(self._messages.values())
+            self._messages.clear()
+            self.number_of_taken += len(messages)
+            return messages
+
+    def get_statistics(self):
+        """Get statistics.
+
+        Returns:
+            A dict with the keys ``depth`` (number of pending topics), ``max_depth``,
+            ``put``, ``conflated`` (number of replaced messages) and ``taken``.
+
+        """
+        with self._lock:
+            return {'depth': len(self._messages),
+                    'max_depth': self.max_depth,
+                    'put': self.number_of_put,
+                    'conflated': self.number_of_conflated,
+                    'taken': self.number_of_taken}
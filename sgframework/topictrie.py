@@ -0,0 +1,212 @@
+#
+# MQTT topic filter storage for the Secure Gateway framework.
+#
+# Author: Jonas Berg
+# Copyright (c) 2016, Semcon Sweden AB
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted
+# provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,  this list of conditions and
+#    the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Semcon Sweden AB nor the names of its contributors may be used to endorse or
+#    promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from . import constants
+
+
+def is_wildcard_topicfilter(topicfilter):
+    """Check whether a MQTT topic filter contains any wildcards.
+
+    Args:
+        topicfilter (str): MQTT topic filter, for example ``data/+/actualindoortemperature``
+
+    Returns True if the topic filter contains the ``+`` or ``#`` wildcards.
+
+    """
+    return constants.SUFFIX_WILDCARD_SINGLELEVEL in topicfilter or \
+        constants.SUFFIX_WILDCARD_MULTILEVEL in topicfilter
+
+
+def validate_topicfilter(topicfilter):
+    """Validate the wildcard usage in a MQTT topic filter.
+
+    Args:
+        topicfilter (str): MQTT topic filter
+
+    Raises:
+        ValueError: If a wildcard is not a full topic level,
+            or if ``#`` is not the last topic level.
+
+    """
+    levels = topicfilter.split(constants.MQTT_TOPIC_SEPARATOR)
+    for index, level in enumerate(levels):
+        if constants.SUFFIX_WILDCARD_MULTILEVEL in level:
+            if level != constants.SUFFIX_WILDCARD_MULTILEVEL or index != len(levels) - 1:
+                raise ValueError("The multi-level wildcard must be the last topic level: {!r}".format(topicfilter))
+        if constants.SUFFIX_WILDCARD_SINGLELEVEL in level and level != constants.SUFFIX_WILDCARD_SINGLELEVEL:
+            raise ValueError("The single-level wildcard must be a full topic level: {!r}".format(topicfilter))
+
+
+class TopicTrie:
+    """Storage of items (for example callback information) per MQTT topic filter.
+
+    Finds the items for all topic filters matching a topic, taking the ``+`` and ``#``
+    wildcards into account. The cost of a lookup depends on the number of
+    topic levels and matching wildcard branches, not on the number of stored topic filters.
+
+    Topics starting with ``$`` are not matched by wildcards on the first topic level,
+    according to the MQTT specification.
+
+    """
+    def __init__(self):
+        self._root = _Node()
+        self._number_of_items = 0
+
+    def __len__(self):
+        return self._number_of_items
+
+    def __repr__(self):
+        return "Topic trie with {} topic filters.".format(self._number_of_items)
+
+    def __contains__(self, topicfilter):
+        node = self._find_node(topicfilter)
+        return node is not None and node.has_item
+
+    def insert(self, topicfilter, item):
+        """Store an item for a topic filter. Replaces any previous item for the topic filter.
+
+        Args:
+            topicfilter (str): MQTT topic filter, can contain wildcards.
+            item: Object to store.
+
+        """
+        validate_topicfilter(topicfilter)
+        node = self._root
+        for level in topicfilter.split(constants.MQTT_TOPIC_SEPARATOR):
+            node = node.children.setdefault(level, _Node())
+        if not node.has_item:
+            self._number_of_items += 1
+        node.item = item
+        node.has_item = True
+
+    def get(self, topicfilter, default=None):
+        """Get the item stored for a topic filter (exact match, no wildcard matching).
+
+        Args:
+            topicfilter (str): MQTT topic filter
+            default: Returned if there is no item for the topic filter.
+
+        """
+        node = self._find_node(topicfilter)
+        if node is None or not node.has_item:
+            return default
+        return node.item
+
+    def remove(self, topicfilter):
+        """Remove the item for a topic filter.
+
+        Args:
+            topicfilter (str): MQTT topic filter
+
+        Returns the removed item.
+
+        Raises:
+            KeyError: If there is no item for the topic filter.
+
+        """
+        path = [self._root]
+        levels = topicfilter.split(constants.MQTT_TOPIC_SEPARATOR)
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                raise KeyError(topicfilter)
+            path.append(node)
+        node = path[-1]
+        if not node.has_item:
+            raise KeyError(topicfilter)
+        item = node.item
+        node.item = None
+        node.has_item = False
+        self._number_of_items -= 1
+
+        # Prune empty branches
+        for level, parent, child in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if child.has_item or child.children:
+                break
+            del parent.children[level]
+        return item
+
+    def match(self, topic):
+        """Find the items for all topic filters matching a topic.
+
+        Args:
+            topic (str): MQTT topic, without wildcards.
+
+        Returns a list of items.
+
+        """
+        levels = topic.split(constants.MQTT_TOPIC_SEPARATOR)
+        result = []
+        nodes = [self._root]
+        for index, level in enumerate(levels):
+            next_nodes = []
+            use_wildcards = index > 0 or not level.startswith('$')
+            for node in nodes:
+                children = node.children
+                if use_wildcards:
+                    multilevel_node = children.get(constants.SUFFIX_WILDCARD_MULTILEVEL)
+                    if multilevel_node is not None and multilevel_node.has_item:
+                        result.append(multilevel_node.item)
+                    singlelevel_node = children.get(constants.SUFFIX_WILDCARD_SINGLELEVEL)
+                    if singlelevel_node is not None:
+                        next_nodes.append(singlelevel_node)
+                exact_node = children.get(level)
+                if exact_node is not None:
+                    next_nodes.append(exact_node)
+            if not next_nodes:
+                return result
+            nodes = next_nodes
+
+        for node in nodes:
+            if node.has_item:
+                result.append(node.item)
+
+            # The multi-level wildcard matches also the parent level
+            multilevel_node = node.children.get(constants.SUFFIX_WILDCARD_MULTILEVEL)
+            if multilevel_node is not None and multilevel_node.has_item:
+                result.append(multilevel_node.item)
+        return result
+
+    def _find_node(self, topicfilter):
+        """Find the node for a topic filter, or None if not found."""
+        node = self._root
+        for level in topicfilter.split(constants.MQTT_TOPIC_SEPARATOR):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+
+class _Node:
+    """Node in the :class:`.TopicTrie`. Has child nodes per topic level."""
+    __slots__ = ('children', 'item', 'has_item')
+
+    def __init__(self):
+        self.children = {}
+        self.item = None
+        self.has_item = False
@@ -9,6 +9,7 @@ import time
 assert sys.version_info >= (3, 2, 0), "Python version 3.2 or later required!"
 
 import sgframework
+from sgframework.loopbackbroker import LoopbackBroker
 
 
 MQTT_HOST = "localhost"
@@ -26,11 +27,21 @@ def main():
                                    help="Number of MQTT messages to send. Defaults to %(default)s messages.",
                                    type=int,
                                    default=1000)
+    commandlineparser.add_argument('--loopback',
+                                   action='store_true',
+                                   help="Use an in-process loopback broker instead of the broker on {}:{}.".format(
+                                        MQTT_HOST, MQTT_PORT))
     commandline = commandlineparser.parse_args()
     assert commandline.n > 0, "You must send at least 1 message"
 
-      ## Set up SG resource ##
-    resource = sgframework.Resource(RESOURCE_NAME, MQTT_HOST)
+      ## Set up broker and SG resource ##
+    broker = None
+    host, port = MQTT_HOST, MQTT_PORT
+    if commandline.loopback:
+        broker = LoopbackBroker()
+        broker.start()
+        host, port = broker.host, broker.port
+    resource = sgframework.Resource(RESOURCE_NAME, host, port=port)
     resource.register_outgoing_data(DATA_SIGNAL_NAME)
     resource.start(use_threaded_networking=True)
 
@@ -48,8 +59,12 @@ def main():
             execution_time, messagerate))
 
       ## Shutting down ##
-    time.sleep(10)
+    if broker is None:
+        time.sleep(10)
     resource.stop()
+    if broker is not None:
+        print("Broker statistics: {}".format(broker.get_statistics()))
+        broker.stop()
 
 
 if __name__ == '__main__':
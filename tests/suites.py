@@ -2,37 +2,70 @@ import argparse
 import unittest
 
 try:
+    import test_asyncframework
+    import test_callbackexecutor
     import test_canadapter
     import test_climateapp
     import test_framework_app
     import test_framework_resource
+    import test_histogram
+    import test_lastvaluecache
+    import test_loopbackbroker
+    import test_metrics
     import test_minimal_taxiapp
     import test_minimal_taxisign
+    import test_multiprocessresource
+    import test_offlinebuffer
+    import test_payloadcodecs
+    import test_publishqueue
     import test_servicemanager
     import test_taxisignapp
     import test_taxisignservice
+    import test_topictrie
     import test_vehiclesimulator
 except:
+    from . import test_asyncframework
+    from . import test_callbackexecutor
     from . import test_canadapter
     from . import test_climateapp
     from . import test_framework_app
     from . import test_framework_resource
+    from . import test_histogram
+    from . import test_lastvaluecache
+    from . import test_loopbackbroker
+    from . import test_metrics
     from . import test_minimal_taxiapp
     from . import test_minimal_taxisign
+    from . import test_multiprocessresource
+    from . import test_offlinebuffer
+    from . import test_payloadcodecs
+    from . import test_publishqueue
     from . import test_servicemanager
     from . import test_taxisignapp
     from . import test_taxisignservice
+    from . import test_topictrie
     from . import test_vehiclesimulator
 
 
 def embedded():
     suite = unittest.TestSuite()
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_asyncframework))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_callbackexecutor))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_canadapter))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_framework_app))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_framework_resource))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_histogram))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_lastvaluecache))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_loopbackbroker))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_metrics))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_minimal_taxiapp))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_minimal_taxisign))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_multiprocessresource))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_offlinebuffer))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_payloadcodecs))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_publishqueue))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_servicemanager))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_topictrie))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_vehiclesimulator))
     return suite
 
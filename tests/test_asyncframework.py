@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_asyncframework
+----------------------------------
+
+Tests for the asyncio versions of the sgframework.
+
+"""
+import asyncio
+import sys
+import unittest
+import unittest.mock
+
+assert sys.version_info >= (3, 5, 0), "Python version 3.5 or later required!"
+
+import paho.mqtt.client as mqtt
+
+import sgframework
+
+
+def make_asyncresource_with_mocked_mqttclient(loop):
+    """AsyncResource that appears to be connected, but uses a mocked MQTT client."""
+    resource = sgframework.AsyncResource('testresource', 'localhost')
+    resource._asyncio_loop = loop
+    resource._ready_event = asyncio.Event()
+    resource._publishqueue_room_event = asyncio.Event()
+    resource.mqttclient = unittest.mock.Mock()
+    mids = iter(range(1, 10000))
+    resource.mqttclient.publish.side_effect = lambda *args, **kwargs: unittest.mock.Mock(rc=0, mid=next(mids))
+    resource._set_broker_connectionstatus(True)
+    return resource
+
+
+def make_message(topic, payload):
+    message = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+    message.payload = payload
+    return message
+
+
+async def on_command_async(app, messagetype, servicename, signalname, payload):
+    await asyncio.sleep(0)
+    return int(payload) * 2
+
+
+def on_command_sync(app, messagetype, servicename, signalname, payload):
+    return int(payload) * 3
+
+
+class TestAsyncResourceMockedClient(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def testRepr(self):
+        resource = sgframework.AsyncResource('testresource', 'localhost')
+        self.assertIn('SG AsyncResource', repr(resource))
+        app = sgframework.AsyncApp('testapp', 'localhost')
+        self.assertIn('SG AsyncApp', repr(app))
+
+    def testSendData(self):
+        resource = make_asyncresource_with_mocked_mqttclient(self.loop)
+        resource.register_outgoing_data('teststate')
+        self.loop.run_until_complete(resource.send_data('teststate', 5))
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', '5'))
+
+        self.loop.run_until_complete(resource.send_data_many({'teststate': 6}))
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', '6'))
+
+    def testSendDataBlockingTimeout(self):
+        resource = make_asyncresource_with_mocked_mqttclient(self.loop)
+        resource.publishqueue_policy = 'block'
+        resource.publishqueue_timeout = 0.01
+        resource._publishqueue.max_inflight = 1
+        resource._publishqueue.maxsize = 1
+        resource.register_outgoing_data('teststate')
+        self.loop.run_until_complete(resource.send_data('teststate', 1))
+        self.loop.run_until_complete(resource.send_data('teststate', 2))
+        self.assertRaises(sgframework.exceptions.PublishQueueFullException,
+                          self.loop.run_until_complete, resource.send_data('teststate', 3))
+
+    def testCoroutineCallback(self):
+        resource = make_asyncresource_with_mocked_mqttclient(self.loop)
+        resource.register_incoming_command('asynccommand', on_command_async, echo=True)
+        resource.register_incoming_command('synccommand', on_command_sync, echo=True)
+
+        async def deliver():
+            resource._on_incoming_message(None, None, make_message('command/testresource/asynccommand', b'4'))
+            resource._on_incoming_message(None, None, make_message('command/testresource/synccommand', b'4'))
+            await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(deliver())
+        published = [call[0] for call in resource.mqttclient.publish.call_args_list]
+        self.assertIn(('data/testresource/asynccommand', '8'), published)
+        self.assertIn(('data/testresource/synccommand', '12'), published)
+
+    def testRequest(self):
+        resource = make_asyncresource_with_mocked_mqttclient(self.loop)
+        resource.mqttclient.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 10000)
+
+        async def request_and_echo():
+            task = self.loop.create_task(resource.request('otherservice', 'othercommand', 4))
+            await asyncio.sleep(0.01)
+            resource._on_incoming_message(None, None, make_message('data/otherservice/othercommand', b'4'))
+            return await task
+
+        self.assertEqual(self.loop.run_until_complete(request_and_echo()), '4')
+        self.assertRaises(sgframework.exceptions.RequestTimeoutException, self.loop.run_until_complete,
+                          resource.request('otherservice', 'othercommand', 5, timeout=0.01))
+        self.assertEqual(resource.get_request_statistics()['timeouts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_callbackexecutor
+----------------------------------
+
+Tests for the callback executor of the sgframework.
+
+"""
+import sys
+import threading
+import time
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import paho.mqtt.client as mqtt
+
+import sgframework
+from sgframework.callbackexecutor import CallbackExecutor
+
+try:
+    from test_framework_resource import make_resource_with_mocked_mqttclient
+except ImportError:
+    from .test_framework_resource import make_resource_with_mocked_mqttclient
+
+
+def multiply(a, b):
+    return a * b
+
+
+class TestCallbackExecutor(unittest.TestCase):
+
+    def testConstructor(self):
+        executor = CallbackExecutor('thread', 2, 10)
+        self.assertEqual(len(executor), 0)
+        self.assertIn("0 of max 10 callbacks waiting, 2 thread workers", repr(executor))
+        executor.shutdown()
+
+    def testWrongConstructorInput(self):
+        self.assertRaises(ValueError, CallbackExecutor, 'hatt', 2, 10)
+        self.assertRaises(ValueError, CallbackExecutor, 'thread', 0, 10)
+        self.assertRaises(ValueError, CallbackExecutor, 'thread', 2, 0)
+
+    def testOrderingPerKey(self):
+        executor = CallbackExecutor('thread', 4, 100)
+        results = {'a': [], 'b': []}
+
+        def append(key, value):
+            time.sleep(0.001)
+            results[key].append(value)
+
+        for i in range(20):
+            executor.submit('a', 'a', append, ('a', i))
+            executor.submit('b', 'b', append, ('b', i))
+        executor.shutdown(wait=True)
+        self.assertEqual(results['a'], list(range(20)))
+        self.assertEqual(results['b'], list(range(20)))
+
+    def testParallelKeys(self):
+        executor = CallbackExecutor('thread', 2, 10)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        finished = []
+        executor.submit('a', 'a', slow, ())
+        started.wait(5)
+        executor.submit('b', 'b', finished.append, ('done',))
+        time.sleep(0.05)
+        self.assertEqual(finished, ['done'])
+        release.set()
+        executor.shutdown()
+
+    def testQueueFull(self):
+        executor = CallbackExecutor('thread', 1, 2)
+        release = threading.Event()
+        executor.submit('a', 'a', release.wait, (5,))
+        executor.submit('a', 'a', release.wait, (5,))
+        self.assertRaises(sgframework.exceptions.CallbackQueueFullException,
+                          executor.submit, 'b', 'b', release.wait, (5,))
+        self.assertEqual(executor.get_statistics()['rejected'], 1)
+        release.set()
+        executor.shutdown()
+
+    def testSubmitAfterShutdown(self):
+        executor = CallbackExecutor('thread', 1, 2)
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, 'a', 'a', multiply, (2, 3))
+        self.assertEqual(len(executor), 0)
+
+    def testSubmitDuringShutdown(self):
+        executor = CallbackExecutor('thread', 2, 1000)
+        rejected = threading.Event()
+
+        def produce():
+            while True:
+                try:
+                    executor.submit('a', 'a', time.sleep, (0.001,))
+                except sgframework.exceptions.CallbackQueueFullException:
+                    time.sleep(0.001)
+                except RuntimeError:
+                    rejected.set()
+                    return
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        time.sleep(0.05)
+        starttime = time.monotonic()
+        self.assertTrue(executor.shutdown(wait=True))
+        self.assertLess(time.monotonic() - starttime, 2)
+        self.assertTrue(rejected.wait(5))
+        producer.join(5)
+        self.assertEqual(len(executor), 0)
+
+    def testShutdownTimeout(self):
+        executor = CallbackExecutor('thread', 1, 10)
+        release = threading.Event()
+        executor.submit('a', 'a', release.wait, (5,))
+        starttime = time.monotonic()
+        self.assertFalse(executor.shutdown(wait=True, timeout=0.05))
+        self.assertLess(time.monotonic() - starttime, 1)
+        release.set()
+
+    def testResultsAndStatistics(self):
+        executor = CallbackExecutor('thread', 2, 10)
+        results = []
+        executor.submit('a', 'data/+/x', multiply, (2, 3), lambda value, error: results.append((value, error)))
+        executor.submit('a', 'data/+/x', multiply, (2,), lambda value, error: results.append((value, error)))
+        executor.shutdown()
+
+        self.assertEqual(results[0], (6, None))
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], TypeError)
+
+        statistics = executor.get_statistics()
+        self.assertEqual(statistics['depth'], 0)
+        self.assertGreaterEqual(statistics['max_depth'], 1)
+        callbackstatistics = statistics['callbacks']['data/+/x']
+        self.assertEqual(callbackstatistics['count'], 2)
+        self.assertEqual(callbackstatistics['failed'], 1)
+        self.assertGreaterEqual(callbackstatistics['run_time_max'], 0.0)
+        self.assertGreaterEqual(callbackstatistics['queued_time_total'], 0.0)
+
+    def testProcessPool(self):
+        executor = CallbackExecutor('process', 1, 10)
+        results = []
+        executor.submit('a', 'a', multiply, (4, 5), lambda value, error: results.append(value))
+        executor.shutdown()
+        self.assertEqual(results, [20])
+
+
+class TestCallbackExecutorMockedClient(unittest.TestCase):
+
+    def testCallbackExecutor(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._callbackexecutor = CallbackExecutor('thread', 2, 10)
+        received = []
+
+        def on_command(resource, messagetype, servicename, signalname, payload):
+            received.append(payload)
+            return payload + ' DONE'
+
+        resource.register_incoming_command('testcommand', on_command, echo=True)
+        for payload in ['A', 'B', 'C']:
+            message = mqtt.MQTTMessage(topic=b'command/testresource/testcommand')
+            message.payload = payload.encode('utf-8')
+            resource._on_incoming_message(resource.mqttclient, None, message)
+        resource._callbackexecutor.shutdown()
+
+        self.assertEqual(received, ['A', 'B', 'C'])
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/testcommand', 'C DONE'))
+        statistics = resource.get_callback_statistics()
+        self.assertEqual(statistics['callbacks']['command/testresource/testcommand']['count'], 3)
+
+        # Messages arriving during shutdown are dropped
+        with self.assertLogs('testresource', 'WARNING'):
+            resource._submit_callback(resource._inputsignal_infodict['command/testresource/testcommand'],
+                                      'command/testresource/testcommand', 'command', 'testresource',
+                                      'testcommand', 'D')
+        resource._callbackexecutor = None
+        with self.assertLogs('testresource', 'WARNING'):
+            resource._submit_callback(resource._inputsignal_infodict['command/testresource/testcommand'],
+                                      'command/testresource/testcommand', 'command', 'testresource',
+                                      'testcommand', 'D')
+        self.assertEqual(received, ['A', 'B', 'C'])
+
+    def testStopWithSlowCallback(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._callbackexecutor = CallbackExecutor('thread', 1, 10)
+        release = threading.Event()
+        resource._callbackexecutor.submit('a', 'a', release.wait, (5,))
+        starttime = time.monotonic()
+        with self.assertLogs('testresource', 'WARNING'):
+            resource.stop(timeout=0.05)
+        self.assertLess(time.monotonic() - starttime, 1)
+        self.assertIsNone(resource._callbackexecutor)
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
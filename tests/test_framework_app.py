@@ -17,8 +17,11 @@ import time
 assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
 import unittest.mock
 
+import paho.mqtt.client as mqtt
 
 import sgframework
+from sgframework.lastvaluecache import LastValueCache
+from sgframework.payloadcodecs import StructCodec
 
 
 def on_testservice_state_data(app, messagetype, servicename, signalname, payload):
@@ -29,6 +32,159 @@ def on_testservice_command_availability(app, messagetype, servicename, signalnam
     print("PAYLOAD AVAIL", payload, flush=True)
 
 
+def make_app_with_mocked_mqttclient():
+    """App that appears to be connected, but uses a mocked MQTT client."""
+    app = sgframework.App('testapp', 'localhost')
+    app.mqttclient = unittest.mock.Mock()
+    mids = iter(range(1, 10000))
+    app.mqttclient.publish.side_effect = lambda *args, **kwargs: unittest.mock.Mock(rc=0, mid=next(mids))
+    app.mqttclient.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 10000)
+    app._set_broker_connectionstatus(True)
+    return app
+
+
+class TestFrameworkAppMockedClient(unittest.TestCase):
+
+    def testIncomingTolerance(self):
+        app = make_app_with_mocked_mqttclient()
+        received = []
+        app.register_incoming_data('climateservice', '+', lambda *args: received.append(args[3:]), tolerance=0.05)
+        for signalname, payload in [('temperature', '22.01'), ('temperature', '22.02'), ('humidity', '22.02'),
+                                    ('temperature', '22.1'), ('temperature', 'N/A'), ('temperature', 'N/A'),
+                                    ('temperature', '22.1')]:
+            message = mqtt.MQTTMessage(topic='data/climateservice/{}'.format(signalname).encode('utf-8'))
+            message.payload = payload.encode('utf-8')
+            app._on_incoming_message(app.mqttclient, None, message)
+        self.assertEqual(received, [('temperature', '22.01'), ('humidity', '22.02'), ('temperature', '22.1'),
+                                    ('temperature', 'N/A'), ('temperature', '22.1')])
+
+    def testIncomingHysteresisAndMinInterval(self):
+        app = make_app_with_mocked_mqttclient()
+        received = []
+        app.register_incoming_data('climateservice', 'temperature', lambda *args: received.append(args[4]),
+                                   hysteresis=1, min_interval=1)
+        with unittest.mock.patch('time.monotonic') as monotonic:
+            for now, payload in [(0, '20'), (0.5, '21'), (1, '21'), (2, '21.5'), (3, '21'), (4, '20'), (5, '19')]:
+                monotonic.return_value = now
+                message = mqtt.MQTTMessage(topic=b'data/climateservice/temperature')
+                message.payload = payload.encode('utf-8')
+                app._on_incoming_message(app.mqttclient, None, message)
+        self.assertEqual(received, ['20', '21', '21.5', '20', '19'])
+
+    def testSubscriptionBatches(self):
+        app = make_app_with_mocked_mqttclient()
+        app._use_clean_session = False
+        app.subscribe_batch_size = 2
+        for i in range(5):
+            app.register_incoming_data('remoteservice', 'remotestate{}'.format(i), unittest.mock.Mock())
+
+        app._on_connect(app.mqttclient, None, {'session present': 0}, mqtt.CONNACK_ACCEPTED)
+        batches = [call[0][0] for call in app.mqttclient.subscribe.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0], [('data/remoteservice/remotestate0', 1), ('data/remoteservice/remotestate1', 1)])
+
+        app._on_connect(app.mqttclient, None, {'session present': 1}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(app.mqttclient.subscribe.call_count, 3)
+
+        app.register_incoming_data('remoteservice', 'otherstate', unittest.mock.Mock())
+        app._on_connect(app.mqttclient, None, {'session present': 1}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(app.mqttclient.subscribe.call_args[0][0], [('data/remoteservice/otherstate', 1)])
+
+        app._on_connect(app.mqttclient, None, {'session present': 0}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(app.mqttclient.subscribe.call_count, 7)
+
+    def testSubscriptionBatchesMaxPacketSize(self):
+        app = make_app_with_mocked_mqttclient()
+        app._broker_maximum_packet_size = 80
+        topics = ['data/remoteservice/remotestate{}'.format(i) for i in range(5)]  # 34 bytes each
+        self.assertEqual([len(batch) for batch in app._get_subscription_batches(topics)], [2, 2, 1])
+
+    def testLastValueCache(self):
+        app = make_app_with_mocked_mqttclient()
+        self.assertRaises(ValueError, app.get_latest, 'remoteservice', 'remotestate')
+        app._lastvaluecache = LastValueCache()  # As created by start() when using use_lastvaluecache
+        app.register_incoming_data('remoteservice', '+', unittest.mock.Mock(), callback_on_change_only=True)
+        app.register_incoming_data('rawservice', 'rawstate', unittest.mock.Mock(), raw='memoryview')
+        app.register_incoming_data('rawservice', '+', unittest.mock.Mock(), codec=StructCodec('<h'))
+        app.register_incoming_availability(app.PREFIX_RESOURCEAVAILABLE, 'remoteservice', '', unittest.mock.Mock())
+
+        for topic, payload in [(b'data/remoteservice/remotestate', b'1'),
+                               (b'data/remoteservice/remotestate', b'1'),
+                               (b'data/remoteservice/otherstate', b'2'),
+                               (b'data/rawservice/rawstate', b'42'),
+                               (b'resourceavailable/remoteservice/presence', b'True')]:
+            message = mqtt.MQTTMessage(topic=topic)
+            message.payload = payload
+            app._on_incoming_message_fast(app.mqttclient, None, message)
+
+        self.assertEqual(app.get_latest('remoteservice', 'remotestate').value, '1')
+        self.assertEqual(app.get_latest('rawservice', 'rawstate').value, '42')  # Same form for all registrations
+        self.assertEqual(app.get_latest('remoteservice', 'presence', app.PREFIX_RESOURCEAVAILABLE).value, 'True')
+        self.assertIsNone(app.get_latest('remoteservice', 'missingstate'))
+        self.assertEqual(sorted(item[2] for item in app.get_latest_values('data')),
+                         ['otherstate', 'rawstate', 'remotestate'])
+        self.assertEqual(app._lastvaluecache.number_of_put, 5)
+
+    def testSharedSubscription(self):
+        app = make_app_with_mocked_mqttclient()
+        callback = unittest.mock.Mock()
+        app.register_incoming_data('canadapter', '#', callback, share_group='testgroup')
+        for share_group in ['', 'test/group', 'test+', '#']:
+            self.assertRaises(ValueError, app.register_incoming_data,
+                              'canadapter', 'enginespeed', callback, share_group=share_group)
+
+        app._on_connect(app.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(app.mqttclient.subscribe.call_args[0][0], [('$share/testgroup/data/canadapter/#', 1)])
+
+        for use_fast_dispatch in [False, True]:
+            message = mqtt.MQTTMessage(topic=b'data/canadapter/enginespeed')
+            message.payload = b'3000'
+            if use_fast_dispatch:
+                app._on_incoming_message_fast(app.mqttclient, None, message)
+            else:
+                app._on_incoming_message(app.mqttclient, None, message)
+            callback.assert_called_with(app, 'data', 'canadapter', 'enginespeed', '3000')
+        self.assertEqual(callback.call_count, 2)
+
+    def testRequest(self):
+        app = make_app_with_mocked_mqttclient()
+        futures = [app.request('otherservice', 'othercommand', i, timeout=10) for i in range(3)]
+        self.assertEqual(app.mqttclient.publish.call_args[0], ('command/otherservice/othercommand', '2'))
+        app.mqttclient.subscribe.assert_called_once_with('data/otherservice/othercommand', 1)
+        self.assertFalse(any(future.done() for future in futures))
+
+        # Echoes resolve the requests in order. Retained echoes are ignored.
+        for payload, retain, use_fast_dispatch in [(b'9', True, False), (b'0', False, False), (b'1', False, True)]:
+            message = mqtt.MQTTMessage(topic=b'data/otherservice/othercommand')
+            message.payload = payload
+            message.retain = retain
+            if use_fast_dispatch:
+                app._on_incoming_message_fast(app.mqttclient, None, message)
+            else:
+                app._on_incoming_message(app.mqttclient, None, message)
+        self.assertEqual([future.result(0) for future in futures[:2]], ['0', '1'])
+        self.assertFalse(futures[2].done())
+
+        # Timeouts
+        future = app.request('otherservice', 'othercommand', 3, timeout=0)
+        app._expire_requests()
+        self.assertRaises(sgframework.exceptions.RequestTimeoutException, future.result, 0)
+        self.assertFalse(futures[2].done())
+
+        statistics = app.get_request_statistics()
+        self.assertEqual(statistics['requests'], 4)
+        self.assertEqual(statistics['responses'], 2)
+        self.assertEqual(statistics['timeouts'], 1)
+        self.assertEqual(statistics['outstanding'], 1)
+        self.assertEqual(statistics['roundtrip_time']['command/otherservice/othercommand']['count'], 2)
+
+        # Re-subscription at reconnect, and cancellation at stop
+        app._on_connect(app.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        self.assertIn(('data/otherservice/othercommand', 1), app.mqttclient.subscribe.call_args[0][0])
+        app._cancel_requests()
+        self.assertTrue(futures[2].cancelled())
+
+
 class TestFrameworkApp(unittest.TestCase):
 
     OUTPUT_FILE_SUBSCRIBER = 'temporary-sub.txt'
@@ -12,13 +12,20 @@ import os.path
 import os
 import subprocess
 import sys
+import threading
 import time
 import unittest
 
 assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
 import unittest.mock
 
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
 import sgframework
+from sgframework.lastvaluecache import LastValueCache
+from sgframework.payloadcodecs import StructCodec
 
 MQTT_TOPICS_TO_DELETE = [
                          'dataavailable/testresource/teststate',
@@ -101,6 +108,451 @@ class TestBaseFramework(unittest.TestCase):
                       output)
 
 
+def make_resource_with_mocked_mqttclient():
+    """Resource that appears to be connected, but uses a mocked MQTT client."""
+    resource = sgframework.Resource('testresource', 'localhost')
+    resource.mqttclient = unittest.mock.Mock()
+    mids = iter(range(1, 10000))
+    resource.mqttclient.publish.side_effect = lambda *args, **kwargs: unittest.mock.Mock(rc=0, mid=next(mids))
+    resource.mqttclient.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 10000)
+    resource._set_broker_connectionstatus(True)
+    return resource
+
+
+class TestFrameworkResourceMockedClient(unittest.TestCase):
+
+    def testSendDataMany(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.register_outgoing_data('teststate', defaultvalue=0)
+        resource.register_outgoing_data('teststate2', send_data_as_retained=True)
+        resource.send_data_many([('teststate', 1), ('teststateMissing', 2), ('teststate2', 3)])
+        resource.send_data_many({'teststate': 4})
+        calls = resource.mqttclient.publish.call_args_list
+        self.assertEqual([call[0] for call in calls], [('data/testresource/teststate', '1'),
+                                                       ('data/testresource/teststate2', '3'),
+                                                       ('data/testresource/teststate', '4')])
+        self.assertEqual(calls[1][1]['retain'], True)
+        self.assertEqual(resource._outputsignal_infodict['data/testresource/teststate'].defaultvalue, '4')
+
+    def testSendCommandMany(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.send_command_many('remoteservice', [('remotestate', 'ON'), ('remotestate2', 12)])
+        calls = resource.mqttclient.publish.call_args_list
+        self.assertEqual([call[0] for call in calls], [('command/remoteservice/remotestate', 'ON'),
+                                                       ('command/remoteservice/remotestate2', '12')])
+
+    def testSignalhandle(self):
+        resource = make_resource_with_mocked_mqttclient()
+        handle = resource.register_outgoing_data('teststate', defaultvalue=0, send_data_as_retained=True)
+        self.assertEqual(handle.topic, 'data/testresource/teststate')
+        self.assertTrue(handle.retain)
+        handle.publish(12.5)
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', '12.5'))
+        self.assertEqual(resource._outputsignal_infodict['data/testresource/teststate'].defaultvalue, '12.5')
+
+    def testSignalhandleForCommand(self):
+        resource = make_resource_with_mocked_mqttclient()
+        handle = resource.register_incoming_command('teststate', unittest.mock.Mock())
+        self.assertEqual(handle.topic, 'data/testresource/teststate')
+        handle.publish('ON')
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', 'ON'))
+
+        handle = resource.register_incoming_command('filteredstate', unittest.mock.Mock(), callback_on_change_only=True)
+        handle.publish(3)
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/filteredstate', '3'))
+
+    def testSignalhandleQos(self):
+        resource = sgframework.Resource('testresource', 'localhost')
+        handle = resource.register_outgoing_data('teststate')
+        self.assertRaises(ValueError, handle.publish, 1)
+        resource.qos = 2
+        resource.start()
+        self.assertEqual(handle.qos, 2)
+
+    def testSendManyBeforeStart(self):
+        resource = sgframework.Resource('testresource', 'localhost')
+        self.assertRaises(ValueError, resource.send_data_many, {'teststate': 1})
+        self.assertRaises(ValueError, resource.send_command_many, 'remoteservice', {'remotestate': 1})
+
+    def testWildcardDispatch(self):
+        resource = make_resource_with_mocked_mqttclient()
+        on_exact = unittest.mock.Mock()
+        on_wildcard = unittest.mock.Mock()
+        on_presence = unittest.mock.Mock()
+        resource.register_incoming_data('remoteservice', 'remotestate', on_exact)
+        resource.register_incoming_data('+', 'remotestate', on_wildcard, callback_on_change_only=True)
+        resource.register_incoming_availability('resourceavailable', '+', 'any', on_presence)
+
+        for topic, payload in [('data/remoteservice/remotestate', b'1'),
+                               ('data/otherservice/remotestate', b'2'),
+                               ('data/otherservice/remotestate', b'2'),
+                               ('data/remoteservice/remotestate', b'1'),
+                               ('resourceavailable/otherservice/presence', b'True')]:
+            resource._on_incoming_message(resource.mqttclient, None, unittest.mock.Mock(topic=topic, payload=payload))
+
+        self.assertEqual(on_exact.call_count, 2)
+        self.assertEqual(on_wildcard.call_count, 2)  # Change only, per topic
+        self.assertEqual(on_wildcard.call_args_list[1][0][1:], ('data', 'otherservice', 'remotestate', '2'))
+        self.assertEqual(on_presence.call_args[0][1:], ('resourceavailable', 'otherservice', 'presence', 'True'))
+
+    def testFastDispatch(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.use_fast_dispatch = True
+        on_command = unittest.mock.Mock(return_value=None)
+        on_wildcard = unittest.mock.Mock()
+        resource.register_incoming_command('teststate', on_command)
+        resource.register_incoming_data('remoteservice', '#', on_wildcard)
+
+        for topic, payload in [(b'command/testresource/teststate', b' ON '),
+                               (b'data/remoteservice/remotestate', b'12'),
+                               (b'data/remoteservice/remotestate/extralevel', b'13'),
+                               (b'data/otherservice/remotestate', b'14')]:
+            message = mqtt.MQTTMessage(topic=topic)
+            message.payload = payload
+            resource._on_incoming_message_fast(resource.mqttclient, None, message)
+
+        self.assertEqual(on_command.call_args[0][1:], ('command', 'testresource', 'teststate', 'ON'))
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', 'ON'))
+        self.assertEqual(on_wildcard.call_count, 1)
+        self.assertEqual(on_wildcard.call_args[0][1:], ('data', 'remoteservice', 'remotestate', '12'))
+        self.assertIsNone(resource._dispatch_cache[b'data/otherservice/remotestate'])
+        self.assertEqual(resource.get_metrics()['messages_in_per_topic'],
+                         {'command/testresource/teststate': 1, 'data/remoteservice/remotestate': 1,
+                          sgframework.constants.STATISTICS_OTHER_TOPICS: 2})
+
+    def testDispatchTableSize(self):
+        resource = make_resource_with_mocked_mqttclient()
+        on_data = unittest.mock.Mock()
+        on_wildcard = unittest.mock.Mock()
+        with unittest.mock.patch('sgframework.constants.MAX_DISPATCH_CACHE_SIZE', 3):
+            for i in range(5):
+                resource.register_incoming_data('remoteservice', 'state{}'.format(i), on_data)
+            resource.register_incoming_data('wildservice', '+', on_wildcard)
+            topics = [b'data/remoteservice/state' + str(i).encode() for i in range(5)]
+            for topic in topics + [b'data/wildservice/state', b'data/otherservice/state0',
+                                   b'data/otherservice/state1', b'data/wildservice/state',
+                                   b'data/otherservice/state2', b'data/otherservice/state3'] + topics:
+                message = mqtt.MQTTMessage(topic=topic)
+                message.payload = b'1'
+                resource._on_incoming_message_fast(resource.mqttclient, None, message)
+
+        self.assertEqual(on_data.call_count, 10)
+        self.assertEqual(on_wildcard.call_count, 2)
+        self.assertEqual(sorted(resource._dispatch_table), topics)  # More than the cache size, never evicted
+        self.assertEqual(list(resource._dispatch_cache), [b'data/wildservice/state', b'data/otherservice/state2',
+                                                          b'data/otherservice/state3'])
+
+    def testWrongWildcards(self):
+        resource = make_resource_with_mocked_mqttclient()
+        self.assertRaises(ValueError, resource.register_incoming_data, '#', 'remotestate', unittest.mock.Mock())
+        self.assertRaises(ValueError, resource.register_incoming_command, '+', unittest.mock.Mock())
+
+    def testDeadband(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.register_outgoing_data('temperature', deadband=0.5)
+        handle = resource.register_outgoing_data('speed', relative_deadband=0.1)
+        for value in [20.0, 20.2, 20.5, 20.6, 'ERROR', 'ERROR', 20.6]:
+            resource.send_data('temperature', value)
+        for value in [100, 105, 111, 112]:
+            handle.publish(value)
+        payloads = [call[0] for call in resource.mqttclient.publish.call_args_list]
+        self.assertEqual(payloads, [('data/testresource/temperature', '20.0'),
+                                    ('data/testresource/temperature', '20.6'),
+                                    ('data/testresource/temperature', 'ERROR'),
+                                    ('data/testresource/temperature', '20.6'),
+                                    ('data/testresource/speed', '100'),
+                                    ('data/testresource/speed', '111')])
+        self.assertEqual(resource._outputsignal_infodict['data/testresource/temperature'].number_of_filtered, 3)
+
+    def testMinIntervalAndRefresh(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.register_outgoing_data('temperature', 'UNKNOWN', deadband=1, min_interval=1, refresh_interval=10)
+        with unittest.mock.patch('time.monotonic') as monotonic:
+            for now, value in [(0, 20), (0.5, 25), (2, 20.5), (3, 25), (4, 25.5), (15, 25.5)]:
+                monotonic.return_value = now
+                resource.send_data_many({'temperature': value})
+        payloads = [call[0][1] for call in resource.mqttclient.publish.call_args_list]
+        self.assertEqual(payloads, ['20', '25', '25.5'])
+        self.assertEqual(resource._outputsignal_infodict['data/testresource/temperature'].defaultvalue, '25.5')
+
+    def testWrongFilterSettings(self):
+        resource = make_resource_with_mocked_mqttclient()
+        self.assertRaises(ValueError, resource.register_outgoing_data, 'temperature', deadband=-1)
+        self.assertRaises(ValueError, resource.register_outgoing_data, 'temperature', deadband=1, relative_deadband=1)
+        self.assertRaises(ValueError, resource.register_outgoing_data, 'temperature', min_interval=2, refresh_interval=1)
+
+    def testConflation(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._is_conflating = True
+        resource._publishqueue.max_inflight = 1
+        resource.register_outgoing_data('teststate')
+        handle = resource.register_outgoing_data('otherstate')
+        resource.send_command('remoteservice', 'remotestate', 'RUN')
+        resource.send_command('remoteservice', 'remotestate', 'RUN AGAIN')
+        for i in range(5):
+            resource.send_data('teststate', i)
+            handle.publish(i)
+        resource.send_data_many({'teststate': 10})
+        self.assertEqual(resource.mqttclient.publish.call_count, 1)
+
+        resource._flush_conflationbuffer()  # The publish queue is not empty
+        self.assertEqual(resource.get_conflation_statistics()['depth'], 2)
+
+        resource._on_publish(resource.mqttclient, None, 1)
+        resource._flush_conflationbuffer()
+        resource._on_publish(resource.mqttclient, None, 2)
+        resource._on_publish(resource.mqttclient, None, 3)
+        payloads = [call[0][:2] for call in resource.mqttclient.publish.call_args_list]
+        self.assertEqual(payloads, [('command/remoteservice/remotestate', 'RUN'),
+                                    ('command/remoteservice/remotestate', 'RUN AGAIN'),
+                                    ('data/testresource/teststate', '10'),
+                                    ('data/testresource/otherstate', '4')])
+        statistics = resource.get_conflation_statistics()
+        self.assertEqual(statistics['conflated'], 9)
+        self.assertEqual(statistics['taken'], 2)
+
+    def testConflationFlushedByLoop(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.mqttclient.loop.return_value = mqtt.MQTT_ERR_SUCCESS
+        resource._is_conflating = True
+        resource.conflation_interval = 0
+        resource.register_outgoing_data('teststate')
+        resource.send_data('teststate', 1)
+        resource.send_data('teststate', 2)
+        self.assertEqual(resource.mqttclient.publish.call_count, 0)
+        resource.loop()
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', '2'))
+
+    def testMqttv5TopicAliases(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._use_mqttv5 = True
+        resource.qos = 0
+        resource.topic_alias_threshold = 2
+        resource.message_expiry = 60
+        connack_properties = Properties(PacketTypes.CONNACK)
+        connack_properties.TopicAliasMaximum = 1
+        connack_properties.ReceiveMaximum = 10
+        resource._set_mqttv5_connection_properties(connack_properties)
+        self.assertEqual(resource._publishqueue.max_inflight, 10)
+
+        resource.register_outgoing_data('teststate', message_expiry=10)
+        resource.register_outgoing_data('otherstate')
+        for i in range(3):
+            resource.send_data('teststate', i)
+            resource.send_data('otherstate', i)
+        resource.send_command('remoteservice', 'remotestate', 'RUN')
+
+        calls = resource.mqttclient.publish.call_args_list
+        topics = [call[0][0] for call in calls]
+        self.assertEqual(topics, ['data/testresource/teststate',
+                                  'data/testresource/otherstate',
+                                  'data/testresource/teststate',
+                                  'data/testresource/otherstate',
+                                  '',
+                                  'data/testresource/otherstate',
+                                  'command/remoteservice/remotestate'])
+        self.assertFalse(hasattr(calls[0][1]['properties'], 'TopicAlias'))
+        self.assertEqual(calls[0][1]['properties'].MessageExpiryInterval, 10)
+        self.assertEqual(calls[2][1]['properties'].TopicAlias, 1)
+        self.assertEqual(calls[4][1]['properties'].TopicAlias, 1)
+        self.assertEqual(calls[5][1]['properties'].MessageExpiryInterval, 60)
+
+    def testReadiness(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._set_broker_connectionstatus(False)
+        subscription_mids = iter(range(100, 200))
+        resource.mqttclient.subscribe.side_effect = lambda *args, **kwargs: (mqtt.MQTT_ERR_SUCCESS,
+                                                                             next(subscription_mids))
+        resource.register_outgoing_data('teststate', defaultvalue=1)
+        resource.register_incoming_data('remoteservice', 'remotestate', unittest.mock.Mock())
+        self.assertFalse(resource._is_ready())
+
+        resource._on_connect(resource.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(resource._pending_subscriptions, {100})
+        self.assertFalse(resource._is_ready())
+        resource._on_subscribe(resource.mqttclient, None, 100, (1,))
+        self.assertFalse(resource._is_ready())  # Capabilities not yet confirmed
+        number_of_publications = resource.mqttclient.publish.call_count
+        for mid in range(1, number_of_publications + 1):
+            resource._on_publish(resource.mqttclient, None, mid)
+        self.assertTrue(resource._is_ready())
+
+    def testWaitForAcknowledgements(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._use_threaded_networking = True
+        resource.register_outgoing_data('teststate')
+        resource.send_data('teststate', 1)
+        self.assertFalse(resource._wait_for_acknowledgements(resource._is_ready, 0.01, None))
+
+        timer = threading.Timer(0.05, resource._on_publish, args=(resource.mqttclient, None, 1))
+        timer.start()
+        starttime = time.monotonic()
+        self.assertTrue(resource._wait_for_acknowledgements(resource._is_ready, 5, None))
+        self.assertLess(time.monotonic() - starttime, 1)
+        timer.join()
+
+    def testStopWaitsForConfirmations(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.register_outgoing_data('teststate')
+        resource.send_data('teststate', 1)
+        confirmed_mids = iter(range(1, 10000))
+        resource.mqttclient.loop.side_effect = lambda timeout: resource._on_publish(resource.mqttclient, None,
+                                                                                    next(confirmed_mids))
+        starttime = time.monotonic()
+        resource.stop(timeout=5)
+        self.assertLess(time.monotonic() - starttime, 1)
+        self.assertEqual(resource.mqttclient.loop.call_count, 2)  # Including the offline 'resourceavailable'
+        self.assertTrue(resource.mqttclient.disconnect.called)
+
+    def testReconnectBackoff(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._set_broker_connectionstatus(False)
+        resource.timeout = 0.05
+        resource.reconnect_delay_min = 0.02
+        resource.reconnect_delay_max = 0.08
+        resource.mqttclient.socket.return_value = None
+        resource.mqttclient.reconnect.side_effect = ConnectionRefusedError
+
+        delays = []
+        for i in range(5):
+            starttime = time.monotonic()
+            resource.loop()  # Connection attempt
+            self.assertLess(time.monotonic() - starttime, resource.timeout)
+            delays.append(resource._next_reconnect_time - time.monotonic())
+            while time.monotonic() < resource._next_reconnect_time:
+                starttime = time.monotonic()
+                resource.loop()  # Waiting
+                self.assertLess(time.monotonic() - starttime, resource.timeout + 0.02)
+
+        self.assertEqual(resource.mqttclient.reconnect.call_count, 5)
+        self.assertLessEqual(delays[0], 0.02)
+        self.assertGreater(delays[2], 0.02)
+        self.assertLessEqual(max(delays), 0.08)
+        metrics = resource.get_metrics()
+        self.assertEqual(metrics['reconnect_attempts'], 5)
+        self.assertGreater(metrics['disconnected_time'], 0.1)
+
+        resource.mqttclient.reconnect.side_effect = None
+        resource.loop()
+        resource._on_connect(resource.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        self.assertEqual(resource._number_of_reconnect_failures, 0)
+        self.assertEqual(resource.get_metrics()['connections'], 1)
+
+    def testRawPayloads(self):
+        for use_fast_dispatch in [False, True]:
+            resource = make_resource_with_mocked_mqttclient()
+            resource.use_fast_dispatch = use_fast_dispatch
+            received = []
+
+            def on_data(resource, topic, payload):
+                received.append((topic, payload))
+
+            def on_command(resource, topic, payload):
+                received.append((topic, payload))
+                return payload[1:]
+
+            resource.register_incoming_data('remoteservice', '+', on_data, raw='bytes')
+            resource.register_incoming_command('testcommand', on_command, raw='memoryview', echo=True)
+            self.assertRaises(ValueError, resource.register_incoming_data, 'remoteservice', 'remotestate',
+                              on_data, raw='hatt')
+            self.assertRaises(ValueError, resource.register_incoming_data, 'remoteservice', 'remotestate',
+                              on_data, raw='bytes', codec=StructCodec('<d'))
+
+            on_message = resource._on_incoming_message_fast if use_fast_dispatch else resource._on_incoming_message
+            for topic, payload in [(b'data/remoteservice/remotestate', b' \xff\x00 '),
+                                   (b'command/testresource/testcommand', b'\x01\x02\x03')]:
+                message = mqtt.MQTTMessage(topic=topic)
+                message.payload = payload
+                on_message(resource.mqttclient, None, message)
+
+            self.assertEqual(received[0], ('data/remoteservice/remotestate', b' \xff\x00 '))
+            self.assertEqual(received[1][0], 'command/testresource/testcommand')
+            self.assertIsInstance(received[1][1], memoryview)
+            self.assertEqual(received[1][1], b'\x01\x02\x03')
+            self.assertEqual(resource.mqttclient.publish.call_args[0],
+                             ('data/testresource/testcommand', b'\x02\x03'))
+
+    def testStartOrder(self):
+        resource = sgframework.Resource('testresource', 'localhost')
+        resource.use_lastvaluecache = True
+        states = []
+        resource._start_pool_connections = lambda: states.append((resource.mqttclient, resource._lastvaluecache))
+        with unittest.mock.patch.object(resource, '_connect_async'):
+            resource.start(wait=False)
+        mqttclient, lastvaluecache = states[0]
+        self.assertIsNone(mqttclient)  # Worker processes are forked before the MQTT client is created
+        self.assertIs(lastvaluecache, resource._lastvaluecache)
+        self.assertIsInstance(lastvaluecache, LastValueCache)
+        resource.stop()
+
+    def testReconnectAttemptsExcludeInitialConnection(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._initial_connect_pending = True  # As set by start()
+        resource.mqttclient.reconnect.side_effect = ConnectionRefusedError
+        resource._reconnect()
+        self.assertEqual(resource.get_metrics()['reconnect_attempts'], 0)
+        resource._reconnect()
+        self.assertEqual(resource.get_metrics()['reconnect_attempts'], 1)
+        self.assertEqual(resource.mqttclient.reconnect.call_count, 2)
+
+    def testConnectionPool(self):
+        def make_mqttclient(*args, **kwargs):
+            mqttclient = unittest.mock.Mock()
+            mids = iter(range(1, 10000))
+            mqttclient.publish.side_effect = lambda *args, **kwargs: unittest.mock.Mock(rc=0, mid=next(mids))
+            mqttclient.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 10000)
+            return mqttclient
+
+        resource = sgframework.Resource('testresource', 'localhost')
+        resource.connection_pool_size = 3
+        received = []
+        signalnames = ['signal{}'.format(i) for i in range(12)]
+        for signalname in signalnames:
+            resource.register_outgoing_data(signalname)
+            resource.register_incoming_command(signalname, lambda *args: received.append(args), echo=True)
+        with self.assertRaises(ValueError):
+            resource.start(use_threaded_networking=False)
+        with unittest.mock.patch('paho.mqtt.client.Client', side_effect=make_mqttclient):
+            resource.start(use_threaded_networking=True, wait=False)
+        connections = [resource] + resource._pool_connections
+        self.assertEqual([connection.name for connection in connections],
+                         ['testresource', 'testresource-1', 'testresource-2'])
+        for connection in connections:
+            connection._on_connect(connection.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+
+        # Each command is subscribed by one connection only
+        subscribed = [[topic for call in connection.mqttclient.subscribe.call_args_list for topic, qos in call[0][0]]
+                      for connection in connections]
+        self.assertTrue(all(subscribed))
+        self.assertEqual(sorted(sum(subscribed, [])),
+                         sorted('command/testresource/' + signalname for signalname in signalnames))
+        self.assertEqual([statistics['subscriptions'] for statistics in resource.get_connection_statistics()],
+                         [len(topics) for topics in subscribed])
+
+        # The presence is published by the first connection only
+        published = [[call[0][0] for call in connection.mqttclient.publish.call_args_list]
+                     for connection in connections]
+        self.assertIn('resourceavailable/testresource/presence', published[0])
+        self.assertNotIn('resourceavailable/testresource/presence', published[1] + published[2])
+
+        # Data, commands and echoes for a signal use the same connection, in order
+        topic = 'data/testresource/signal5'
+        owner = connections[resource._get_connection_index(topic)]
+        resource.send_data_many([('signal5', 1), ('signal6', 1)])
+        resource.send_data('signal5', 2)
+        message = mqtt.MQTTMessage(topic=b'command/testresource/signal5')
+        message.payload = b'3'
+        owner._on_incoming_message(owner.mqttclient, None, message)
+        self.assertIs(received[0][0], resource)
+        self.assertEqual([call[0] for call in owner.mqttclient.publish.call_args_list if call[0][0] == topic],
+                         [(topic, '1'), (topic, '2'), (topic, '3')])
+
+        resource.stop(timeout=0)
+        self.assertEqual(resource._pool_connections, [])
+        for connection in connections:
+            connection.mqttclient.disconnect.assert_called_once_with()
+
+
 class TestFrameworkResource(unittest.TestCase):
 
     OUTPUT_FILE_SUBSCRIBER = 'temporary-sub.txt'
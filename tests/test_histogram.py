@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_histogram
+----------------------------------
+
+Tests for the histograms of the sgframework.
+
+"""
+import json
+import sys
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+from sgframework.histogram import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def testEmpty(self):
+        histogram = Histogram()
+        statistics = histogram.get_statistics()
+        self.assertEqual(statistics['count'], 0)
+        self.assertIsNone(statistics['mean'])
+        self.assertIsNone(statistics['p99'])
+
+    def testAdd(self):
+        histogram = Histogram([1, 2, 5])
+        for value in [0.5, 1, 1.5, 3, 7]:
+            histogram.add(value)
+        statistics = histogram.get_statistics()
+        self.assertEqual(statistics['count'], 5)
+        self.assertAlmostEqual(statistics['mean'], 2.6)
+        self.assertEqual(statistics['min'], 0.5)
+        self.assertEqual(statistics['max'], 7)
+        self.assertEqual(statistics['buckets'], [[1, 2], [2, 1], [5, 1], [None, 1]])
+        self.assertEqual(statistics['p50'], 2)
+        self.assertEqual(statistics['p90'], 7)
+        json.dumps(statistics)
+
+    def testPercentileLimitedByMax(self):
+        histogram = Histogram([1, 2, 5])
+        histogram.add(0.1)
+        self.assertEqual(histogram.get_percentile(50), 0.1)
+
+    def testWrongBounds(self):
+        self.assertRaises(ValueError, Histogram, [])
+        self.assertRaises(ValueError, Histogram, [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_lastvaluecache
+----------------------------------
+
+Tests for the last value cache of the sgframework.
+
+"""
+import sys
+import time
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+from sgframework.lastvaluecache import LastValueCache
+
+
+class TestLastValueCache(unittest.TestCase):
+
+    def testConstructor(self):
+        cache = LastValueCache()
+        self.assertEqual(len(cache), 0)
+        self.assertIn("0 topics", repr(cache))
+
+    def testPutGet(self):
+        cache = LastValueCache()
+        self.assertIsNone(cache.get('data', 'climateservice', 'indoortemperature'))
+
+        before = time.time()
+        cache.put('data', 'climateservice', 'indoortemperature', '21.5')
+        cache.put('data', 'climateservice', 'indoortemperature', '22.0')
+        cache.put('dataavailable', 'climateservice', 'indoortemperature', 'True', timestamp=123.0)
+        cachedvalue = cache.get('data', 'climateservice', 'indoortemperature')
+        self.assertEqual(cachedvalue.value, '22.0')
+        self.assertGreaterEqual(cachedvalue.timestamp, before)
+        self.assertEqual(cache.get('dataavailable', 'climateservice', 'indoortemperature').timestamp, 123.0)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.number_of_put, 3)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def testSnapshot(self):
+        cache = LastValueCache()
+        cache.put('data', 'climateservice', 'indoortemperature', '21.5', timestamp=1.0)
+        cache.put('dataavailable', 'climateservice', 'indoortemperature', 'True', timestamp=2.0)
+        snapshot = cache.snapshot()
+        cache.put('data', 'climateservice', 'outdoortemperature', '5.0')
+
+        items = sorted(snapshot)
+        self.assertEqual([item[:3] for item in items], [('data', 'climateservice', 'indoortemperature'),
+                                                        ('dataavailable', 'climateservice', 'indoortemperature')])
+        self.assertEqual(items[0][3].value, '21.5')
+        self.assertEqual(len(list(cache.snapshot('data'))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
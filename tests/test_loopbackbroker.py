@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_loopbackbroker
+----------------------------------
+
+Tests for the in-process MQTT broker of the sgframework.
+
+"""
+import asyncio
+import sys
+import threading
+import time
+import unittest
+
+import paho.mqtt.client as mqtt
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import sgframework
+from sgframework.loopbackbroker import LoopbackBroker
+
+WAIT_TIMEOUT = 5  # seconds
+
+
+def wait_until(condition, timeout=WAIT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timeout while waiting")
+        time.sleep(0.005)
+
+
+class Subscriber:
+    """Paho client storing the received messages as (topic, payload, qos, retain)."""
+
+    def __init__(self, broker, client_id, protocol=mqtt.MQTTv311):
+        self.messages = []
+        self.acknowledged = threading.Event()
+        self.mqttclient = mqtt.Client(client_id, protocol=protocol)
+        self.mqttclient.on_message = self._on_message
+        self.mqttclient.on_subscribe = lambda *args: self.acknowledged.set()
+        self.mqttclient.on_unsubscribe = lambda *args: self.acknowledged.set()
+        self.mqttclient.connect(broker.host, broker.port)
+        self.mqttclient.loop_start()
+
+    def subscribe(self, topics):
+        self.acknowledged.clear()
+        self.mqttclient.subscribe(topics)
+        assert self.acknowledged.wait(WAIT_TIMEOUT)
+
+    def unsubscribe(self, topic):
+        self.acknowledged.clear()
+        self.mqttclient.unsubscribe(topic)
+        assert self.acknowledged.wait(WAIT_TIMEOUT)
+
+    def stop(self):
+        self.mqttclient.disconnect()
+        self.mqttclient.loop_stop()
+
+    def _on_message(self, mqttclient, userdata, message):
+        self.messages.append((message.topic, message.payload, message.qos, bool(message.retain)))
+
+
+class TestLoopbackBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = LoopbackBroker()
+        self.broker.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.stop()
+        self.broker.stop()
+
+    def make_subscriber(self, client_id, **kwargs):
+        self.clients.append(Subscriber(self.broker, client_id, **kwargs))
+        return self.clients[-1]
+
+    def testRepr(self):
+        self.assertIn('SG LoopbackBroker on 127.0.0.1:{}'.format(self.broker.port), repr(self.broker))
+        self.assertRaises(ValueError, self.broker.start)
+
+    def testWildcardsAndQos(self):
+        subscriber = self.make_subscriber('subscriber', protocol=mqtt.MQTTv31)
+        subscriber.subscribe([('data/+/temperature', 1), ('command/#', 0), ('$SYS/#', 0)])
+        publisher = self.make_subscriber('publisher')
+        publisher.mqttclient.publish('data/climateservice/temperature', b'21', qos=1).wait_for_publish()
+        publisher.mqttclient.publish('data/climateservice/humidity', b'40', qos=1).wait_for_publish()
+        publisher.mqttclient.publish('command/climateservice/heater', b'on', qos=1).wait_for_publish()
+        publisher.mqttclient.publish('command', b'parent', qos=2).wait_for_publish()
+        publisher.mqttclient.publish('data/canadapter/temperature', b'5', qos=2).wait_for_publish()
+
+        wait_until(lambda: len(subscriber.messages) == 4)
+        self.assertEqual(subscriber.messages, [('data/climateservice/temperature', b'21', 1, False),
+                                               ('command/climateservice/heater', b'on', 0, False),
+                                               ('command', b'parent', 0, False),
+                                               ('data/canadapter/temperature', b'5', 1, False)])
+
+        subscriber.unsubscribe('command/#')
+        publisher.mqttclient.publish('command/climateservice/heater', b'off', qos=1).wait_for_publish()
+        publisher.mqttclient.publish('data/climateservice/temperature', b'22', qos=1).wait_for_publish()
+        wait_until(lambda: len(subscriber.messages) == 5)
+        self.assertEqual(subscriber.messages[-1], ('data/climateservice/temperature', b'22', 1, False))
+
+        statistics = self.broker.get_statistics()
+        self.assertEqual(statistics['clients'], 2)
+        self.assertEqual(statistics['received'], 7)
+        self.assertEqual(statistics['delivered'], 5)
+        self.assertEqual(statistics['subscriptions'], 2)
+
+    def testRetainedMessages(self):
+        publisher = self.make_subscriber('publisher')
+        publisher.mqttclient.publish('data/climateservice/temperature', b'21', qos=1, retain=True).wait_for_publish()
+        publisher.mqttclient.publish('data/climateservice/humidity', b'40', qos=0, retain=True).wait_for_publish()
+        publisher.mqttclient.publish('data/climateservice/pressure', b'1', qos=1, retain=True).wait_for_publish()
+        publisher.mqttclient.publish('data/climateservice/pressure', b'', qos=1, retain=True).wait_for_publish()
+        self.assertEqual(self.broker.get_retained_messages(), {'data/climateservice/temperature': b'21',
+                                                               'data/climateservice/humidity': b'40'})
+
+        subscriber = self.make_subscriber('subscriber')
+        subscriber.subscribe([('data/climateservice/#', 1)])
+        wait_until(lambda: len(subscriber.messages) == 2)
+        self.assertEqual(subscriber.messages, [('data/climateservice/humidity', b'40', 0, True),
+                                               ('data/climateservice/temperature', b'21', 1, True)])
+
+        publisher.mqttclient.publish('data/climateservice/humidity', b'41', qos=1, retain=True).wait_for_publish()
+        wait_until(lambda: len(subscriber.messages) == 3)
+        self.assertEqual(subscriber.messages[-1], ('data/climateservice/humidity', b'41', 1, False))
+
+    def testLastWill(self):
+        subscriber = self.make_subscriber('subscriber')
+        subscriber.subscribe([('resourceavailable/#', 1)])
+
+        for client_id, payload in [('clean', b'clean'), ('dropped', b'dropped')]:
+            client = mqtt.Client(client_id)
+            client.will_set('resourceavailable/{}/presence'.format(client_id), payload, qos=1, retain=True)
+            client.connect(self.broker.host, self.broker.port)
+            wait_until(lambda: client_id in self.broker.get_client_ids())
+            if client_id == 'clean':
+                client.disconnect()
+            else:
+                self.broker.drop_client(client_id)
+            wait_until(lambda: client_id not in self.broker.get_client_ids())
+
+        wait_until(lambda: subscriber.messages)
+        self.assertEqual(subscriber.messages, [('resourceavailable/dropped/presence', b'dropped', 1, False)])
+        self.assertEqual(self.broker.get_retained_messages(), {'resourceavailable/dropped/presence': b'dropped'})
+        self.assertRaises(KeyError, self.broker.drop_client, 'dropped')
+
+    def testSharedSubscription(self):
+        members = [self.make_subscriber('member{}'.format(i)) for i in range(2)]
+        for member in members:
+            member.subscribe([('$share/testgroup/data/#', 1)])
+        publisher = self.make_subscriber('publisher')
+        for i in range(4):
+            publisher.mqttclient.publish('data/canadapter/enginespeed', str(i), qos=1).wait_for_publish()
+        wait_until(lambda: sum(len(member.messages) for member in members) == 4)
+        self.assertEqual([len(member.messages) for member in members], [2, 2])
+
+    def testTakeover(self):
+        first = mqtt.Client('sameid')
+        first.connect(self.broker.host, self.broker.port)
+        first.subscribe('data/#')
+        wait_until(lambda: self.broker.get_statistics()['subscriptions'] == 1)
+        self.make_subscriber('sameid')
+        wait_until(lambda: self.broker.get_statistics()['subscriptions'] == 0)
+        self.assertEqual(self.broker.get_client_ids(), ['sameid'])
+        self.assertEqual(self.broker.get_statistics()['connections'], 2)
+
+    def testRefusedProtocol(self):
+        client = mqtt.Client('v5client', protocol=mqtt.MQTTv5)
+        results = []
+        client.on_connect = lambda mqttclient, userdata, flags, rc, properties=None: results.append(rc)
+        client.connect(self.broker.host, self.broker.port)
+        wait_until(lambda: client.loop(0.01) != mqtt.MQTT_ERR_SUCCESS or results)
+        self.assertNotEqual(results[0], 0)
+        self.assertEqual(self.broker.get_client_ids(), [])
+
+
+class TestFrameworkWithLoopbackBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = LoopbackBroker()
+        self.broker.start()
+
+    def tearDown(self):
+        self.broker.stop()
+
+    def testResourceAndApp(self):
+        received = []
+        commands = []
+        resource = sgframework.Resource('climateservice', self.broker.host, port=self.broker.port)
+        resource.register_outgoing_data('temperature', send_data_as_retained=True)
+        resource.register_incoming_command('heater', lambda *args: commands.append(args[-1]) or args[-1], echo=True)
+        resource.start(use_threaded_networking=True)
+
+        app = sgframework.App('climateapp', self.broker.host, port=self.broker.port)
+        app.register_incoming_data('climateservice', 'temperature', lambda *args: received.append(args[1:]))
+        app.register_incoming_availability(sgframework.constants.PREFIX_RESOURCEAVAILABLE,
+                                           'climateservice', 'presence', lambda *args: received.append(args[1:]))
+        try:
+            resource.send_data('temperature', 21)
+            self.assertTrue(app.start(use_threaded_networking=True))
+            wait_until(lambda: ('data', 'climateservice', 'temperature', '21') in received)
+            self.assertIn(('resourceavailable', 'climateservice', 'presence', 'True'), received)
+
+            # Commands with echoes
+            self.assertEqual(app.request('climateservice', 'heater', 'on').result(WAIT_TIMEOUT), 'on')
+            self.assertEqual(commands, ['on'])
+
+            # Last will at network failure, and reconnection
+            resource_client_id = [client_id for client_id in self.broker.get_client_ids()
+                                  if client_id.startswith('climateservice')][0]
+            del received[:]
+            self.broker.drop_client(resource_client_id)
+            wait_until(lambda: ('resourceavailable', 'climateservice', 'presence', 'True') in received)
+            self.assertEqual(received[0], ('resourceavailable', 'climateservice', 'presence', 'False'))
+        finally:
+            app.stop()
+            resource.stop()
+
+    def testRequestWithConnectionPool(self):
+        signalnames = ['a', 'b', 'c', 'd', 'e', 'f']
+        resource = sgframework.Resource('climateservice', self.broker.host, port=self.broker.port)
+        for signalname in signalnames + ['g']:
+            resource.register_incoming_command(signalname, lambda *args: args[-1], echo=True)
+        resource.start(use_threaded_networking=True)
+
+        received = []
+        app = sgframework.App('climateapp', self.broker.host, port=self.broker.port)
+        app.connection_pool_size = 3
+        for signalname in signalnames:
+            app.register_incoming_data('climateservice', signalname, lambda *args: received.append(args[-1]))
+        try:
+            self.assertTrue(app.start(use_threaded_networking=True))
+            self.assertGreater(max(app._get_connection_index('data/climateservice/' + signalname)
+                                   for signalname in signalnames), 0)
+            futures = [app.request('climateservice', signalname, signalname + '1')
+                       for signalname in signalnames + ['g']]
+            self.assertEqual([future.result(WAIT_TIMEOUT) for future in futures],
+                             [signalname + '1' for signalname in signalnames + ['g']])
+            self.assertEqual(sorted(received), sorted(signalname + '1' for signalname in signalnames))
+            statistics = app.get_request_statistics()
+            self.assertEqual(statistics['responses'], 7)
+            self.assertEqual(statistics['outstanding'], 0)
+        finally:
+            app.stop()
+            resource.stop()
+
+    def testAsyncResourceReconnect(self):
+        loop = asyncio.new_event_loop()
+        resource = sgframework.AsyncResource('climateservice', self.broker.host, port=self.broker.port)
+        resource.reconnect_delay_min = 0.01
+
+        async def run():
+            await resource.start(timeout=WAIT_TIMEOUT)
+            self.broker.drop_client(self.broker.get_client_ids()[0])
+            while self.broker.get_statistics()['connections'] < 2 or not resource._broker_connected:
+                await asyncio.sleep(0.01)
+            await resource.stop()
+
+        try:
+            loop.run_until_complete(asyncio.wait_for(run(), WAIT_TIMEOUT))
+        finally:
+            loop.close()
+        self.assertEqual(resource.get_metrics()['reconnect_attempts'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for the metrics of the sgframework.
+
+"""
+import json
+import sys
+import unittest
+import unittest.mock
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import paho.mqtt.client as mqtt
+
+import sgframework
+from sgframework.metrics import Metrics, get_payload_size
+
+try:
+    from test_framework_resource import make_resource_with_mocked_mqttclient
+except ImportError:
+    from .test_framework_resource import make_resource_with_mocked_mqttclient
+
+
+class TestMetrics(unittest.TestCase):
+
+    def testCounters(self):
+        metrics = Metrics()
+        metrics.add_incoming('data/remoteservice/remotestate', 3, 0.001)
+        metrics.add_incoming('data/remoteservice/remotestate', 5, 0.002)
+        metrics.add_outgoing('data/testresource/teststate', 10)
+        metrics.add_callback(0.001)
+        metrics.add_callback(None, failed=True)
+        metrics.add_connection()
+
+        result = metrics.get_metrics()
+        self.assertEqual(result['messages_in'], 2)
+        self.assertEqual(result['bytes_in'], 8)
+        self.assertEqual(result['messages_in_per_topic'], {'data/remoteservice/remotestate': 2})
+        self.assertEqual(result['messages_out'], 1)
+        self.assertEqual(result['bytes_out'], 10)
+        self.assertEqual(result['callbacks'], 2)
+        self.assertEqual(result['failed_callbacks'], 1)
+        self.assertEqual(result['callback_time']['count'], 1)
+        self.assertEqual(result['dispatch_time']['count'], 2)
+        self.assertEqual(result['connections'], 1)
+        self.assertEqual(result['reconnects'], 0)
+        self.assertGreater(result['messages_in_per_second'], 0)
+        json.dumps(result)
+
+    def testMaxTopics(self):
+        metrics = Metrics()
+        with unittest.mock.patch('sgframework.constants.MAX_STATISTICS_TOPICS', 2):
+            for i in range(4):
+                metrics.add_incoming('data/remoteservice/state{}'.format(i), 1, 0.001)
+                metrics.add_outgoing('data/testresource/state{}'.format(i), 1)
+            metrics.add_incoming('data/remoteservice/state0', 1, 0.001)
+            metrics.add_incoming(None, 1, 0.001)
+
+        result = metrics.get_metrics()
+        self.assertEqual(result['messages_in'], 6)
+        self.assertEqual(result['messages_in_per_topic'], {'data/remoteservice/state0': 2,
+                                                           'data/remoteservice/state1': 1,
+                                                           '_other': 3})
+        self.assertEqual(len(result['messages_out_per_topic']), 3)
+        self.assertEqual(result['messages_out_per_topic']['_other'], 2)
+
+    def testPayloadSize(self):
+        self.assertEqual(get_payload_size('abc'), 3)
+        self.assertEqual(get_payload_size('åäö'), 6)
+        self.assertEqual(get_payload_size(b'\x00\x01'), 2)
+
+
+class TestMetricsMockedClient(unittest.TestCase):
+
+    def testMetrics(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.metrics_interval = 60
+
+        def on_command(resource, messagetype, servicename, signalname, payload):
+            if payload == 'FAIL':
+                raise ValueError
+            return payload
+
+        resource.register_incoming_command('testcommand', on_command, echo=True)
+        resource.register_outgoing_data('teststate')
+        resource._on_connect(resource.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        resource._on_connect(resource.mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+        resource.send_data('teststate', 'åäö')
+        for payload in ['ON', 'FAIL']:
+            message = mqtt.MQTTMessage(topic=b'command/testresource/testcommand')
+            message.payload = payload.encode('utf-8')
+            resource._on_incoming_message(resource.mqttclient, None, message)
+        message = mqtt.MQTTMessage(topic=b'command/testresource/unknown')
+        message.payload = b'ON'
+        resource._on_incoming_message(resource.mqttclient, None, message)
+
+        metrics = resource.get_metrics()
+        self.assertEqual(metrics['messages_in'], 3)
+        self.assertEqual(metrics['bytes_in'], 8)
+        self.assertEqual(metrics['messages_in_per_topic'], {'command/testresource/testcommand': 2,
+                                                            sgframework.constants.STATISTICS_OTHER_TOPICS: 1})
+        self.assertEqual(metrics['messages_out_per_topic']['data/testresource/teststate'], 1)
+        self.assertEqual(metrics['messages_out_per_topic']['data/testresource/testcommand'], 1)
+        self.assertEqual(metrics['callbacks'], 2)
+        self.assertEqual(metrics['failed_callbacks'], 1)
+        self.assertEqual(metrics['reconnects'], 1)
+        self.assertEqual(metrics['dispatch_time']['count'], 3)
+        self.assertEqual(metrics['callback_time']['count'], 2)
+
+        resource._publish_statistics_if_due()
+        topic, payload = resource.mqttclient.publish.call_args[0]
+        self.assertEqual(topic, 'data/testresource/_metrics')
+        self.assertTrue(resource.mqttclient.publish.call_args[1]['retain'])
+        self.assertEqual(json.loads(payload)['messages_in'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
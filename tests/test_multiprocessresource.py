@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_multiprocessresource
+----------------------------------
+
+Tests for the multi-process resource of the sgframework.
+
+"""
+import queue
+import signal
+import sys
+import threading
+import time
+import unittest
+import unittest.mock
+
+import paho.mqtt.client as mqtt
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import sgframework
+from sgframework.exceptions import PublishQueueFullException
+from sgframework.loopbackbroker import LoopbackBroker
+from sgframework.multiprocessresource import Worker, _run_worker
+from sgframework.publishqueue import Outgoingmessage
+
+
+def make_mqttclient(*args, **kwargs):
+    """Mocked MQTT client, that connects when the network loop is started."""
+    mqttclient = unittest.mock.Mock()
+    mids = iter(range(1, 10000))
+    mqttclient.publish.side_effect = lambda *args, **kwargs: unittest.mock.Mock(rc=0, mid=next(mids))
+    mqttclient.subscribe.return_value = (mqtt.MQTT_ERR_SUCCESS, 10000)
+    mqttclient.loop_start.side_effect = lambda: mqttclient.on_connect(mqttclient, None, {}, mqtt.CONNACK_ACCEPTED)
+    return mqttclient
+
+
+def make_resource_with_fake_workers(number_of_workers, queuesize=100):
+    """Resource that appears to be connected, with queues instead of worker processes."""
+    resource = sgframework.MultiprocessResource('testresource', 'localhost')
+    resource.worker_processes = number_of_workers
+    resource.mqttclient = make_mqttclient()
+    resource._set_broker_connectionstatus(True)
+    for index in range(number_of_workers):
+        name = 'testresource-{}'.format(index + 1)
+        resource._workers.append(Worker(name,
+                                        unittest.mock.Mock(**{'is_alive.return_value': True}),
+                                        queue.Queue(queuesize),
+                                        threading.Event()))
+        resource._worker_statistics[name] = {'batches': 0, 'messages': 0, 'dropped': 0}
+    return resource
+
+
+def get_queued_messages(worker):
+    result = []
+    while not worker.messagequeue.empty():
+        messages, force = worker.messagequeue.get()
+        result.extend(messages)
+    return result
+
+
+class TestMultiprocessResource(unittest.TestCase):
+
+    def testConstructor(self):
+        resource = sgframework.MultiprocessResource('testresource', 'localhost')
+        self.assertEqual(resource.worker_processes, sgframework.constants.DEFAULT_WORKER_PROCESSES)
+        self.assertIn("SG MultiprocessResource: 'testresource'", repr(resource))
+
+    def testWrongStartInput(self):
+        resource = sgframework.MultiprocessResource('testresource', 'localhost')
+        resource.worker_processes = 0
+        self.assertRaises(ValueError, resource.start)
+        resource.worker_processes = 2
+        resource.connection_pool_size = 2
+        self.assertRaises(ValueError, resource.start, use_threaded_networking=True)
+
+    def testSharding(self):
+        resource = make_resource_with_fake_workers(3)
+        signalnames = ['signal{}'.format(i) for i in range(12)]
+        for signalname in signalnames:
+            resource.register_outgoing_data(signalname)
+        resource.register_incoming_command('testcommand', lambda *args: None, echo=True)
+
+        resource.send_data_many([(signalname, 1) for signalname in signalnames])
+        resource.send_data('signal5', 2)
+        resource.send_data_many([('signal5', 3)])
+        resource.send_command('otherservice', 'othercommand', 4)
+
+        queued = [get_queued_messages(worker) for worker in resource._workers]
+        self.assertTrue(all(queued))
+        self.assertEqual(sorted(message.topic for message in sum(queued, []) if message.payload == '1'),
+                         sorted('data/testresource/' + signalname for signalname in signalnames))
+        owner = queued[resource._get_worker_index('data/testresource/signal5')]
+        self.assertEqual([message.payload for message in owner if message.topic == 'data/testresource/signal5'],
+                         ['1', '2', '3'])
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('command/otherservice/othercommand', '4'))
+
+        statistics = resource.get_worker_statistics()
+        self.assertEqual(sum(item['messages'] for item in statistics), 14)
+        self.assertEqual([item['name'] for item in statistics],
+                         ['testresource-1', 'testresource-2', 'testresource-3'])
+
+        # Echoes are published by the resource itself
+        message = mqtt.MQTTMessage(topic=b'command/testresource/testcommand')
+        message.payload = b'5'
+        resource._on_incoming_message(resource.mqttclient, None, message)
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/testcommand', '5'))
+
+    def testWorkerQueueFull(self):
+        resource = make_resource_with_fake_workers(1, queuesize=1)
+        resource.register_outgoing_data('teststate')
+        resource.publishqueue_policy = 'raise'
+        resource.send_data('teststate', 1)
+        self.assertRaises(PublishQueueFullException, resource.send_data, 'teststate', 2)
+
+        resource.publishqueue_policy = 'drop_newest'
+        resource.send_data('teststate', 3)
+        statistics = resource.get_worker_statistics()[0]
+        self.assertEqual(statistics['messages'], 1)
+        self.assertEqual(statistics['dropped'], 1)
+
+    def testDeadWorker(self):
+        resource = make_resource_with_fake_workers(1, queuesize=1)
+        resource.register_outgoing_data('teststate')
+        resource._workers[0].process.is_alive.return_value = False
+        resource._publish_many([Outgoingmessage('data/testresource/teststate', '1', 1, False)], force=True)
+        resource._publish_many([Outgoingmessage('data/testresource/teststate', '2', 1, False)], force=True)
+        self.assertEqual(resource.get_worker_statistics()[0]['dropped'], 2)
+
+    def testForcedPutTimeout(self):
+        resource = make_resource_with_fake_workers(1, queuesize=1)
+        resource.register_outgoing_data('teststate')
+        resource.publishqueue_timeout = None
+        resource.send_data('teststate', 1)
+        with unittest.mock.patch('sgframework.constants.WORKER_FORCED_PUT_TIMEOUT', 0.01):
+            resource._publish_many([Outgoingmessage('data/testresource/teststate', '2', 1, False)], force=True)
+        self.assertEqual(resource.get_worker_statistics()[0]['dropped'], 1)
+
+    def testRunWorker(self):
+        mqttclients = []
+
+        def make_and_store_mqttclient(*args, **kwargs):
+            mqttclients.append(make_mqttclient())
+            return mqttclients[-1]
+
+        messagequeue = queue.Queue()
+        messagequeue.put(([Outgoingmessage('data/testresource/teststate', '1', 1, False),
+                           Outgoingmessage('data/testresource/teststate', '2', 1, False)], False))
+        messagequeue.put((None, 0))
+        ready_event = threading.Event()
+        outputsignals = [('data', 'testresource', 'teststate', False, 'all', 30)]
+        previous_handler = signal.getsignal(signal.SIGINT)
+        try:
+            with unittest.mock.patch('paho.mqtt.client.Client', side_effect=make_and_store_mqttclient):
+                _run_worker('testresource-1', 'localhost', 1883, None, {'qos': 1}, outputsignals, True,
+                            messagequeue, ready_event)
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+
+        self.assertTrue(ready_event.is_set())
+        self.assertEqual(len(mqttclients), 1)
+        self.assertEqual([call[0] for call in mqttclients[0].publish.call_args_list],
+                         [('data/testresource/teststate', '1'), ('data/testresource/teststate', '2')])
+        mqttclients[0].disconnect.assert_called_once_with()
+
+
+class TestMultiprocessResourceWithLoopbackBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = LoopbackBroker()
+        self.broker.start()
+
+    def tearDown(self):
+        self.broker.stop()
+
+    def testPublishFromWorkers(self):
+        received = []
+        subscriber = mqtt.Client('subscriber')
+        subscriber.on_message = lambda mqttclient, userdata, message: received.append(
+            (message.topic, message.payload))
+        subscriber.connect(self.broker.host, self.broker.port)
+        subscriber.subscribe('data/testresource/#')
+        subscriber.loop_start()
+
+        resource = sgframework.MultiprocessResource('testresource', self.broker.host, port=self.broker.port)
+        signalnames = ['signal{}'.format(i) for i in range(6)]
+        for signalname in signalnames:
+            resource.register_outgoing_data(signalname)
+        try:
+            self.assertTrue(resource.start(use_threaded_networking=True, timeout=10))
+            for i in range(3):
+                resource.send_data_many([(signalname, i) for signalname in signalnames])
+            deadline = time.monotonic() + 10
+            while len(received) < 18 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            statistics = resource.get_worker_statistics()
+        finally:
+            resource.stop()
+            subscriber.disconnect()
+            subscriber.loop_stop()
+
+        self.assertTrue(all(item['alive'] and item['ready'] for item in statistics))
+        self.assertTrue(all(item['messages'] for item in statistics))
+        for signalname in signalnames:
+            self.assertEqual([payload for topic, payload in received if topic == 'data/testresource/' + signalname],
+                             [b'0', b'1', b'2'])
+        deadline = time.monotonic() + 10
+        while self.broker.get_client_ids() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.broker.get_client_ids(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
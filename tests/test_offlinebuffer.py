@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_offlinebuffer
+----------------------------------
+
+Tests for the offline store-and-forward buffer of the sgframework.
+
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+from sgframework.offlinebuffer import OfflineBuffer
+from sgframework.publishqueue import Outgoingmessage
+
+try:
+    from test_framework_resource import make_resource_with_mocked_mqttclient
+except ImportError:
+    from .test_framework_resource import make_resource_with_mocked_mqttclient
+
+
+def make_message(signalname, payload):
+    return Outgoingmessage('data/testresource/' + signalname, payload, 1, False)
+
+
+def get_payloads(messages):
+    return [message.payload for message in messages]
+
+
+class TestOfflineBuffer(unittest.TestCase):
+
+    def testConstructor(self):
+        buffer = OfflineBuffer(10, 100)
+        self.assertEqual(len(buffer), 0)
+        self.assertIn("0 of max 10 messages, 0 of max 100 bytes (memory)", repr(buffer))
+
+    def testWrongConstructorInput(self):
+        self.assertRaises(ValueError, OfflineBuffer, 0, 100)
+        self.assertRaises(ValueError, OfflineBuffer, 10, 0)
+
+    def testOrder(self):
+        buffer = OfflineBuffer(10, 100)
+        for i in range(5):
+            buffer.put(make_message('a', str(i)))
+        buffer.put(make_message('b', b'\x00\x01'))
+        self.assertEqual(get_payloads(buffer.take(3)), ['0', '1', '2'])
+        self.assertEqual(get_payloads(buffer.take(10)), ['3', '4', b'\x00\x01'])
+        self.assertEqual(buffer.take(10), [])
+
+    def testLatestPolicy(self):
+        buffer = OfflineBuffer(10, 100)
+        buffer.put(make_message('a', '1'), 'latest')
+        buffer.put(make_message('b', '2'), 'all')
+        buffer.put(make_message('b', '3'), 'all')
+        buffer.put(make_message('a', '4'), 'latest')
+        self.assertEqual(get_payloads(buffer.take(10)), ['2', '3', '4'])
+        self.assertEqual(buffer.get_statistics()['replaced'], 1)
+
+    def testMessageLimit(self):
+        buffer = OfflineBuffer(3, 100)
+        for i in range(5):
+            buffer.put(make_message('a', str(i)))
+        self.assertEqual(get_payloads(buffer.take(10)), ['2', '3', '4'])
+        self.assertEqual(buffer.get_statistics()['dropped'], 2)
+
+    def testByteLimit(self):
+        buffer = OfflineBuffer(100, 10)
+        for payload in ['aaaa', 'bbbb', 'cccc', 'dd', 'eeeeeeeeeee']:
+            buffer.put(make_message('a', payload))
+        statistics = buffer.get_statistics()
+        self.assertEqual(statistics['bytes'], 6)
+        self.assertEqual(statistics['dropped'], 3)
+        self.assertEqual(get_payloads(buffer.take(10)), ['cccc', 'dd'])
+
+    def testWrapAround(self):
+        buffer = OfflineBuffer(100, 10)
+        for i in range(0, 40, 2):
+            buffer.put(make_message('a', '{:03d}'.format(i)))
+            buffer.put(make_message('a', '{:03d}'.format(i + 1)))
+            self.assertEqual(get_payloads(buffer.take(1)), ['{:03d}'.format(i)])
+            buffer.put(make_message('a', 'x'))
+            self.assertEqual(get_payloads(buffer.take(2)), ['{:03d}'.format(i + 1), 'x'])
+        self.assertEqual(buffer.get_statistics()['dropped'], 0)
+
+    def testMemoryMappedFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'offline.bin')
+            buffer = OfflineBuffer(10, 100, filename)
+            self.assertEqual(os.path.getsize(filename), 100)
+            buffer.put(make_message('a', 'Hello'))
+            buffer.put(make_message('a', 'World'))
+            self.assertEqual(get_payloads(buffer.take(10)), ['Hello', 'World'])
+            buffer.close()
+
+
+class TestOfflineBufferMockedClient(unittest.TestCase):
+
+    def testOfflineBuffer(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._offlinebuffer = OfflineBuffer(100, 1000)
+        resource._publishqueue.maxsize = 2
+        resource._publishqueue.max_inflight = 0
+        resource.register_outgoing_data('teststate')
+        resource.register_outgoing_data('otherstate', offline_policy='latest')
+        self.assertRaises(ValueError, resource.register_outgoing_data, 'wrongstate', offline_policy='hatt')
+
+        resource._set_broker_connectionstatus(False)
+        for i in range(3):
+            resource.send_data('teststate', i)
+            resource.send_data('otherstate', i)
+        self.assertEqual(resource.mqttclient.publish.call_count, 0)
+        self.assertEqual(resource.get_offlinebuffer_statistics()['depth'], 4)
+
+        resource._set_broker_connectionstatus(True)
+        resource._replay_offlinebuffer()
+        resource.send_data('teststate', 10)  # Stored after the earlier messages
+        resource._flush_publishqueue()
+        resource._on_publish(resource.mqttclient, None, 1)
+        resource._on_publish(resource.mqttclient, None, 2)
+        payloads = [call[0][:2] for call in resource.mqttclient.publish.call_args_list]
+        self.assertEqual(payloads, [('data/testresource/teststate', '0'),
+                                    ('data/testresource/teststate', '1'),
+                                    ('data/testresource/teststate', '2'),
+                                    ('data/testresource/otherstate', '2'),
+                                    ('data/testresource/teststate', '10')])
+        self.assertEqual(resource.get_offlinebuffer_statistics()['depth'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
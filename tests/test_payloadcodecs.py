@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_payloadcodecs
+----------------------------------
+
+Tests for the payload codecs of the sgframework.
+
+"""
+import sys
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import paho.mqtt.client as mqtt
+
+from sgframework import payloadcodecs
+
+try:
+    from test_framework_resource import make_resource_with_mocked_mqttclient
+except ImportError:
+    from .test_framework_resource import make_resource_with_mocked_mqttclient
+
+
+class TestTextCodec(unittest.TestCase):
+
+    def testEncodeDecode(self):
+        codec = payloadcodecs.TextCodec()
+        self.assertEqual(codec.encode(12.5), '12.5')
+        self.assertEqual(codec.decode(b' 12.5 \n'), '12.5')
+        self.assertEqual(codec.decode('åäö'.encode('utf-8')), 'åäö')
+
+
+class TestStructCodec(unittest.TestCase):
+
+    def testSingleValue(self):
+        codec = payloadcodecs.StructCodec('<d')
+        payload = codec.encode(12.5)
+        self.assertEqual(payload, b'\x00\x00\x00\x00\x00\x00)@')
+        self.assertEqual(codec.decode(payload), 12.5)
+
+    def testSeveralValues(self):
+        codec = payloadcodecs.StructCodec('<hhB')
+        payload = codec.encode((-1, 2, 255))
+        self.assertEqual(len(payload), 5)
+        self.assertEqual(codec.decode(payload), (-1, 2, 255))
+
+    def testWrongInput(self):
+        self.assertRaises(ValueError, payloadcodecs.StructCodec, '<q?x#')
+        codec = payloadcodecs.StructCodec('<H')
+        self.assertRaises(Exception, codec.encode, -1)
+        self.assertRaises(Exception, codec.decode, b'\x00\x00\x00')
+
+    def testRepr(self):
+        self.assertEqual(repr(payloadcodecs.StructCodec('<d')), "StructCodec('<d')")
+
+
+@unittest.skipIf(payloadcodecs.cbor2 is None, "The cbor2 package is not installed")
+class TestCborCodec(unittest.TestCase):
+
+    def testEncodeDecode(self):
+        codec = payloadcodecs.CborCodec()
+        value = {'speed': 12.5, 'gears': [1, 2, 3], 'name': 'åäö'}
+        self.assertEqual(codec.decode(codec.encode(value)), value)
+
+
+@unittest.skipIf(payloadcodecs.msgpack is None, "The msgpack package is not installed")
+class TestMessagePackCodec(unittest.TestCase):
+
+    def testEncodeDecode(self):
+        codec = payloadcodecs.MessagePackCodec()
+        value = {'speed': 12.5, 'gears': [1, 2, 3], 'name': 'åäö'}
+        self.assertEqual(codec.decode(codec.encode(value)), value)
+
+
+class TestPayloadCodecMockedClient(unittest.TestCase):
+
+    def testPayloadCodec(self):
+        resource = make_resource_with_mocked_mqttclient()
+        received = []
+
+        def on_command(resource, messagetype, servicename, signalname, payload):
+            received.append(payload)
+            return payload * 2
+
+        resource.register_outgoing_data('teststate', defaultvalue=1.5, codec=payloadcodecs.StructCodec('<d'))
+        resource.register_incoming_command('testcommand', on_command, echo=True,
+                                           codec=payloadcodecs.StructCodec('<h'))
+        resource._publish_capablities_and_defaultvalues()
+        resource.send_data('teststate', 2.5)
+
+        for payload in [b'\x03\x00', b'\x03']:  # The last one is malformed
+            message = mqtt.MQTTMessage(topic=b'command/testresource/testcommand')
+            message.payload = payload
+            resource._on_incoming_message(resource.mqttclient, None, message)
+
+        self.assertEqual(received, [3])
+        payloads = [call[0][:2] for call in resource.mqttclient.publish.call_args_list]
+        self.assertIn(('data/testresource/teststate', payloadcodecs.StructCodec('<d').encode(1.5)), payloads)
+        self.assertIn(('data/testresource/teststate', payloadcodecs.StructCodec('<d').encode(2.5)), payloads)
+        self.assertEqual(payloads[-1], ('data/testresource/testcommand', b'\x06\x00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
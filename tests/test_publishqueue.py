@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_publishqueue
+----------------------------------
+
+Tests for the outgoing publish queue of the sgframework.
+
+"""
+import json
+import sys
+import time
+import unittest
+import unittest.mock
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+import sgframework
+from sgframework.publishqueue import ConflationBuffer, Outgoingmessage, PublishQueue
+
+try:
+    from test_framework_resource import make_resource_with_mocked_mqttclient
+except ImportError:
+    from .test_framework_resource import make_resource_with_mocked_mqttclient
+
+
+def make_message(number):
+    return Outgoingmessage('data/testresource/teststate', str(number), 1, False)
+
+
+class TestPublishQueue(unittest.TestCase):
+
+    def testConstructor(self):
+        queue = PublishQueue(10, 'drop_newest', 5)
+        self.assertEqual(len(queue), 0)
+        self.assertIn("0 of max 10 messages queued (drop_newest), 0 of max 5 in flight", repr(queue))
+        self.assertEqual(PublishQueue().policy, 'block')  # Never drops messages by default
+
+    def testWrongConstructorInput(self):
+        self.assertRaises(ValueError, PublishQueue, 10, 'hatt', 5)
+        self.assertRaises(ValueError, PublishQueue, 0, 'block', 5)
+        self.assertRaises(ValueError, PublishQueue, 10, 'block', -1)
+
+    def testDropOldest(self):
+        queue = PublishQueue(3, 'drop_oldest', 0)
+        for i in range(5):
+            queue.put(make_message(i))
+        self.assertEqual([queue.get().payload for i in range(3)], ['2', '3', '4'])
+        statistics = queue.get_statistics()
+        self.assertEqual(statistics['dropped_oldest'], 2)
+        self.assertEqual(statistics['max_depth'], 3)
+        self.assertEqual(statistics['depth'], 0)
+
+    def testDropNewest(self):
+        queue = PublishQueue(3, 'drop_newest', 0)
+        for i in range(5):
+            queue.put(make_message(i))
+        self.assertEqual([queue.get().payload for i in range(3)], ['0', '1', '2'])
+        self.assertEqual(queue.get_statistics()['dropped_newest'], 2)
+
+    def testRaise(self):
+        queue = PublishQueue(2, 'raise', 0)
+        queue.put(make_message(1))
+        queue.put(make_message(2))
+        self.assertRaises(sgframework.exceptions.PublishQueueFullException, queue.put, make_message(3))
+        self.assertEqual(queue.get_statistics()['rejected'], 1)
+
+    def testPutMany(self):
+        queue = PublishQueue(3, 'drop_newest', 0)
+        queue.put_many([make_message(i) for i in range(2)])
+        queue.put_many([make_message(i) for i in range(2, 4)])
+        self.assertEqual([queue.get().payload for i in range(3)], ['0', '1', '2'])
+        self.assertEqual(queue.get_statistics()['dropped_newest'], 1)
+
+    def testForce(self):
+        queue = PublishQueue(1, 'raise', 0)
+        queue.put(make_message(1))
+        queue.put(make_message(2), force=True)
+        self.assertEqual(len(queue), 2)
+
+    def testBlockWithWaitfunction(self):
+        queue = PublishQueue(1, 'block', 0)
+        queue.put(make_message(1))
+        queue.put(make_message(2), wait=queue.get)
+        self.assertEqual(queue.get().payload, '2')
+        self.assertEqual(queue.get_statistics()['blocked'], 1)
+
+    def testBlockTimeout(self):
+        queue = PublishQueue(1, 'block', 0)
+        queue.put(make_message(1))
+        self.assertRaises(sgframework.exceptions.PublishQueueFullException,
+                          queue.put, make_message(2), timeout=0.01)
+
+    def testInflightWindow(self):
+        queue = PublishQueue(10, 'block', 2)
+        for i in range(4):
+            queue.put(make_message(i))
+        queue.mark_inflight(101, 1)
+        queue.mark_inflight(102, 1)
+        self.assertIsNone(queue.get())
+        self.assertIsNotNone(queue.get(ignore_inflight_limit=True))
+        queue.confirm(101)
+        self.assertEqual(queue.get().payload, '1')
+
+    def testEarlyConfirmation(self):
+        queue = PublishQueue(10, 'block', 1)
+        queue.confirm(101)
+        queue.mark_inflight(101, 0)
+        self.assertEqual(queue.get_statistics()['inflight'], 0)
+
+    def testDropLostInflight(self):
+        queue = PublishQueue(10, 'block', 0)
+        queue.mark_inflight(101, 0)
+        queue.mark_inflight(102, 1)
+        queue.drop_lost_inflight()
+        self.assertEqual(queue.get_statistics()['inflight'], 1)
+
+    def testLatencyStatistics(self):
+        queue = PublishQueue(10, 'block', 0)
+        now = time.monotonic()
+        queue.mark_inflight(101, 1, 'data/testresource/teststate', now - 0.5)
+        queue.mark_inflight(102, 0, 'data/testresource/otherstate', now - 0.003)
+        queue.confirm(101)
+        queue.confirm(102)
+        queue.confirm(103)  # Early confirmation
+        queue.mark_inflight(103, 1, 'data/testresource/teststate')
+
+        statistics = queue.get_latency_statistics()
+        self.assertEqual(statistics['per_qos'][1]['count'], 2)
+        self.assertEqual(statistics['per_qos'][0]['count'], 1)
+        self.assertGreaterEqual(statistics['per_qos'][1]['max'], 0.5)
+        self.assertEqual(statistics['per_topic']['data/testresource/teststate']['count'], 2)
+        self.assertEqual(statistics['per_topic']['data/testresource/otherstate']['buckets'][2], [0.005, 1])
+        self.assertEqual(queue.get_statistics()['confirmed'], 3)
+
+    def testLatencyStatisticsMaxTopics(self):
+        queue = PublishQueue(10, 'block', 0)
+        with unittest.mock.patch('sgframework.constants.MAX_STATISTICS_TOPICS', 2):
+            for mid in range(1, 5):
+                queue.mark_inflight(mid, 1, 'data/testresource/state{}'.format(mid))
+                queue.confirm(mid)
+        statistics = queue.get_latency_statistics()
+        self.assertEqual(sorted(statistics['per_topic']),
+                         ['_other', 'data/testresource/state1', 'data/testresource/state2'])
+        self.assertEqual(statistics['per_topic']['_other']['count'], 2)
+        self.assertEqual(statistics['per_qos'][1]['count'], 4)
+
+
+
+class TestConflationBuffer(unittest.TestCase):
+
+    def testLatestValueWins(self):
+        buffer = ConflationBuffer()
+        for i in range(3):
+            buffer.put(Outgoingmessage('data/testresource/a', str(i), 1, False))
+            buffer.put(Outgoingmessage('data/testresource/b', str(i), 1, False))
+        self.assertEqual(len(buffer), 2)
+        self.assertIn("2 topics pending, 4 messages conflated", repr(buffer))
+        messages = buffer.take_all()
+        self.assertEqual([(message.topic, message.payload) for message in messages],
+                         [('data/testresource/a', '2'), ('data/testresource/b', '2')])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.get_statistics(),
+                         {'depth': 0, 'max_depth': 2, 'put': 6, 'conflated': 4, 'taken': 2})
+
+    def testTakeAllEmpty(self):
+        buffer = ConflationBuffer()
+        self.assertEqual(buffer.take_all(), [])
+
+
+class TestPublishQueueMockedClient(unittest.TestCase):
+
+    def testInflightWindow(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._publishqueue.max_inflight = 2
+        resource.register_outgoing_data('teststate')
+        for i in range(5):
+            resource.send_data('teststate', i)
+        self.assertEqual(resource.mqttclient.publish.call_count, 2)
+        self.assertEqual(resource.get_publishqueue_statistics()['depth'], 3)
+
+        resource._on_publish(resource.mqttclient, None, 1)
+        self.assertEqual(resource.mqttclient.publish.call_count, 3)
+        self.assertEqual(resource.mqttclient.publish.call_args[0], ('data/testresource/teststate', '2'))
+
+    def testNotConnected(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._set_broker_connectionstatus(False)
+        resource.send_command('remoteservice', 'remotestate', 'RUN')
+        self.assertEqual(resource.mqttclient.publish.call_count, 0)
+        self.assertEqual(resource.get_publishqueue_statistics()['depth'], 1)
+
+    def testBlockingFromCallback(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._set_broker_connectionstatus(False)
+        resource._publishqueue.maxsize = 1
+        resource._publishqueue.policy = 'block'
+        resource.send_command('remoteservice', 'remotestate', 'RUN')
+        resource._is_looping = True
+        with self.assertRaises(sgframework.exceptions.PublishQueueFullException):
+            resource.send_command('remoteservice', 'remotestate', 'RUN AGAIN')
+
+    def testBlockingWhenDisconnected(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource._set_broker_connectionstatus(False)
+        resource._publishqueue.maxsize = 1
+        resource._publishqueue.policy = 'block'
+        resource.publishqueue_timeout = None
+        resource.send_command('remoteservice', 'remotestate', 'RUN')
+        with unittest.mock.patch.object(resource, 'loop') as loop:
+            with self.assertRaises(sgframework.exceptions.PublishQueueFullException):
+                resource.send_command('remoteservice', 'remotestate', 'RUN AGAIN')
+        self.assertEqual(loop.call_count, 0)
+        self.assertEqual(resource.get_publishqueue_statistics()['rejected'], 1)
+
+    def testPublishLatency(self):
+        resource = make_resource_with_mocked_mqttclient()
+        resource.publishlatency_interval = 60
+        resource.register_outgoing_data('teststate')
+        resource.send_data('teststate', 1)
+        resource._on_publish(resource.mqttclient, None, 1)
+        resource._publish_statistics_if_due()
+
+        statistics = resource.get_publishlatency_statistics()
+        self.assertEqual(statistics['per_qos'][1]['count'], 1)
+        self.assertEqual(statistics['per_topic']['data/testresource/teststate']['count'], 1)
+
+        topic, payload = resource.mqttclient.publish.call_args[0]
+        self.assertEqual(topic, 'data/testresource/_publishlatency')
+        self.assertEqual(json.loads(payload)['per_qos']['1']['count'], 1)
+
+        resource.send_data('teststate', 2)
+        resource._on_publish(resource.mqttclient, None, 3)
+        resource._publish_statistics_if_due()  # Not yet time for new statistics
+        self.assertEqual(resource.mqttclient.publish.call_count, 3)
+
+
+if __name__ == '__main__':
+
+            # Run all tests #
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test_topictrie
+----------------------------------
+
+Tests for the MQTT topic filter storage of the sgframework.
+
+"""
+import sys
+import unittest
+
+assert sys.version_info >= (3, 3, 0), "Python version 3.3 or later required!"
+
+from sgframework.topictrie import TopicTrie, is_wildcard_topicfilter, validate_topicfilter
+
+
+class TestTopicfilterFunctions(unittest.TestCase):
+
+    def testIsWildcardTopicfilter(self):
+        self.assertTrue(is_wildcard_topicfilter('data/+/temperature'))
+        self.assertTrue(is_wildcard_topicfilter('data/#'))
+        self.assertFalse(is_wildcard_topicfilter('data/climateservice/temperature'))
+
+    def testValidateTopicfilter(self):
+        validate_topicfilter('data/+/temperature')
+        validate_topicfilter('data/climateservice/#')
+        validate_topicfilter('#')
+        self.assertRaises(ValueError, validate_topicfilter, 'data/#/temperature')
+        self.assertRaises(ValueError, validate_topicfilter, 'data/climate#')
+        self.assertRaises(ValueError, validate_topicfilter, 'data/climate+/temperature')
+
+
+class TestTopicTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = TopicTrie()
+        for topicfilter in ['data/climateservice/temperature',
+                            'data/+/temperature',
+                            'data/climateservice/#',
+                            'data/#',
+                            '+/+/presence',
+                            '#']:
+            self.trie.insert(topicfilter, topicfilter)
+
+    def testLen(self):
+        self.assertEqual(len(self.trie), 6)
+        self.trie.insert('data/+/temperature', 'replaced')
+        self.assertEqual(len(self.trie), 6)
+        self.assertIn('data/+/temperature', self.trie)
+        self.assertNotIn('data/+', self.trie)
+
+    def testMatch(self):
+        self.assertEqual(sorted(self.trie.match('data/climateservice/temperature')),
+                         sorted(['data/climateservice/temperature', 'data/+/temperature',
+                                 'data/climateservice/#', 'data/#', '#']))
+        self.assertEqual(sorted(self.trie.match('resourceavailable/canadapter/presence')),
+                         sorted(['+/+/presence', '#']))
+        self.assertEqual(sorted(self.trie.match('data/climateservice')),
+                         sorted(['data/climateservice/#', 'data/#', '#']))
+        self.assertEqual(self.trie.match('$SYS/broker/uptime'), [])
+
+    def testGet(self):
+        self.assertEqual(self.trie.get('data/+/temperature'), 'data/+/temperature')
+        self.assertIsNone(self.trie.get('data/climateservice'))
+        self.assertEqual(self.trie.get('data/nonexisting/topic', 'default'), 'default')
+
+    def testRemove(self):
+        self.assertEqual(self.trie.remove('data/climateservice/#'), 'data/climateservice/#')
+        self.assertEqual(len(self.trie), 5)
+        self.assertNotIn('data/climateservice/#', self.trie.match('data/climateservice/temperature'))
+        self.assertRaises(KeyError, self.trie.remove, 'data/climateservice/#')
+        self.assertRaises(KeyError, self.trie.remove, 'data/nonexisting/topic')
+
+    def testManyTopicfilters(self):
+        trie = TopicTrie()
+        for i in range(10000):
+            trie.insert('data/service{}/+'.format(i), i)
+        self.assertEqual(trie.match('data/service1234/temperature'), [1234])
+
+
+if __name__ == '__main__':
+
+            # Run all tests #
+    unittest.main(verbosity=2)